@@ -6,6 +6,7 @@ Usage: python activate_license.py <email> [webhook_secret]
 
 import sys
 import os
+import time
 import requests
 import hmac
 import hashlib
@@ -13,6 +14,7 @@ import json
 
 # Configuration
 SERVER_URL = "http://localhost:8080"
+ACTIVATION_TIMEOUT = 30  # Seconds to wait for the server's webhook workers
 
 # Try to read WEBHOOK_SECRET from server's .env file
 def get_webhook_secret():
@@ -37,6 +39,16 @@ def get_webhook_secret():
     # Default fallback
     return "change-me-secret-key-here"
 
+def wait_for_activation(email, timeout=ACTIVATION_TIMEOUT):
+    """Poll until the email's license is active (the webhook is processed in the background)"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = requests.post(f"{SERVER_URL}/check-trial-eligibility", json={"email": email}, timeout=10)
+        if response.status_code == 200 and response.json().get('has_active'):
+            return True
+        time.sleep(0.5)
+    return False
+
 def activate_license(email, webhook_secret=None):
     """Activate license for given email via webhook"""
     
@@ -73,10 +85,13 @@ def activate_license(email, webhook_secret=None):
         print(f"\nStatus Code: {response.status_code}")
         print(f"Response: {json.dumps(response.json(), indent=2)}")
         
-        if response.status_code == 200:
+        if response.status_code not in (200, 202):
+            print("\n[ERROR] Activation failed")
+        elif wait_for_activation(email):
             print("\n[SUCCESS] License activated successfully!")
         else:
-            print("\n[ERROR] Activation failed")
+            print(f"\n[ERROR] Payment accepted, but the license was not active after {ACTIVATION_TIMEOUT}s")
+            print("Check the server log and `python webhooks.py status`")
             
     except requests.exceptions.ConnectionError:
         print(f"\n[ERROR] Cannot connect to server at {SERVER_URL}")
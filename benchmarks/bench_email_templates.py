@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Benchmark: render activation emails from the precompiled templates.
+
+Usage:
+    python benchmarks/bench_email_templates.py [--count 10000] [--locale en]
+"""
+
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server'))
+
+import emails  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Email template rendering benchmark')
+    parser.add_argument('--count', type=int, default=10000, help='Emails to render')
+    parser.add_argument('--locale', default='en')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    catalog = emails.EmailTemplates()
+    compile_time = time.perf_counter() - start
+
+    activated = datetime.now()
+    expires = activated + timedelta(days=365)
+    size = 0
+    start = time.perf_counter()
+    for i in range(args.count):
+        subject, text, html = catalog.render(
+            'activation', args.locale,
+            name=f'Customer {i}',
+            license_key=f'ES-{i:032X}',
+            device_type='organization' if i % 5 == 0 else 'individual',
+            activation_date=activated.strftime('%B %d, %Y'),
+            expiry_date=expires.strftime('%B %d, %Y'),
+            transaction_id=f'pay_{i}',
+            amount=99.99,
+            shop_url='https://adulsportfolio.vercel.app/shop',
+        )
+        size += len(subject) + len(text) + len(html)
+    elapsed = time.perf_counter() - start
+
+    print(f"Compiled {len(catalog.locales)} locale(s) in {compile_time * 1000:.1f} ms")
+    print(f"Rendered {args.count} emails in {elapsed:.3f}s "
+          f"({args.count / elapsed:,.0f}/s, {elapsed / args.count * 1e6:.1f} us each, {size / args.count / 1024:.1f} KiB avg)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
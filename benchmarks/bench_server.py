@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Benchmark: license server throughput and latency on synthetic license DBs.
+
+Seeds a license DB of the requested size (1k, 100k, 1M, ...) for a storage
+backend, then drives /verify, /register, /check-trial-eligibility and
+/webhook/payment at a given concurrency and reports requests/s and p50/p99
+latency per endpoint. Requests go through Flask's test client in this process,
+or with --url to a server started on a seeded data directory.
+
+Results can be saved as a baseline (benchmarks/baseline.json) and later runs
+compared against it, e.g. before and after a storage change.
+
+Usage:
+    python benchmarks/bench_server.py run [--sizes 1k,100k] [--backends json,sqlite]
+                                          [--concurrency 8] [--requests 2000]
+                                          [--scenarios verify,register,trial,webhook]
+                                          [--save-baseline] [--baseline benchmarks/baseline.json]
+    python benchmarks/bench_server.py seed --size 100k --backend sqlite --data-dir /tmp/es-100k
+    # against a real server on that data directory (same WEBHOOK_SECRET):
+    ES_DATA_DIR=/tmp/es-100k ES_STORAGE_BACKEND=sqlite WEBHOOK_SECRET=bench-secret gunicorn ...
+    python benchmarks/bench_server.py run --sizes 100k --backends sqlite --url http://localhost:8080
+"""
+
+import os
+import sys
+import hmac
+import json
+import time
+import shutil
+import hashlib
+import platform
+import argparse
+import tempfile
+import contextlib
+import threading
+import subprocess
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_DIR = os.path.join(ROOT, 'server')
+sys.path.insert(0, SERVER_DIR)
+
+SCENARIOS = ('verify', 'register', 'trial', 'webhook')
+WEBHOOK_SECRET = 'bench-secret'
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+DEFAULT_CACHE = os.path.join(ROOT, 'benchmarks', '.data')
+
+
+def parse_size(text):
+    """'1k' -> 1000, '1M' -> 1000000"""
+    text = text.strip()
+    multiplier = {'k': 1000, 'K': 1000, 'm': 1000000, 'M': 1000000}.get(text[-1], 1)
+    return int(float(text.rstrip('kKmM')) * multiplier)
+
+
+# ------------------------------------------------------------------- seeding
+#
+# Licenses are derived from their index, so a run against a server started on
+# a seeded directory knows the keys, emails and devices without reading the DB.
+# Index i % 10: 0-6 active (with one device), 7-8 pending payment, 9 expired.
+
+def bench_key(i):
+    return f"ES-BENCH{i:024d}"
+
+
+def bench_email(i):
+    return f"user{i}@bench.example"
+
+
+def bench_device(i):
+    return f"bench-device-{i}"
+
+
+def bench_entry(i, now):
+    kind = i % 10
+    created = now - timedelta(days=400 - i % 365)
+    entry = {
+        'key': bench_key(i),
+        'email': bench_email(i),
+        'name': f"Bench User {i}",
+        'active': kind not in (7, 8),
+        'created': created.isoformat(),
+        'expires': None,
+        'device_type': 'organization' if i % 50 == 0 else 'individual',
+        'device_limit': 999999 if i % 50 == 0 else 2,
+        'devices': [],
+        'payment_status': 'pending' if kind in (7, 8) else 'completed',
+        'trial_used': True,
+        'locale': 'en',
+    }
+    if entry['active']:
+        activated = created + timedelta(days=1)
+        expires = (now - timedelta(days=1)) if kind == 9 else (now + timedelta(days=365))
+        entry.update(activated=activated.isoformat(), expires=expires.isoformat(),
+                     devices=[bench_device(i)], payment_amount=99.99, transaction_id=f"pay_bench_{i}")
+    return entry
+
+
+def seed(data_dir, size, backend):
+    """Write a synthetic license DB of `size` entries into data_dir"""
+    from storage import migrate_json_to_sqlite
+
+    os.makedirs(data_dir, exist_ok=True)
+    json_path = os.path.join(data_dir, 'license_db.json')
+    now = datetime.now()
+    start = time.perf_counter()
+    with open(json_path, 'w') as f:
+        # Streamed, so seeding 1M entries doesn't need them all in memory
+        f.write('{')
+        for i in range(size):
+            entry = bench_entry(i, now)
+            f.write(('' if i == 0 else ',\n') + json.dumps(entry['key']) + ': ' + json.dumps(entry))
+        f.write('}\n')
+    if backend == 'sqlite':
+        migrate_json_to_sqlite(json_path, os.path.join(data_dir, 'license_db.sqlite3'))
+        os.remove(json_path)
+    with open(os.path.join(data_dir, 'bench_seed.json'), 'w') as f:
+        json.dump({'size': size, 'backend': backend, 'seeded': now.isoformat()}, f)
+    print(f"Seeded {size:,} licenses ({backend}) in {time.perf_counter() - start:.1f}s -> {data_dir}")
+
+
+def seeded_copy(cache_dir, size, backend):
+    """A fresh working copy of a cached seeded DB (runs modify the DB)"""
+    source = os.path.join(cache_dir, f"{backend}-{size}")
+    if not os.path.exists(os.path.join(source, 'bench_seed.json')):
+        shutil.rmtree(source, ignore_errors=True)
+        seed(source, size, backend)
+    work_dir = tempfile.mkdtemp(prefix=f'es-bench-{backend}-{size}-')
+    shutil.rmtree(work_dir)
+    shutil.copytree(source, work_dir)
+    return work_dir
+
+
+# ------------------------------------------------------------------- driving
+
+class TestClientTarget:
+    """Sends requests through Flask's test client of an in-process server"""
+
+    def __init__(self, data_dir, backend):
+        os.environ.update({
+            'ES_DATA_DIR': data_dir,
+            'ES_STORAGE_BACKEND': backend,
+            'WEBHOOK_SECRET': WEBHOOK_SECRET,
+            'SMTP_USER': '',
+            'SMTP_PASSWORD': '',
+        })
+        import license_server
+        self.server = license_server
+        self._local = threading.local()
+
+    def post(self, path, body, headers=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.server.app.test_client()
+        response = client.post(path, data=body, content_type='application/json', headers=headers or {})
+        return response.status_code
+
+    def wait_for_webhooks(self, timeout=300):
+        """Seconds until the background webhook workers emptied the queue"""
+        start = time.perf_counter()
+        queue = self.server.webhook_queue
+        while queue.status()['queued'] and time.perf_counter() - start < timeout:
+            queue.drain()
+        return time.perf_counter() - start
+
+
+class HTTPTarget:
+    """Sends requests to a running server, one keep-alive session per thread"""
+
+    def __init__(self, url):
+        import requests
+        self.url = url.rstrip('/')
+        self._requests = requests
+        self._local = threading.local()
+
+    def post(self, path, body, headers=None):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+        return session.post(self.url + path, data=body, headers=headers, timeout=60).status_code
+
+    def wait_for_webhooks(self, timeout=300):
+        return None  # The server's queue depth is on /admin/webhooks
+
+
+def scenario_requests(name, size, count, run_id):
+    """(path, body, headers, expected statuses) for each request of a scenario"""
+    indices = range(size)
+    if name == 'verify':
+        active = [i for i in indices if i % 10 < 7]
+        for n in range(count):
+            i = active[(n * 7919) % len(active)]
+            yield '/verify', json.dumps({'key': bench_key(i), 'device_fingerprint': bench_device(i)}), None, (200,)
+    elif name == 'register':
+        for n in range(count):
+            body = json.dumps({'email': f"new{run_id}-{n}@bench.example", 'name': f"New {n}"})
+            yield '/register', body, None, (200,)
+    elif name == 'trial':
+        for n in range(count):
+            # Alternate registered and never-seen emails
+            email = bench_email((n * 7919) % size) if n % 2 else f"fresh{run_id}-{n}@bench.example"
+            yield '/check-trial-eligibility', json.dumps({'email': email}), None, (200,)
+    elif name == 'webhook':
+        pending = [i for i in indices if i % 10 in (7, 8)]
+        for n in range(min(count, len(pending))):
+            i = pending[n]
+            body = json.dumps({'status': 'paid', 'email': bench_email(i), 'id': f"pay_{run_id}_{n}", 'amount': 99.99})
+            signature = hmac.new(WEBHOOK_SECRET.encode(), body.encode(), hashlib.sha256).hexdigest()
+            yield '/webhook/payment', body, {'X-Webhook-Signature': signature}, (200, 202)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+def drive(target, requests_, concurrency):
+    """Send requests with `concurrency` threads; returns the scenario's results"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def send(request):
+        nonlocal errors
+        path, body, headers, expected = request
+        start = time.perf_counter()
+        try:
+            ok = target.post(path, body, headers) in expected
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(send, requests_))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / wall, 1) if wall else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def run_one(args, size, backend):
+    """Benchmark one (size, backend) combination in this process"""
+    work_dir = None
+    if args.url:
+        target = HTTPTarget(args.url)
+    else:
+        work_dir = seeded_copy(args.cache_dir, size, backend)
+        start = time.perf_counter()
+        target = TestClientTarget(work_dir, backend)
+        sys.stderr.write(f"Server started on {size:,} licenses ({backend}) in {time.perf_counter() - start:.1f}s\n")
+
+    run_id = int(time.time())
+    results = {}
+    try:
+        for name in args.scenarios:
+            # Warm up (first-load parse, connections) outside the measurement
+            drive(target, list(scenario_requests(name, size, min(20, args.requests), f"{run_id}w")), 1)
+            results[name] = drive(target, list(scenario_requests(name, size, args.requests, run_id)), args.concurrency)
+            if name == 'webhook':
+                drained = target.wait_for_webhooks()
+                if drained is not None:
+                    results[name]['drain_s'] = round(drained, 3)
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+# ------------------------------------------------------------------ reporting
+
+def run_key(size, backend, concurrency, url):
+    return f"{backend}-{size}-c{concurrency}-{'http' if url else 'client'}"
+
+
+def report(key, results, baseline):
+    print(f"\n{key}")
+    print(f"  {'scenario':<10} {'requests':>8} {'errors':>6} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9}   vs baseline")
+    for name, r in results.items():
+        line = f"  {name:<10} {r['requests']:>8} {r['errors']:>6} {r['rps']:>10,.1f} {r['p50_ms']:>9.3f} {r['p99_ms']:>9.3f}"
+        base = (baseline.get(key) or {}).get('results', {}).get(name)
+        if base and base['rps'] and base['p99_ms']:
+            line += (f"   req/s {(r['rps'] / base['rps'] - 1) * 100:+.0f}%,"
+                     f" p99 {(r['p99_ms'] / base['p99_ms'] - 1) * 100:+.0f}%")
+        if 'drain_s' in r:
+            line += f"   (queue drained in {r['drain_s']}s)"
+        print(line)
+
+
+def load_baseline(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_baseline(path, runs):
+    baseline = load_baseline(path)
+    machine = {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()}
+    for key, results in runs.items():
+        baseline[key] = {'recorded': datetime.now().isoformat(timespec='seconds'), 'machine': machine, 'results': results}
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+    print(f"\nBaseline saved to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='License server load test and benchmark')
+    sub = parser.add_subparsers(dest='command')
+
+    seed_parser = sub.add_parser('seed', help='Write a synthetic license DB')
+    seed_parser.add_argument('--size', default='1k')
+    seed_parser.add_argument('--backend', choices=['json', 'sqlite'], default='json')
+    seed_parser.add_argument('--data-dir', required=True)
+
+    run = sub.add_parser('run', help='Benchmark the server endpoints')
+    run.add_argument('--sizes', default='1k', help='Comma-separated DB sizes, e.g. 1k,100k,1M')
+    run.add_argument('--backends', default='json,sqlite')
+    run.add_argument('--concurrency', type=int, default=8)
+    run.add_argument('--requests', type=int, default=2000, help='Requests per scenario')
+    run.add_argument('--scenarios', default=','.join(SCENARIOS))
+    run.add_argument('--url', help='Benchmark a running server (seeded with "seed") instead of the test client')
+    run.add_argument('--cache-dir', default=DEFAULT_CACHE, help='Where seeded DBs are kept between runs')
+    run.add_argument('--baseline', default=DEFAULT_BASELINE)
+    run.add_argument('--save-baseline', action='store_true', help='Record these results as the new baseline')
+    run.add_argument('--json', help=argparse.SUPPRESS)  # Child runs write their results here
+    args = parser.parse_args()
+
+    if args.command == 'seed':
+        seed(args.data_dir, parse_size(args.size), args.backend)
+        return 0
+    if args.command != 'run':
+        parser.print_help()
+        return 1
+
+    args.scenarios = [s for s in args.scenarios.split(',') if s]
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name} (use {', '.join(SCENARIOS)})")
+    combos = [(parse_size(size), backend) for size in args.sizes.split(',') for backend in args.backends.split(',')]
+
+    if args.json:
+        # Child process for one combination (the server module is set up once per process)
+        size, backend = combos[0]
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            # Keep the server's own logging (e.g. "SMTP not configured") out of the report
+            results = run_one(args, size, backend)
+        with open(args.json, 'w') as f:
+            json.dump(results, f)
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    runs = {}
+    for size, backend in combos:
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as out:
+            out_path = out.name
+        cmd = [sys.executable, os.path.abspath(__file__), 'run', '--sizes', str(size), '--backends', backend,
+               '--concurrency', str(args.concurrency), '--requests', str(args.requests),
+               '--scenarios', ','.join(args.scenarios), '--cache-dir', args.cache_dir, '--json', out_path]
+        if args.url:
+            cmd += ['--url', args.url]
+        try:
+            if subprocess.call(cmd) != 0:
+                print(f"[ERROR] Benchmark of {backend}-{size} failed")
+                continue
+            with open(out_path, 'r') as f:
+                results = json.load(f)
+        finally:
+            os.remove(out_path)
+        key = run_key(size, backend, args.concurrency, args.url)
+        runs[key] = results
+        report(key, results, baseline)
+
+    if args.save_baseline and runs:
+        save_baseline(args.baseline, runs)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -23,6 +23,7 @@ fi
 # Copy daemon
 cp examshield.py "$APP_DIR/examshield.py"
 chmod +x "$APP_DIR/examshield.py"
+cp examshield_events.py "$APP_DIR/examshield_events.py"
 
 # Copy license module
 if [ -f "client/license.py" ]; then
@@ -33,6 +34,14 @@ else
     echo "⚠️ client/license.py not found"
 fi
 
+# Copy offline license token public key (generate with: cd server && python3 tokens.py genkey)
+if [ -f "client/license_public_key.pem" ]; then
+    cp client/license_public_key.pem "$APP_DIR/license_public_key.pem"
+    echo "✅ License token public key included"
+else
+    echo "⚠️ client/license_public_key.pem not found — licenses will be verified online on every start"
+fi
+
 # Create auto-updater
 cat > "$APP_DIR/updater.sh" <<'EOF'
 #!/usr/bin/env bash
@@ -181,7 +190,7 @@ def main_gui():
         run("sudo apt update -y && sudo apt install -y python3 python3-pip python3-tk python3-psutil")
         run("sudo apt remove -y python3-pil || true")
         run("sudo -H pip3 install --upgrade pip")
-        run("sudo -H pip3 install --no-cache-dir pyudev python-telegram-bot==13.15 psutil pillow requests")
+        run("sudo -H pip3 install --no-cache-dir pyudev python-telegram-bot==13.15 psutil pillow requests cryptography")
         upd("Testing Telegram connectivity...")
         if test_bot(t,c):
             upd("Telegram OK — test message sent.")
@@ -6,6 +6,10 @@ Handles license verification, trial management, and device fingerprinting.
 
 import os
 import json
+import time
+import random
+import base64
+import threading
 import hashlib
 import socket
 import uuid
@@ -13,6 +17,12 @@ import requests
 import platform
 from datetime import datetime, timedelta
 
+try:
+    from cryptography.hazmat.primitives.serialization import load_pem_public_key
+except ImportError:
+    # Without it offline tokens are ignored and every check goes to the server
+    load_pem_public_key = None
+
 # Cross-platform path configuration
 def get_config_dir():
     """Get configuration directory based on OS"""
@@ -41,31 +51,260 @@ CONFIG_DIR = get_config_dir()
 LICENSE_FILE = os.path.join(CONFIG_DIR, 'license.json')
 TRIAL_FILE = os.path.join(CONFIG_DIR, 'trial.json')
 VERIFY_URL = os.getenv('ES_VERIFY_URL', 'http://localhost:8080/verify')
+# Every endpoint hangs off one base URL; ES_VERIFY_URL (ending in /verify) still works
+SERVER_URL = os.getenv('ES_SERVER_URL') or VERIFY_URL.rsplit('/verify', 1)[0]
 TRIAL_DAYS = 7
 
-def get_device_fingerprint():
+# Public half of the server's ES_TOKEN_SIGNING_KEY, shipped next to this module
+TOKEN_PUBLIC_KEY_FILE = os.getenv(
+    'ES_TOKEN_PUBLIC_KEY_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'license_public_key.pem')
+)
+# Refresh the offline token online once it has less than this many seconds left
+TOKEN_REFRESH_BEFORE = int(os.getenv('ES_TOKEN_REFRESH_BEFORE', str(2 * 86400)))
+_token_public_key = None
+
+# Verification cache: a successful /verify is trusted for the server's cache_ttl
+# (this default if it sends none), then served stale while it is re-checked in the
+# background, for at most VERIFY_GRACE seconds after the last successful check
+VERIFY_TIMEOUT = float(os.getenv('ES_VERIFY_TIMEOUT', '10'))
+VERIFY_CACHE_TTL = int(os.getenv('ES_VERIFY_CACHE_TTL', '3600'))
+VERIFY_GRACE = int(os.getenv('ES_VERIFY_GRACE', str(3 * 86400)))
+_refresh_lock = threading.Lock()
+_refresh_thread = None
+
+# Device identity: kept in device.json; a cached fingerprint is kept while the
+# current signals score at least FINGERPRINT_MATCH against the ones it was made from
+DEVICE_FILE = os.path.join(CONFIG_DIR, 'device.json')
+FINGERPRINT_WEIGHTS = {'machine_id': 0.4, 'product_uuid': 0.4, 'mac': 0.2}
+FINGERPRINT_MATCH = float(os.getenv('ES_FINGERPRINT_MATCH', '0.6'))
+_device_lock = threading.Lock()
+_device_identity = None
+
+# Server calls: retried ES_API_RETRIES times with jittered exponential backoff, and
+# skipped for ES_API_BREAKER_RESET seconds after ES_API_BREAKER_FAILURES failed calls
+API_RETRIES = int(os.getenv('ES_API_RETRIES', '2'))
+API_BACKOFF_BASE = float(os.getenv('ES_API_BACKOFF_BASE', '0.5'))
+API_BACKOFF_MAX = float(os.getenv('ES_API_BACKOFF_MAX', '8'))
+API_BREAKER_FAILURES = int(os.getenv('ES_API_BREAKER_FAILURES', '5'))
+API_BREAKER_RESET = float(os.getenv('ES_API_BREAKER_RESET', '60'))
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """The server failed repeatedly; calls are skipped until the breaker resets"""
+
+
+class LicenseAPI:
     """
-    Generate unique device fingerprint using MAC address and hostname.
-    Returns SHA256 hash as hex string.
+    The license server's HTTP API over one keep-alive session.
+    Connection errors, timeouts, 429 and 5xx answers are retried with full-jitter
+    exponential backoff (so a lab booting at once doesn't retry in lockstep).
+    After `failure_threshold` failed calls in a row the circuit opens: calls fail
+    at once with CircuitOpenError until `reset_after` seconds have passed, then
+    one trial call decides whether it closes again.
     """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, base_url, timeout=VERIFY_TIMEOUT, retries=API_RETRIES,
+                 backoff_base=API_BACKOFF_BASE, backoff_max=API_BACKOFF_MAX,
+                 failure_threshold=API_BREAKER_FAILURES, reset_after=API_BREAKER_RESET):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+
+    def url(self, endpoint):
+        return f"{self.base_url}/{endpoint.lstrip('/')}"
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_after:
+                self._opened_at = time.monotonic()  # Let one call through to test the server
+                return True
+            return False
+
+    def _record(self, ok):
+        with self._lock:
+            if ok:
+                self._failures, self._opened_at = 0, None
+            else:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._opened_at = time.monotonic()
+
+    @property
+    def circuit_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+    def post(self, endpoint, payload, timeout=None):
+        """
+        POST JSON to an endpoint and return the response (including 4xx answers).
+        Raises the last requests exception, or CircuitOpenError, if the server
+        could not be reached.
+        """
+        if not self._allow():
+            raise CircuitOpenError(f"License server unavailable, retrying after {self.reset_after:.0f}s")
+        url = self.url(endpoint)
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                response = self.session.post(url, json=payload, timeout=timeout or self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if last:
+                    self._record(False)
+                    raise
+            else:
+                if response.status_code not in self.RETRY_STATUSES:
+                    self._record(True)
+                    return response
+                if last:
+                    self._record(False)
+                    return response
+            time.sleep(self.backoff(attempt))
+
+
+api = LicenseAPI(SERVER_URL)
+
+def legacy_fingerprint():
+    """The pre-device.json fingerprint: SHA256 of MAC address and hostname"""
     try:
-        # Get MAC address
-        mac = ':'.join(['{:02x}'.format((uuid.getnode() >> elements) & 0xff) 
+        mac = ':'.join(['{:02x}'.format((uuid.getnode() >> elements) & 0xff)
                        for elements in range(0, 2*6, 2)][::-1])
-        
-        # Get hostname
-        hostname = socket.gethostname()
-        
-        # Combine and hash
-        combined = f"{mac}:{hostname}"
-        fingerprint = hashlib.sha256(combined.encode()).hexdigest()
-        
-        return fingerprint
-    except Exception as e:
-        # Fallback to hostname only
-        hostname = socket.gethostname()
-        fingerprint = hashlib.sha256(hostname.encode()).hexdigest()
-        return fingerprint
+        return hashlib.sha256(f"{mac}:{socket.gethostname()}".encode()).hexdigest()
+    except Exception:
+        return hashlib.sha256(socket.gethostname().encode()).hexdigest()
+
+def _read_first_line(path):
+    try:
+        with open(path, 'r') as f:
+            return f.readline().strip() or None
+    except OSError:
+        return None
+
+def read_machine_id():
+    """The OS installation ID (systemd machine-id, or MachineGuid on Windows)"""
+    if platform.system() == 'Windows':
+        try:
+            import winreg
+            with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r'SOFTWARE\Microsoft\Cryptography') as k:
+                return winreg.QueryValueEx(k, 'MachineGuid')[0]
+        except Exception:
+            return None
+    return _read_first_line('/etc/machine-id') or _read_first_line('/var/lib/dbus/machine-id')
+
+def read_product_uuid():
+    """The firmware's (DMI/SMBIOS) system UUID; only readable as root on Linux"""
+    value = _read_first_line('/sys/class/dmi/id/product_uuid')
+    if not value or set(value.lower()) <= set('0-') or set(value.lower()) <= set('f-'):
+        return None  # Unset by the vendor
+    return value.lower()
+
+def read_primary_mac():
+    """MAC address of the first physical network interface"""
+    net = '/sys/class/net'
+    if os.path.isdir(net):
+        for name in sorted(os.listdir(net)):
+            # Only real hardware has a device link; skips lo, bridges, docker0, VPNs
+            if os.path.exists(os.path.join(net, name, 'device')):
+                mac = _read_first_line(os.path.join(net, name, 'address'))
+                if mac and mac != '00:00:00:00:00:00':
+                    return mac.lower()
+    node = uuid.getnode()
+    if node >> 40 & 1:
+        return None  # uuid.getnode() made up a random one
+    return ':'.join('{:02x}'.format((node >> shift) & 0xff) for shift in range(40, -1, -8))
+
+def collect_signals():
+    """Hashes of this machine's identifying signals (raw IDs never leave the machine)"""
+    signals = {}
+    for name, read in (('machine_id', read_machine_id), ('product_uuid', read_product_uuid),
+                       ('mac', read_primary_mac)):
+        value = read()
+        if value:
+            signals[name] = hashlib.sha256(f"examshield:{name}:{value}".encode()).hexdigest()
+    return signals
+
+def similarity(a, b):
+    """
+    How likely two sets of signals are the same machine, from 0.0 to 1.0: the
+    weight of the signals both have and agree on, out of the weight of every
+    signal. A missing signal counts against the match, so a shared machine-id
+    alone (disk image clones) never reaches FINGERPRINT_MATCH.
+    Mirrors device_similarity() on the server.
+    """
+    matched = sum(weight for name, weight in FINGERPRINT_WEIGHTS.items()
+                  if a.get(name) and a.get(name) == b.get(name))
+    return matched / sum(FINGERPRINT_WEIGHTS.values())
+
+def _load_device():
+    try:
+        with open(DEVICE_FILE, 'r') as f:
+            data = json.load(f)
+        return data if data.get('fingerprint') and isinstance(data.get('signals'), dict) else None
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def _save_device(device):
+    try:
+        os.makedirs(os.path.dirname(DEVICE_FILE), exist_ok=True)
+        tmp_path = DEVICE_FILE + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(device, f, indent=2)
+        os.replace(tmp_path, DEVICE_FILE)
+    except OSError:
+        pass  # Still usable for this run; worked out again next time
+
+def get_device_identity():
+    """
+    This machine's {'fingerprint', 'signals'}, worked out once per process.
+    The fingerprint is kept in device.json and survives a renamed machine or one
+    changed signal: it is only replaced when the signals no longer look like the
+    machine that created it (e.g. the file was copied with a disk image).
+    """
+    global _device_identity
+    with _device_lock:
+        if _device_identity is not None:
+            return _device_identity
+        signals = collect_signals()
+        device = _load_device()
+        if device is None or similarity(device['signals'], signals) < FINGERPRINT_MATCH:
+            # Keep the fingerprint an existing install registered with, if there is one
+            license_data = load_license() or {}
+            fingerprint = license_data.get('device_fingerprint') if device is None else None
+            if fingerprint != legacy_fingerprint():
+                fingerprint = hashlib.sha256(json.dumps(signals, sort_keys=True).encode() + os.urandom(16)).hexdigest()
+            device = {'fingerprint': fingerprint, 'signals': signals, 'created': datetime.now().isoformat()}
+            _save_device(device)
+        elif device['signals'] != signals:
+            device['signals'] = signals  # One signal drifted; remember the new value
+            _save_device(device)
+        _device_identity = device
+        return device
+
+def get_device_fingerprint():
+    """Stable ID of this machine (see get_device_identity)"""
+    return get_device_identity()['fingerprint']
+
+def device_signals():
+    """Signal hashes sent with /verify so the server can recognise this machine"""
+    return get_device_identity()['signals']
 
 def load_license():
     """Load license information from file"""
@@ -81,8 +320,11 @@ def save_license(license_data):
     """Save license information to file"""
     os.makedirs(os.path.dirname(LICENSE_FILE), exist_ok=True)
     try:
-        with open(LICENSE_FILE, 'w') as f:
+        # Write-and-rename so a background refresh never leaves a half-written file
+        tmp_path = LICENSE_FILE + '.tmp'
+        with open(tmp_path, 'w') as f:
             json.dump(license_data, f, indent=2)
+        os.replace(tmp_path, LICENSE_FILE)
         return True
     except Exception as e:
         print(f"Error saving license: {e}")
@@ -120,11 +362,7 @@ def check_trial_eligibility(email=None):
             return True  # If no email, allow trial (offline mode)
     
     try:
-        response = requests.post(
-            VERIFY_URL.replace('/verify', '/check-trial-eligibility'),
-            json={'email': email},
-            timeout=5
-        )
+        response = api.post('check-trial-eligibility', {'email': email}, timeout=5)
         if response.status_code == 200:
             data = response.json()
             return data.get('eligible', True)
@@ -165,6 +403,40 @@ def is_trial_expired():
     except:
         return True
 
+def load_token_public_key():
+    """Load the bundled token verification key (None if missing or unsupported)"""
+    global _token_public_key
+    if _token_public_key is None and load_pem_public_key is not None:
+        try:
+            with open(TOKEN_PUBLIC_KEY_FILE, 'rb') as f:
+                _token_public_key = load_pem_public_key(f.read())
+        except (OSError, ValueError):
+            pass
+    return _token_public_key
+
+def verify_token(token, key, device_fp):
+    """
+    Validate a signed offline license token locally.
+    Returns the token claims if it is genuine, issued for this key and device,
+    and not expired; otherwise None.
+    """
+    public_key = load_token_public_key()
+    if not token or public_key is None:
+        return None
+    try:
+        payload, signature = token.split('.')
+        payload = base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4))
+        signature = base64.urlsafe_b64decode(signature + '=' * (-len(signature) % 4))
+        public_key.verify(signature, payload)
+        claims = json.loads(payload)
+    except Exception:
+        return None
+    if claims.get('key') != key or claims.get('fp') != device_fp:
+        return None
+    if time.time() >= claims.get('exp', 0):
+        return None
+    return claims
+
 def verify_key_online(key):
     """
     Verify license key online with server.
@@ -176,26 +448,28 @@ def verify_key_online(key):
     device_fp = get_device_fingerprint()
     
     try:
-        response = requests.post(
-            VERIFY_URL,
-            json={
-                'key': key.strip(),
-                'device_fingerprint': device_fp
-            },
-            timeout=10
-        )
+        response = api.post('verify', {
+            'key': key.strip(),
+            'device_fingerprint': device_fp,
+            'device_signals': device_signals()
+        })
         
         if response.status_code == 200:
             data = response.json()
             if data.get('valid'):
                 # Save license info
+                now = datetime.now()
+                ttl = data.get('cache_ttl', VERIFY_CACHE_TTL)
                 license_data = {
                     'key': key.strip(),
                     'device_fingerprint': device_fp,
-                    'verified': datetime.now().isoformat(),
+                    'verified': now.isoformat(),
+                    # Jittered so a lab verified together doesn't revalidate together
+                    'fresh_until': (now + timedelta(seconds=ttl * random.uniform(0.8, 1.0))).isoformat(),
                     'active': True,
                     'devices_registered': data.get('devices_registered', 0),
-                    'device_limit': data.get('device_limit', 2)
+                    'device_limit': data.get('device_limit', 2),
+                    'token': data.get('token')
                 }
                 save_license(license_data)
                 return True, "License verified successfully", data
@@ -203,6 +477,9 @@ def verify_key_online(key):
                 return False, data.get('error', 'License verification failed'), data
         else:
             error_data = response.json() if response.content else {}
+            if error_data.get('valid') is False:
+                # The server rejected this license: stop serving cached answers for it
+                forget_verification(key.strip(), error_data.get('error'))
             return False, error_data.get('error', f'Server error: {response.status_code}'), error_data
     
     except requests.exceptions.Timeout:
@@ -212,6 +489,57 @@ def verify_key_online(key):
     except Exception as e:
         return False, f"Verification error: {str(e)}", None
 
+def forget_verification(key, error=None):
+    """Drop the cached verification and token after the server rejected a key"""
+    license_data = load_license()
+    if license_data and license_data.get('key') == key:
+        license_data.update({'active': False, 'fresh_until': None, 'token': None, 'error': error})
+        save_license(license_data)
+
+def cache_state(license_data, now=None):
+    """
+    Classify the cached verification in license.json.
+    Returns 'fresh' (within the TTL), 'stale' (within the grace period) or None.
+    """
+    if not license_data.get('active'):
+        return None
+    try:
+        verified = datetime.fromisoformat(license_data['verified'])
+        fresh_until = datetime.fromisoformat(license_data['fresh_until'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    now = now or datetime.now()
+    if verified > now:
+        return None  # Clock moved backwards or the file was edited
+    if now < fresh_until:
+        return 'fresh'
+    if now < verified + timedelta(seconds=VERIFY_GRACE):
+        return 'stale'
+    return None
+
+def refresh_in_background(key):
+    """Re-verify a key on a background thread (at most one refresh at a time)"""
+    global _refresh_thread
+    with _refresh_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return _refresh_thread
+        _refresh_thread = threading.Thread(target=verify_key_online, args=(key,), name='license-refresh', daemon=True)
+        _refresh_thread.start()
+        return _refresh_thread
+
+def cached_status(key, license_data, claims=None):
+    """Status dict for a license answered from the verification cache or an offline token"""
+    result = {
+        'status': 'active',
+        'message': 'License is active',
+        'key': key,
+        'devices_registered': license_data.get('devices_registered', 0),
+        'device_limit': claims.get('limit', 2) if claims else license_data.get('device_limit', 2)
+    }
+    if claims:
+        result['token_expires'] = datetime.fromtimestamp(claims['exp']).isoformat()
+    return result
+
 def status():
     """
     Check current license status.
@@ -222,7 +550,21 @@ def status():
     if license_data:
         key = license_data.get('key')
         if key:
-            # Verify online
+            # A valid signed token answers offline until it nears expiry
+            claims = verify_token(license_data.get('token'), key, get_device_fingerprint())
+            if claims and claims['exp'] - time.time() > TOKEN_REFRESH_BEFORE:
+                return cached_status(key, license_data, claims)
+            
+            # So does a recent successful verification
+            state = cache_state(license_data)
+            if state == 'fresh':
+                return cached_status(key, license_data, claims)
+            if state == 'stale' or claims:
+                # Answer from the cache now and revalidate in the background
+                refresh_in_background(key)
+                return cached_status(key, license_data, claims)
+            
+            # Nothing usable cached: verify online
             success, message, data = verify_key_online(key)
             if success:
                 return {
@@ -8,7 +8,7 @@ Features:
 ✅ USB detection + block in exam mode
 ✅ Browser blocking + restoration
 ✅ Professional alert formatting (Markdown)
-✅ /exam, /normal, /logs, /start commands
+✅ /exam, /normal, /logs, /stats, /start commands
 ------------------------------------------------------------
 """
 
@@ -51,10 +51,13 @@ try:
     import pyudev
     from telegram import Bot, Update
     from telegram.ext import Updater, CommandHandler, CallbackContext
+    from telegram.utils.request import Request
 except ImportError:
     print("Missing dependencies. Run: sudo pip3 install pyudev python-telegram-bot==13.15 psutil")
     sys.exit(1)
 
+from examshield_events import AlertDispatcher, USBEventQueue
+
 # ----------------------------------------------------------------
 # Configuration paths
 # ----------------------------------------------------------------
@@ -138,21 +141,16 @@ def save_chatlist(chats):
 # ----------------------------------------------------------------
 # Telegram broadcast
 # ----------------------------------------------------------------
+def make_bot(pool_size):
+    return Bot(token=cfg.token, request=Request(con_pool_size=pool_size))
+
+alerts = AlertDispatcher(make_bot, chats=load_chatlist(), save_chats=save_chatlist)
+
 def send_telegram(event, details):
+    """Queue an alert for every chat; returns at once"""
     if not cfg.token:
         logging.warning("Telegram not configured.")
         return
-
-    bot = Bot(token=cfg.token)
-    chats = load_chatlist()
-    if not chats:
-        # fallback to single chat_id if no list yet
-        if cfg.chat_id:
-            chats = [cfg.chat_id]
-        else:
-            logging.warning("No chatlist or default chat id found.")
-            return
-
     msg = (
         f"🧠 *ExamShield Alert*\n"
         f"🖥 *Host:* {HOSTNAME}\n"
@@ -160,12 +158,8 @@ def send_telegram(event, details):
         f"🚨 *Event:* {event}\n"
         f"📝 *Details:* {details}"
     )
-
-    for chat in chats:
-        try:
-            bot.send_message(chat_id=chat, text=msg, parse_mode="Markdown")
-        except Exception as e:
-            logging.warning(f"Failed to send alert to {chat}: {e}")
+    # fallback to single chat_id if no list yet
+    alerts.broadcast(msg, default_chat=cfg.chat_id)
 
 # ----------------------------------------------------------------
 def log_usb_event(text):
@@ -174,6 +168,19 @@ def log_usb_event(text):
         f.write(line)
     logging.info(text)
 
+# ----------------------------------------------------------------
+def block_usb():
+    os.system("for d in /sys/bus/usb/devices/*; do echo 0 > $d/authorized 2>/dev/null; done")
+    os.system("sudo beep -f 900 -l 250 || echo -e '\\a'")
+    send_telegram("USB Blocked", "A USB device was blocked during exam mode.")
+
+usb_events = USBEventQueue(
+    log_event=log_usb_event,
+    send_alert=send_telegram,
+    block_usb=block_usb,
+    in_exam=lambda: exam_ctrl.in_exam,
+)
+
 # ----------------------------------------------------------------
 class USBMonitor(threading.Thread):
     def __init__(self):
@@ -189,18 +196,12 @@ class USBMonitor(threading.Thread):
                 action = device.action
                 if action not in ('add', 'remove'):
                     continue
-                vendor = device.get('ID_VENDOR') or 'unknown'
-                model = device.get('ID_MODEL') or 'unknown'
-                serial = device.get('ID_SERIAL_SHORT') or 'unknown'
-                msg = f"USB {action.upper()} — {vendor} {model} ({serial})"
-                log_usb_event(msg)
-                send_telegram(f"USB {action.upper()}", f"{vendor} {model} ({serial})")
-
-                # Block USBs during exam mode
-                if exam_ctrl.in_exam and action == 'add':
-                    os.system("for d in /sys/bus/usb/devices/*; do echo 0 > $d/authorized 2>/dev/null; done")
-                    os.system("sudo beep -f 900 -l 250 || echo -e '\\a'")
-                    send_telegram("USB Blocked", "A USB device was blocked during exam mode.")
+                usb_events.put(
+                    action,
+                    device.get('ID_VENDOR') or 'unknown',
+                    device.get('ID_MODEL') or 'unknown',
+                    device.get('ID_SERIAL_SHORT') or 'unknown',
+                )
             except Exception:
                 logging.exception("USB monitor error")
 
@@ -240,7 +241,7 @@ class ExamModeController:
                 os.rename(d + '.disabled', d)
 
     def enter_exam(self):
-        if self.in_exam:
+        if self.in_exam or not license_state.allows_exam:
             return False
         killed = self._kill_browsers()
         self._disable_browsers()
@@ -261,6 +262,48 @@ class ExamModeController:
 
 exam_ctrl = ExamModeController()
 
+# ----------------------------------------------------------------
+# License check (runs alongside monitoring, see main())
+# ----------------------------------------------------------------
+class LicenseState:
+    def __init__(self):
+        self.status = None       # license.status() result once the check is done
+        self.degraded = False    # Invalid license: monitoring only, no exam mode
+        self.checked = threading.Event()
+
+    @property
+    def allows_exam(self):
+        # Not before the check is done, so an invalid license can't leave exam mode on
+        return self.checked.is_set() and not self.degraded
+
+license_state = LicenseState()
+
+class LicenseCheckThread(threading.Thread):
+    """Checks the license once in the background; degrades the daemon and alerts if it is not valid"""
+
+    def __init__(self, state):
+        super().__init__(daemon=True, name='license-check')
+        self.state = state
+
+    def run(self):
+        logging.info("Checking license status...")
+        try:
+            result = license.status()
+        except Exception as e:
+            logging.exception("License check error")
+            result = {'status': 'invalid', 'message': f'License check failed: {e}'}
+        self.state.status = result
+        status, message = result.get('status', 'unknown'), result.get('message', '')
+        logging.info(f"License status: {status} - {message}")
+
+        if status == 'trial':
+            logging.warning(message)
+        elif status != 'active':
+            self.state.degraded = True
+            logging.error(f"License check failed ({message}). Running in degraded mode: exam mode disabled.")
+            send_telegram("License Invalid", f"{message} Exam mode is disabled until a valid license is installed.")
+        self.state.checked.set()
+
 # ----------------------------------------------------------------
 class TelegramCommandThread(threading.Thread):
     def __init__(self):
@@ -272,22 +315,25 @@ class TelegramCommandThread(threading.Thread):
             logging.warning("Telegram not configured.")
             return
 
-        self.updater = Updater(cfg.token, use_context=True)
+        self.updater = Updater(bot=alerts.bot, use_context=True)
         dp = self.updater.dispatcher
-        chats = load_chatlist()
 
         # Register new users
         def start(update: Update, context: CallbackContext):
             cid = update.effective_chat.id
-            if cid not in chats:
-                chats.append(cid)
-                save_chatlist(chats)
+            if alerts.add_chat(cid):
                 logging.info(f"Added new chat ID: {cid}")
             update.message.reply_text(
                 f"✅ Registered for ExamShield alerts.\nHost: {HOSTNAME}\nYou will now receive alerts."
             )
 
         def exam(update: Update, context: CallbackContext):
+            if not license_state.checked.is_set():
+                update.message.reply_text("⏳ License check in progress. Try again in a few seconds.")
+                return
+            if license_state.degraded:
+                update.message.reply_text(f"❌ License invalid: {license_state.status.get('message', '')}\nExam mode is unavailable.")
+                return
             ok = exam_ctrl.enter_exam()
             update.message.reply_text(f'Exam mode enabled: {ok}')
 
@@ -307,7 +353,17 @@ class TelegramCommandThread(threading.Thread):
         dp.add_handler(CommandHandler("start", start))
         dp.add_handler(CommandHandler("exam", exam))
         dp.add_handler(CommandHandler("normal", normal))
+        def stats(update: Update, context: CallbackContext):
+            st = usb_events.stats()
+            update.message.reply_text(
+                f"📊 USB event queue ({HOSTNAME}):\n"
+                f"Depth: {st['depth']} (max {st['max_depth']})\n"
+                f"Received: {st['received']}, handled: {st['handled']}\n"
+                f"Merged repeats: {st['coalesced']}, dropped: {st['dropped']}"
+            )
+
         dp.add_handler(CommandHandler("logs", logs))
+        dp.add_handler(CommandHandler("stats", stats))
 
         send_telegram("System Online", "ExamShield daemon is now active.")
         logging.info("Telegram listener active.")
@@ -324,18 +380,18 @@ def main():
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
 
-    # License verification
-    if LICENSE_ENABLED:
-        logging.info("Checking license status...")
-        if not license.check_and_exit_if_invalid():
-            logging.error("License check failed. Exiting.")
-            sys.exit(1)
-        license_status = license.status()
-        logging.info(f"License status: {license_status.get('status', 'unknown')} - {license_status.get('message', '')}")
-
+    # Monitoring starts right away; the license check (which may wait on the
+    # server) runs alongside it and degrades the daemon if the license is invalid
+    alerts.start()
+    usb_events.start()
     usbmon = USBMonitor(); usbmon.start()
     tg = TelegramCommandThread(); tg.start()
 
+    if LICENSE_ENABLED:
+        LicenseCheckThread(license_state).start()
+    else:
+        license_state.checked.set()
+
     while True:
         time.sleep(10)
 
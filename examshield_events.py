@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+ExamShield Events
+The Telegram alert dispatcher and the USB event queue used by examshield.py.
+
+Anything that touches Telegram, udev or the system (making the Bot, sending an
+alert, blocking USB, the exam-mode flag) is passed in by the daemon, so this
+module only needs the standard library and can be tested on its own.
+"""
+
+import time
+import queue
+import logging
+import threading
+
+# Alert fan-out: parallel senders, and Telegram's flood limits (about one message
+# per second to a chat, 30 per second overall)
+ALERT_WORKERS = 8
+ALERT_QUEUE_SIZE = 1000
+CHAT_INTERVAL = 1.0
+GLOBAL_INTERVAL = 1.0 / 30
+RETRY_AFTER_ATTEMPTS = 3
+
+# USB events: queued by the udev thread, handled by a small consumer pool.
+# Repeats of an event still waiting in the queue are merged, and past
+# USB_STORM_ALERTS alerts per USB_COALESCE_WINDOW seconds the rest are summarized
+USB_WORKERS = 2
+USB_QUEUE_SIZE = 500
+USB_COALESCE_WINDOW = 5.0
+USB_STORM_ALERTS = 10
+
+
+# ----------------------------------------------------------------
+# Telegram broadcast
+# ----------------------------------------------------------------
+class AlertDispatcher:
+    """
+    Sends alerts to every subscribed chat from a pool of sender threads, so a
+    USB event never waits on Telegram. One Bot (made by bot_factory(pool_size),
+    and shared with the command listener) is kept for the life of the daemon;
+    the chat list is kept in memory and written with save_chats on changes.
+    """
+
+    def __init__(self, bot_factory, chats=(), save_chats=None, workers=ALERT_WORKERS,
+                 maxsize=ALERT_QUEUE_SIZE, chat_interval=CHAT_INTERVAL,
+                 global_interval=GLOBAL_INTERVAL, clock=time.monotonic, sleep=time.sleep):
+        self.bot_factory = bot_factory
+        self.chats = list(chats)
+        self.save_chats = save_chats
+        self.workers = workers
+        self.chat_interval = chat_interval
+        self.global_interval = global_interval
+        self.clock = clock
+        self.sleep = sleep
+        self.queue = queue.Queue(maxsize=maxsize)
+        self._bot = None
+        self._lock = threading.Lock()
+        self._next_send = {}       # chat -> earliest time for its next message
+        self._next_global = 0.0
+
+    @property
+    def bot(self):
+        with self._lock:
+            if self._bot is None:
+                # Room for every sender plus the command listener's long polls
+                self._bot = self.bot_factory(self.workers + 4)
+            return self._bot
+
+    def add_chat(self, chat):
+        with self._lock:
+            if chat in self.chats:
+                return False
+            self.chats.append(chat)
+            if self.save_chats is not None:
+                self.save_chats(self.chats)
+            return True
+
+    def start(self):
+        for i in range(self.workers):
+            threading.Thread(target=self._run, name=f'alert-sender-{i}', daemon=True).start()
+
+    def broadcast(self, text, default_chat=None):
+        """Queue a message for every chat (or default_chat if there are none yet); returns at once"""
+        with self._lock:
+            chats = list(self.chats)
+        if not chats:
+            if not default_chat:
+                logging.warning("No chatlist or default chat id found.")
+                return 0
+            chats = [default_chat]
+        queued = 0
+        for chat in chats:
+            try:
+                self.queue.put_nowait((chat, text))
+                queued += 1
+            except queue.Full:
+                logging.warning(f"Alert queue full; dropped alert for {chat}")
+        return queued
+
+    def _reserve(self, chat, delay=0.0):
+        """Claim the next send slot both Telegram limits allow; returns when it is.
+
+        A flood-control delay only holds back this chat: the global slot is
+        taken from the chat's normal schedule, so other chats aren't delayed.
+        """
+        with self._lock:
+            now = self.clock()
+            slot = max(now, self._next_send.get(chat, 0.0), self._next_global)
+            at = max(slot, now + delay)
+            self._next_send[chat] = at + self.chat_interval
+            self._next_global = slot + self.global_interval
+            return at
+
+    def deliver(self, chat, text):
+        """Send one message within the rate limits, waiting out flood control. Returns True if sent."""
+        delay = 0.0
+        for _ in range(RETRY_AFTER_ATTEMPTS):
+            wait = self._reserve(chat, delay) - self.clock()
+            if wait > 0:
+                self.sleep(wait)
+            try:
+                self.bot.send_message(chat_id=chat, text=text, parse_mode="Markdown")
+                return True
+            except Exception as e:
+                # telegram.error.RetryAfter: flood control says when to try again
+                delay = getattr(e, 'retry_after', None)
+                if delay is None:
+                    logging.warning(f"Failed to send alert to {chat}: {e}")
+                    return False
+        logging.warning(f"Dropped alert to {chat}: still flood-limited after "
+                        f"{RETRY_AFTER_ATTEMPTS} attempts (retry after {delay}s)")
+        return False
+
+    def _run(self):
+        while True:
+            chat, text = self.queue.get()
+            self.deliver(chat, text)
+            self.queue.task_done()
+
+
+# ----------------------------------------------------------------
+# USB events
+# ----------------------------------------------------------------
+class USBEvent:
+    __slots__ = ('action', 'vendor', 'model', 'serial', 'count', 'first_seen')
+
+    def __init__(self, action, vendor, model, serial, first_seen):
+        self.action, self.vendor, self.model, self.serial = action, vendor, model, serial
+        self.count = 1
+        self.first_seen = first_seen
+
+    @property
+    def key(self):
+        return (self.action, self.vendor, self.model, self.serial)
+
+    @property
+    def label(self):
+        repeat = f" ×{self.count}" if self.count > 1 else ""
+        return f"{self.vendor} {self.model} ({self.serial}){repeat}"
+
+
+class USBEventQueue:
+    """
+    Bounded queue between the udev thread and the workers that log, alert and
+    block, so a burst of events never stalls reading the netlink socket.
+    put() never blocks: a repeat of an event that is still queued only bumps its
+    count, and when the queue is full the event is dropped (and counted).
+
+    Workers call log_event(text), send_alert(title, details) and block_usb(),
+    the latter for 'add' events while in_exam() is true.
+    """
+
+    def __init__(self, log_event, send_alert, block_usb, in_exam, workers=USB_WORKERS,
+                 maxsize=USB_QUEUE_SIZE, coalesce_window=USB_COALESCE_WINDOW,
+                 storm_alerts=USB_STORM_ALERTS, clock=time.monotonic):
+        self.log_event = log_event
+        self.send_alert = send_alert
+        self.block_usb = block_usb
+        self.in_exam = in_exam
+        self.workers = workers
+        self.coalesce_window = coalesce_window
+        self.storm_alerts = storm_alerts
+        self.clock = clock
+        self.queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._waiting = {}           # event key -> queued USBEvent not yet picked up
+        self._block_missed = False   # An 'add' was dropped; block USB anyway
+        self._reported_drops = 0
+        self._window_start = None
+        self._window_alerts = 0
+        self._suppressed = 0
+        self.received = self.coalesced = self.dropped = self.handled = self.max_depth = 0
+
+    def start(self):
+        for i in range(self.workers):
+            threading.Thread(target=self._run, name=f'usb-events-{i}', daemon=True).start()
+
+    def put(self, action, vendor, model, serial):
+        """Hand an event to the workers (called on the udev thread)"""
+        now = self.clock()
+        with self._lock:
+            self.received += 1
+            event = self._waiting.get((action, vendor, model, serial))
+            if event is not None and now - event.first_seen < self.coalesce_window:
+                event.count += 1
+                self.coalesced += 1
+                return True
+            event = USBEvent(action, vendor, model, serial, now)
+            try:
+                self.queue.put_nowait(event)
+            except queue.Full:
+                self.dropped += 1
+                self._block_missed = self._block_missed or action == 'add'
+                return False
+            self._waiting[event.key] = event
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'depth': self.queue.qsize(), 'max_depth': self.max_depth, 'received': self.received,
+                'coalesced': self.coalesced, 'dropped': self.dropped, 'handled': self.handled,
+            }
+
+    def _run(self):
+        while True:
+            self.process_next(timeout=1)
+
+    def process_next(self, timeout=None):
+        """Handle the next queued event (waiting up to timeout), then any catch-up work"""
+        try:
+            event = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            event = None
+        if event is not None:
+            with self._lock:
+                if self._waiting.get(event.key) is event:
+                    del self._waiting[event.key]  # Its count is final from here on
+            try:
+                self._handle(event)
+            except Exception:
+                logging.exception("USB event handler error")
+            with self._lock:
+                self.handled += 1
+            self.queue.task_done()
+        self._after_event()
+        return event is not None
+
+    def _handle(self, event):
+        action = event.action.upper()
+        self.log_event(f"USB {action} — {event.label}")
+        # Block USBs during exam mode
+        if self.in_exam() and event.action == 'add':
+            self.block_usb()
+        self._alert(f"USB {action}", event.label)
+
+    def _alert(self, title, details):
+        """Send an alert unless this window already had storm_alerts of them"""
+        with self._lock:
+            now = self.clock()
+            if self._window_start is None or now - self._window_start >= self.coalesce_window:
+                self._window_start, self._window_alerts = now, 0
+            self._window_alerts += 1
+            if self._window_alerts > self.storm_alerts:
+                self._suppressed += 1
+                return
+        self.send_alert(title, details)
+
+    def _after_event(self):
+        """Catch up on dropped events and end-of-storm summaries"""
+        with self._lock:
+            block = self._block_missed and self.in_exam()
+            self._block_missed = False
+            drops, self._reported_drops = self.dropped - self._reported_drops, self.dropped
+            suppressed = 0
+            if self._suppressed and self.clock() - self._window_start >= self.coalesce_window:
+                suppressed, self._suppressed = self._suppressed, 0
+        if block:
+            self.block_usb()
+        if drops:
+            logging.warning(f"USB event queue full: dropped {drops} event(s)")
+        if suppressed:
+            self.send_alert("USB Event Storm",
+                            f"{suppressed} more USB events in {self.coalesce_window:g}s. Use /logs for details.")
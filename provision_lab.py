@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Provision a lab of machines against one license in a single request.
+
+The machine list has one device per line, either just a fingerprint or
+"name,fingerprint" (lines starting with # are ignored). Get a machine's
+fingerprint by running `python3 license.py` on it.
+
+With --output-dir, a license.json is written per machine (<name>.license.json)
+holding the verification result and offline token; copy it to the machine's
+config directory (/etc/examshield/license.json) so it starts up without
+contacting the server.
+
+Usage: python provision_lab.py <license_key> <machines.txt> [--server URL] [--output-dir DIR]
+"""
+
+import os
+import sys
+import json
+import random
+import argparse
+import requests
+from datetime import datetime, timedelta
+
+SERVER_URL = os.getenv('ES_SERVER_URL', 'http://localhost:8080')
+BATCH_SIZE = 500  # Stay below the server's ES_VERIFY_BATCH_MAX
+
+
+def read_machines(path):
+    """Return [(name, fingerprint)] from a machine list file"""
+    machines = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if ',' in line:
+                name, fingerprint = (part.strip() for part in line.split(',', 1))
+            else:
+                name, fingerprint = f"machine-{len(machines) + 1}", line
+            machines.append((name, fingerprint))
+    return machines
+
+
+def provision(server_url, license_key, machines):
+    """Verify/register every machine; returns the per-machine results in order"""
+    results = []
+    for start in range(0, len(machines), BATCH_SIZE):
+        batch = machines[start:start + BATCH_SIZE]
+        response = requests.post(
+            f"{server_url}/verify/batch",
+            json={'items': [{'key': license_key, 'device_fingerprint': fp} for _, fp in batch]},
+            timeout=60
+        )
+        response.raise_for_status()
+        results.extend(response.json()['results'])
+    return results
+
+
+def license_file(license_key, fingerprint, result):
+    """A client license.json for one successfully verified machine"""
+    now = datetime.now()
+    ttl = result.get('cache_ttl', 3600)
+    return {
+        'key': license_key,
+        'device_fingerprint': fingerprint,
+        'verified': now.isoformat(),
+        'fresh_until': (now + timedelta(seconds=ttl * random.uniform(0.8, 1.0))).isoformat(),
+        'active': True,
+        'devices_registered': result.get('devices_registered', 0),
+        'device_limit': result.get('device_limit', 2),
+        'token': result.get('token')
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Register a lab of machines to one ExamShield license')
+    parser.add_argument('license_key')
+    parser.add_argument('machines', help='File with one fingerprint (or name,fingerprint) per line')
+    parser.add_argument('--server', default=SERVER_URL, help=f'License server URL (default: {SERVER_URL})')
+    parser.add_argument('--output-dir', help='Write <name>.license.json for each verified machine here')
+    args = parser.parse_args()
+
+    machines = read_machines(args.machines)
+    if not machines:
+        print(f"[ERROR] No machines listed in {args.machines}")
+        return 1
+
+    print(f"Provisioning {len(machines)} machines on {args.server} ...")
+    try:
+        results = provision(args.server.rstrip('/'), args.license_key.strip(), machines)
+    except requests.exceptions.ConnectionError:
+        print(f"\n[ERROR] Cannot connect to server at {args.server}")
+        return 1
+    except requests.exceptions.RequestException as e:
+        print(f"\n[ERROR] {e}")
+        return 1
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    failed = 0
+    for (name, fingerprint), result in zip(machines, results):
+        if result.get('valid'):
+            print(f"  [OK]    {name}: {result.get('message')}")
+            if args.output_dir:
+                with open(os.path.join(args.output_dir, f"{name}.license.json"), 'w') as f:
+                    json.dump(license_file(args.license_key.strip(), fingerprint, result), f, indent=2)
+        else:
+            failed += 1
+            print(f"  [ERROR] {name}: {result.get('error')}")
+
+    print(f"\n{len(machines) - failed} of {len(machines)} machines verified")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,6 +13,17 @@ import hashlib
 import json
 
 SERVER_URL = "http://localhost:8080"
+ACTIVATION_TIMEOUT = 30  # Seconds to wait for the server's webhook workers
+
+def wait_for_activation(license_key, timeout=ACTIVATION_TIMEOUT):
+    """Poll /license-info until the license is active (the webhook is processed in the background)"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = requests.get(f"{SERVER_URL}/license-info", params={"key": license_key}, timeout=10)
+        if response.status_code == 200 and response.json().get('active'):
+            return True
+        time.sleep(0.5)
+    return False
 
 def get_webhook_secret():
     """Read webhook secret from server .env"""
@@ -90,15 +101,18 @@ def register_and_activate(email, device_type="individual"):
             timeout=10
         )
         
-        if response.status_code == 200:
+        if response.status_code not in (200, 202):
+            print(f"[ERROR] Activation failed: {response.status_code}")
+            print(response.json())
+            return False
+        if wait_for_activation(license_key):
             print("[SUCCESS] License activated!")
             print(f"\nLicense Key: {license_key}")
             print(f"Email: {email}")
             print(f"Status: Active")
             return True
         else:
-            print(f"[ERROR] Activation failed: {response.status_code}")
-            print(response.json())
+            print(f"[ERROR] Payment accepted, but the license was not active after {ACTIVATION_TIMEOUT}s")
             return False
             
     except requests.exceptions.ConnectionError:
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+ExamShield License Analytics
+Per-day, per-week and per-month rollups of registrations, activations, trials,
+revocations and revenue.
+
+Buckets are precomputed in <ES_DATA_DIR>/analytics.json and incremented as
+license changes happen, so charts read a handful of buckets instead of scanning
+the license table. Existing licenses are counted once with the backfill job,
+which rebuilds the buckets from their created/activated/trial/revoked
+timestamps.
+
+Usage:
+    python analytics.py backfill [--force]
+    python analytics.py show [--period day|week|month]
+"""
+
+import os
+import sys
+import json
+import argparse
+from datetime import date, datetime, timedelta
+
+from locks import FileLock
+from reports import payment_amount
+
+METRICS = ('registrations', 'activations', 'trials', 'revocations', 'revenue')
+PERIODS = ('day', 'week', 'month')
+DEFAULT_SPAN = {'day': 30, 'week': 12, 'month': 12}
+
+
+def bucket_key(period, day):
+    """Bucket name for a date: 2026-01-31, 2026-W05 or 2026-01"""
+    if period == 'day':
+        return day.isoformat()
+    if period == 'week':
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    return day.strftime('%Y-%m')
+
+
+def bucket_range(period, start, end):
+    """Bucket names covering start..end (dates), oldest first"""
+    keys = []
+    day = start
+    while day <= end:
+        key = bucket_key(period, day)
+        if not keys or keys[-1] != key:
+            keys.append(key)
+        day += timedelta(days=1 if period == 'day' else 7 if period == 'week' else 28)
+    last = bucket_key(period, end)
+    if keys[-1] != last:
+        keys.append(last)
+    return keys
+
+
+def entry_events(old, new):
+    """The (metric, timestamp, amount) events a license change represents"""
+    if new is None:
+        return []
+    old = old or {}
+    events = []
+    if not old:
+        events.append(('registrations', new.get('created'), 1))
+    for metric, field in (('activations', 'activated'), ('trials', 'trial_started'), ('revocations', 'revoked')):
+        if new.get(field) and new.get(field) != old.get(field):
+            events.append((metric, new[field], 1))
+            if metric == 'activations' and payment_amount(new):
+                events.append(('revenue', new[field], payment_amount(new)))
+    return events
+
+
+class Analytics:
+    """Rollup buckets for one data directory"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = FileLock(path + '.lock')
+
+    def attach(self, store):
+        """Count events from changes made through a license store"""
+        store.add_listener(self.record)
+        return self
+
+    @staticmethod
+    def _empty():
+        return {'day': {}, 'week': {}, 'month': {}, 'backfilled_at': None}
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return self._empty()
+
+    def _save(self, data):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _add(data, metric, timestamp, amount):
+        try:
+            day = datetime.fromisoformat(timestamp).date() if timestamp else date.today()
+        except (TypeError, ValueError):
+            return
+        for period in PERIODS:
+            bucket = data[period].setdefault(bucket_key(period, day), dict.fromkeys(METRICS, 0))
+            bucket[metric] = round(bucket[metric] + amount, 2)
+
+    def record(self, key, old, new):
+        """Store listener: add the events in one change to their buckets"""
+        events = entry_events(old, new)
+        if not events:
+            return
+        with self._lock:
+            data = self._load()
+            for metric, timestamp, amount in events:
+                self._add(data, metric, timestamp, amount)
+            self._save(data)
+
+    def backfill(self, items, force=False):
+        """Rebuild every bucket from existing licenses (a one-time job).
+
+        Returns the number of licenses counted, or None if already backfilled
+        and not forced.
+        """
+        with self._lock:
+            if self._load().get('backfilled_at') and not force:
+                return None
+            data = self._empty()
+            count = 0
+            for _, entry in items:
+                for metric, timestamp, amount in entry_events(None, entry):
+                    self._add(data, metric, timestamp, amount)
+                count += 1
+            data['backfilled_at'] = datetime.now().isoformat()
+            self._save(data)
+        return count
+
+    def series(self, period='day', start=None, end=None):
+        """Buckets for start..end (dates; defaults to the last DEFAULT_SPAN periods), zero-filled"""
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+        end = end or date.today()
+        if start is None:
+            span = DEFAULT_SPAN[period]
+            if period == 'month':
+                months = end.year * 12 + end.month - span
+                start = date(months // 12, months % 12 + 1, 1)
+            else:
+                start = end - timedelta(days=(span - 1) * (1 if period == 'day' else 7))
+        if start > end:
+            raise ValueError('from must not be after to')
+        data = self._load()
+        buckets = data[period]
+        series = [dict(buckets.get(key) or dict.fromkeys(METRICS, 0), bucket=key)
+                  for key in bucket_range(period, start, end)]
+        return {'period': period, 'series': series, 'backfilled': bool(data.get('backfilled_at'))}
+
+
+def from_env(data_dir):
+    return Analytics(os.path.join(data_dir, 'analytics.json'))
+
+
+def main():
+    from storage import open_store
+
+    parser = argparse.ArgumentParser(description='ExamShield license analytics')
+    sub = parser.add_subparsers(dest='command')
+    backfill = sub.add_parser('backfill', help='Rebuild the rollups from existing licenses')
+    backfill.add_argument('--force', action='store_true', help='Rebuild even if already backfilled')
+    show = sub.add_parser('show', help='Print recent buckets')
+    show.add_argument('--period', choices=PERIODS, default='day')
+    args = parser.parse_args()
+
+    data_dir = os.getenv('ES_DATA_DIR', './data')
+    analytics = from_env(data_dir)
+    if args.command == 'backfill':
+        store = open_store(data_dir, os.getenv('ES_STORAGE_BACKEND', 'json').lower())
+        count = analytics.backfill(store.items(), force=args.force)
+        print("Already backfilled (use --force to rebuild)" if count is None else f"Backfilled from {count} licenses")
+    elif args.command == 'show':
+        for bucket in analytics.series(args.period)['series']:
+            print(f"{bucket['bucket']:>10}  " + '  '.join(f"{m}={bucket[m]}" for m in METRICS))
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+ExamShield License Backups
+Append-only change journal plus periodic compacted snapshots of the license DB.
+
+Every committed change is appended to backups/journal.jsonl. A full snapshot is
+written at most once per snapshot interval (and only if something changed);
+identical snapshots are never stored twice. Old snapshots are pruned with an
+hourly/daily/weekly retention policy, and journal records that no retained
+snapshot needs are dropped with them.
+
+Usage:
+    python backup.py snapshot
+    python backup.py list
+    python backup.py prune
+    python backup.py restore [--snapshot FILE] [--until ISO_TIME] [--output PATH | --apply]
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+from datetime import datetime
+
+from locks import FileLock
+
+JOURNAL_NAME = 'journal.jsonl'
+SNAPSHOT_DIR = 'snapshots'
+
+
+def _db_hash(db):
+    return hashlib.sha256(json.dumps(db, sort_keys=True).encode()).hexdigest()
+
+
+class BackupManager:
+    """Journals store changes and takes periodic snapshots for one data directory"""
+
+    def __init__(self, backup_dir, snapshot_interval=3600, keep_hourly=24, keep_daily=7, keep_weekly=4):
+        self.backup_dir = backup_dir
+        self.journal_path = os.path.join(backup_dir, JOURNAL_NAME)
+        self.snapshot_dir = os.path.join(backup_dir, SNAPSHOT_DIR)
+        self.snapshot_interval = snapshot_interval
+        self.keep_hourly = keep_hourly
+        self.keep_daily = keep_daily
+        self.keep_weekly = keep_weekly
+        self.store = None
+        # Shared with other server processes using the same data directory
+        self._lock = FileLock(self.journal_path + '.lock')
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+
+        self.seq = 0
+        self._journal_size = 0
+        with self._lock:
+            self._sync_seq()
+        latest = self.latest_snapshot()
+        self.last_snapshot_time = latest['created_at'] if latest else None
+        self.last_snapshot_seq = latest['seq'] if latest else 0
+        self.seq = max(self.seq, self.last_snapshot_seq)
+
+    def attach(self, store):
+        """Start journaling changes made through a license store"""
+        self.store = store
+        store.add_listener(self.record)
+        return self
+
+    # ---------------------------------------------------------------- journal
+
+    def record(self, key, old, new):
+        """Store listener: append one change to the journal"""
+        with self._lock:
+            self._sync_seq()
+            self.seq += 1
+            line = json.dumps({
+                'seq': self.seq,
+                'ts': datetime.now().isoformat(),
+                'key': key,
+                'entry': new,
+            })
+            with open(self.journal_path, 'ab') as f:
+                f.write(line.encode() + b'\n')
+                self._journal_size = f.tell()
+        self.maybe_snapshot()
+
+    def _sync_seq(self):
+        """Catch up with records other processes appended since our last write"""
+        try:
+            size = os.path.getsize(self.journal_path)
+        except OSError:
+            size = 0
+        if size == self._journal_size:
+            return
+        # The journal only grows, except when prune() rewrites it; then rescan it all
+        offset = self._journal_size if size > self._journal_size else 0
+        with open(self.journal_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    self.seq = max(self.seq, json.loads(line)['seq'])
+                except (ValueError, KeyError):
+                    continue
+        self._journal_size = size
+
+    def read_journal(self):
+        """Yield journal records in order, skipping a torn last line"""
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'r') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    # -------------------------------------------------------------- snapshots
+
+    def list_snapshots(self):
+        """Return snapshot metadata, newest first"""
+        snapshots = []
+        for name in os.listdir(self.snapshot_dir):
+            if not (name.startswith('snapshot_') and name.endswith('.json')):
+                continue
+            # snapshot_<YYYYmmdd_HHMMSS>_<seq>_<hash>.json
+            parts = name[len('snapshot_'):-len('.json')].split('_')
+            try:
+                created = datetime.strptime(f"{parts[0]}_{parts[1]}", '%Y%m%d_%H%M%S')
+                snapshots.append({
+                    'name': name,
+                    'path': os.path.join(self.snapshot_dir, name),
+                    'created_at': created,
+                    'seq': int(parts[2]),
+                    'hash': parts[3],
+                })
+            except (IndexError, ValueError):
+                continue
+        snapshots.sort(key=lambda s: (s['created_at'], s['seq']), reverse=True)
+        return snapshots
+
+    def latest_snapshot(self):
+        snapshots = self.list_snapshots()
+        return snapshots[0] if snapshots else None
+
+    def maybe_snapshot(self):
+        """Take a snapshot if the snapshot interval has elapsed"""
+        if self.store is None:
+            return None
+        if self.last_snapshot_time is not None:
+            elapsed = (datetime.now() - self.last_snapshot_time).total_seconds()
+            if elapsed < self.snapshot_interval:
+                return None
+        return self.snapshot()
+
+    def snapshot(self, db=None):
+        """Write a compacted snapshot of the current DB and apply retention.
+
+        Returns the snapshot path, or None if nothing changed since the last one.
+        """
+        with self._lock:
+            self._sync_seq()
+            if db is None:
+                # Every change up to self.seq was saved before it was journaled,
+                # so a fresh read contains at least all of them
+                self.store.refresh()
+                db = dict(self.store.items())
+            seq = self.seq
+            digest = _db_hash(db)[:16]
+            now = datetime.now()
+            self.last_snapshot_time = now
+
+            latest = self.latest_snapshot()
+            if latest and (latest['seq'] == seq or latest['hash'] == digest):
+                # Deduplicated: the newest snapshot already holds this state
+                return None
+
+            name = f"snapshot_{now.strftime('%Y%m%d_%H%M%S')}_{seq}_{digest}.json"
+            path = os.path.join(self.snapshot_dir, name)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'created': now.isoformat(), 'seq': seq, 'licenses': db}, f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+            self.last_snapshot_seq = seq
+            self.prune()
+            return path
+
+    # -------------------------------------------------------------- retention
+
+    def select_retained(self, snapshots):
+        """Pick the snapshots kept by the hourly/daily/weekly policy"""
+        keep = set()
+        if snapshots:
+            keep.add(snapshots[0]['name'])  # always keep the newest
+
+        for limit, bucket in (
+            (self.keep_hourly, lambda t: t.strftime('%Y%m%d%H')),
+            (self.keep_daily, lambda t: t.strftime('%Y%m%d')),
+            (self.keep_weekly, lambda t: '%d-%02d' % t.isocalendar()[:2]),
+        ):
+            seen = set()
+            for snap in snapshots:  # newest first, so the newest of each bucket wins
+                b = bucket(snap['created_at'])
+                if b in seen:
+                    continue
+                if len(seen) >= limit:
+                    break
+                seen.add(b)
+                keep.add(snap['name'])
+        return keep
+
+    def prune(self):
+        """Delete snapshots outside the retention policy and compact the journal"""
+        with self._lock:
+            snapshots = self.list_snapshots()
+            keep = self.select_retained(snapshots)
+            removed = 0
+            for snap in snapshots:
+                if snap['name'] not in keep:
+                    os.remove(snap['path'])
+                    removed += 1
+
+            retained = [s for s in snapshots if s['name'] in keep]
+            if retained:
+                # Records at or before the oldest retained snapshot can never be replayed
+                oldest_seq = min(s['seq'] for s in retained)
+                records = [r for r in self.read_journal() if r['seq'] > oldest_seq]
+                tmp_path = self.journal_path + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    for record in records:
+                        f.write(json.dumps(record) + '\n')
+                os.replace(tmp_path, self.journal_path)
+                self._journal_size = os.path.getsize(self.journal_path)
+            return removed
+
+    # ---------------------------------------------------------------- restore
+
+    def restore(self, snapshot=None, until=None):
+        """Rebuild the license DB from a snapshot plus the journal.
+
+        snapshot: snapshot file name or path (defaults to the newest)
+        until: datetime; journal records after it are not replayed
+        """
+        if snapshot:
+            path = snapshot if os.path.sep in snapshot else os.path.join(self.snapshot_dir, snapshot)
+            with open(path, 'r') as f:
+                data = json.load(f)
+        else:
+            latest = self.latest_snapshot()
+            if latest:
+                with open(latest['path'], 'r') as f:
+                    data = json.load(f)
+            else:
+                data = {'seq': 0, 'licenses': {}}
+
+        db = data['licenses']
+        for record in self.read_journal():
+            if record['seq'] <= data['seq']:
+                continue
+            if until is not None and datetime.fromisoformat(record['ts']) > until:
+                break
+            if record['entry'] is None:
+                db.pop(record['key'], None)
+            else:
+                db[record['key']] = record['entry']
+        return db
+
+
+def from_env(data_dir):
+    """Build a BackupManager for a data directory using ES_BACKUP_* settings"""
+    return BackupManager(
+        os.path.join(data_dir, 'backups'),
+        snapshot_interval=int(os.getenv('ES_BACKUP_SNAPSHOT_INTERVAL', '3600')),
+        keep_hourly=int(os.getenv('ES_BACKUP_KEEP_HOURLY', '24')),
+        keep_daily=int(os.getenv('ES_BACKUP_KEEP_DAILY', '7')),
+        keep_weekly=int(os.getenv('ES_BACKUP_KEEP_WEEKLY', '4')),
+    )
+
+
+def main():
+    from storage import open_store
+
+    data_dir = os.getenv('ES_DATA_DIR', './data')
+    backend = os.getenv('ES_STORAGE_BACKEND', 'json').lower()
+    parser = argparse.ArgumentParser(description='ExamShield license backups')
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('snapshot', help='Take a snapshot now')
+    sub.add_parser('list', help='List snapshots')
+    sub.add_parser('prune', help='Apply the retention policy')
+    restore = sub.add_parser('restore', help='Replay the journal onto a snapshot')
+    restore.add_argument('--snapshot', help='Snapshot file (default: newest)')
+    restore.add_argument('--until', help='Stop replaying at this ISO timestamp')
+    target = restore.add_mutually_exclusive_group()
+    target.add_argument('--output', help='Write the restored DB to this JSON file')
+    target.add_argument('--apply', action='store_true', help='Overwrite the live license store')
+    args = parser.parse_args()
+
+    backups = from_env(data_dir)
+
+    if args.command == 'snapshot':
+        store = open_store(data_dir, backend)
+        backups.store = store
+        path = backups.snapshot()
+        print(f"Snapshot written: {path}" if path else "No changes since the last snapshot")
+    elif args.command == 'list':
+        for snap in backups.list_snapshots():
+            print(f"{snap['name']}  (journal seq {snap['seq']})")
+    elif args.command == 'prune':
+        print(f"Removed {backups.prune()} snapshots")
+    elif args.command == 'restore':
+        until = datetime.fromisoformat(args.until) if args.until else None
+        db = backups.restore(args.snapshot, until)
+        if args.apply:
+            store = open_store(data_dir, backend)
+            store.replace_all(db)
+            print(f"Restored {len(db)} licenses into {store.path}")
+        else:
+            output = args.output or os.path.join(data_dir, 'license_db.restored.json')
+            with open(output, 'w') as f:
+                json.dump(db, f, indent=2)
+            print(f"Restored {len(db)} licenses to {output}")
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
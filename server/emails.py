@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+ExamShield Email Templates
+Customer emails rendered from precompiled Jinja templates.
+
+Templates live in email_templates/<locale>/<name>.<part>, where part is
+'subject', 'txt' or 'html'. Every template is loaded and compiled once when the
+catalog is created, so rendering an email is just running the compiled code.
+A locale falls back to its language ('pt_BR' -> 'pt') and then to the default.
+"""
+
+import os
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'email_templates')
+DEFAULT_LOCALE = 'en'
+PARTS = ('subject', 'txt', 'html')
+
+
+class EmailTemplates:
+    """Compiled email templates for every shipped locale"""
+
+    def __init__(self, template_dir=TEMPLATE_DIR, default_locale=DEFAULT_LOCALE):
+        self.default_locale = default_locale
+        # HTML parts are autoescaped; subjects and plain text are sent as-is
+        self.env = Environment(
+            loader=FileSystemLoader(template_dir),
+            autoescape=lambda name: bool(name) and name.endswith('.html'),
+            undefined=StrictUndefined,
+            keep_trailing_newline=True,
+            auto_reload=False,
+        )
+        self._templates = {}  # (locale, name) -> {part: Template}
+        for locale in sorted(os.listdir(template_dir)):
+            locale_dir = os.path.join(template_dir, locale)
+            if not os.path.isdir(locale_dir):
+                continue
+            for filename in sorted(os.listdir(locale_dir)):
+                name, _, part = filename.rpartition('.')
+                if part in PARTS:
+                    template = self.env.get_template(f'{locale}/{filename}')
+                    self._templates.setdefault((locale, name), {})[part] = template
+
+        for (locale, name), parts in self._templates.items():
+            if 'subject' not in parts or 'txt' not in parts:
+                raise ValueError(f"Email template {locale}/{name} needs a .subject and a .txt part")
+
+    @property
+    def locales(self):
+        return sorted({locale for locale, _ in self._templates})
+
+    def _resolve(self, name, locale):
+        candidates = []
+        if locale:
+            locale = locale.replace('-', '_')
+            candidates += [locale, locale.split('_')[0].lower()]
+        candidates.append(self.default_locale)
+        for candidate in candidates:
+            parts = self._templates.get((candidate, name))
+            if parts:
+                return parts
+        raise KeyError(f"No email template named {name!r}")
+
+    def render(self, template, locale=None, **context):
+        """Render one email. Returns (subject, text, html); html is None if the template has no HTML part."""
+        parts = self._resolve(template, locale)
+        subject = parts['subject'].render(context).strip()
+        text = parts['txt'].render(context)
+        html = parts['html'].render(context) if 'html' in parts else None
+        return subject, text, html
+
+
+def parse_accept_language(header):
+    """Pick the preferred locale from an Accept-Language header (e.g. 'de-DE,de;q=0.9')"""
+    best, best_q = None, -1.0
+    for item in (header or '').split(','):
+        lang, _, params = item.strip().partition(';')
+        if not lang or lang == '*':
+            continue
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                continue
+        if q > best_q:
+            best, best_q = lang.replace('-', '_'), q
+    return best
+
+
+# Shared catalog, compiled once at import
+templates = EmailTemplates()
+
+
+def render(template, locale=None, **context):
+    """Render an email from the shared catalog; see EmailTemplates.render"""
+    return templates.render(template, locale, **context)
@@ -0,0 +1,50 @@
+"""
+Gunicorn settings for the ExamShield License Server.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden from the environment (or config.env):
+    ES_WORKERS            worker processes (default: 2 x CPUs + 1)
+    ES_WORKER_CLASS       sync | gthread | gevent | eventlet (default: gthread)
+    ES_THREADS            threads per gthread worker (default: 4)
+    ES_KEEPALIVE          seconds to hold idle keep-alive connections (default: 5)
+    ES_TIMEOUT            seconds before a silent worker is restarted (default: 30)
+    ES_GRACEFUL_TIMEOUT   seconds workers get to finish requests on reload/stop (default: 30)
+    ES_MAX_REQUESTS       recycle a worker after this many requests, 0 = never (default: 0)
+    ES_PRELOAD            import the app once in the master before forking (default: false)
+
+Graceful reload (new code/config, in-flight requests finish): kill -HUP <master pid>
+gevent/eventlet workers need the matching package installed (pip install gevent).
+"""
+
+import os
+import multiprocessing
+
+from dotenv import load_dotenv
+
+# Run from the server directory, like `python license_server.py`, so relative
+# paths (config.env, ES_DATA_DIR=./data, the HTML pages) resolve the same way
+chdir = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(chdir, 'config.env'))
+
+_port = os.getenv('PORT', os.getenv('FLASK_PORT', '8080'))  # Render/Heroku set PORT
+bind = f"{os.getenv('FLASK_HOST', '0.0.0.0')}:{_port}"
+
+workers = int(os.getenv('ES_WORKERS', str(multiprocessing.cpu_count() * 2 + 1)))
+worker_class = os.getenv('ES_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('ES_THREADS', '4'))
+keepalive = int(os.getenv('ES_KEEPALIVE', '5'))
+timeout = int(os.getenv('ES_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('ES_GRACEFUL_TIMEOUT', '30'))
+max_requests = int(os.getenv('ES_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+preload_app = os.getenv('ES_PRELOAD', 'false').lower() == 'true'
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    """Give each worker its own connections, locks and background threads"""
+    import license_server
+    license_server.init_worker()
@@ -9,12 +9,21 @@ import json
 import hmac
 import hashlib
 import secrets
-import smtplib
 from datetime import datetime, timedelta
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from dotenv import load_dotenv
+from storage import open_store
+import analytics
+import backup
+import emails
+import mailer
+import metrics
+import pages
+import payments
+import reports
+import stats
+import tokens
+import webhooks
 
 # Load environment variables
 load_dotenv('config.env')
@@ -32,69 +41,74 @@ FLASK_PORT = int(os.getenv('FLASK_PORT', '8080'))
 PORT = int(os.getenv('PORT', str(FLASK_PORT)))  # For platforms that set PORT (e.g., Render/Heroku)
 FLASK_HOST = os.getenv('FLASK_HOST', '0.0.0.0')
 DEBUG = os.getenv('DEBUG', 'false').lower() == 'true'  # Disable debug in production
-
-LICENSE_DB_PATH = os.path.join(ES_DATA_DIR, 'license_db.json')
+STORAGE_BACKEND = os.getenv('ES_STORAGE_BACKEND', 'json').lower()  # 'json' or 'sqlite'
+CACHE_CHECK_INTERVAL = float(os.getenv('ES_CACHE_CHECK_INTERVAL', '0'))  # Seconds between license DB file checks
+VERIFY_BATCH_MAX = int(os.getenv('ES_VERIFY_BATCH_MAX', '1000'))  # Max (key, device) pairs per /verify/batch
+VERIFY_CACHE_TTL = int(os.getenv('ES_VERIFY_CACHE_TTL', '21600'))  # Seconds clients may reuse a successful /verify
+DEVICE_MATCH_THRESHOLD = float(os.getenv('ES_DEVICE_MATCH_THRESHOLD', '0.6'))  # Signal similarity to treat a new fingerprint as a known device
+DEV_MODE = os.getenv('ES_DEV_MODE', str(DEBUG)).lower() == 'true'  # Re-read HTML pages on every request
+PAGE_MAX_AGE = int(os.getenv('ES_PAGE_MAX_AGE', '300'))  # Seconds browsers may reuse a page before revalidating
+SHOP_URL = os.getenv('SHOP_URL', 'https://adulsportfolio.vercel.app/shop')  # Download link in customer emails
 
 # Ensure data directory exists
 os.makedirs(ES_DATA_DIR, exist_ok=True)
 
-# Initialize license database if it doesn't exist
-def init_license_db():
-    if not os.path.exists(LICENSE_DB_PATH):
-        with open(LICENSE_DB_PATH, 'w') as f:
-            json.dump({}, f, indent=2)
+# License storage backend (see storage.py)
+store = open_store(ES_DATA_DIR, STORAGE_BACKEND, cache_check_interval=CACHE_CHECK_INTERVAL)
 
-def load_license_db():
-    init_license_db()
-    try:
-        with open(LICENSE_DB_PATH, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading license DB: {e}")
-        return {}
+# Change journal + periodic snapshots (see backup.py)
+backups = backup.from_env(ES_DATA_DIR).attach(store)
 
-def save_license_db(db):
-    try:
-        # Create backup
-        if os.path.exists(LICENSE_DB_PATH):
-            backup_path = os.path.join(os.path.dirname(LICENSE_DB_PATH), 'backups', 
-                                      f"license_db_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
-            os.makedirs(os.path.dirname(backup_path), exist_ok=True)
-            import shutil
-            shutil.copy2(LICENSE_DB_PATH, backup_path)
-        
-        with open(LICENSE_DB_PATH, 'w') as f:
-            json.dump(db, f, indent=2)
-        return True
-    except Exception as e:
-        print(f"Error saving license DB: {e}")
-        return False
+# Total/active/pending/revenue counters maintained on every change (see stats.py)
+license_stats = stats.from_env(ES_DATA_DIR).attach(store)
+
+# Per-day/week/month activity rollups (see analytics.py)
+license_analytics = analytics.from_env(ES_DATA_DIR).attach(store)
+
+# HTML pages, loaded and compressed once (see pages.py)
+html_pages = pages.PageCache(os.path.dirname(os.path.abspath(__file__)), dev_mode=DEV_MODE, max_age=PAGE_MAX_AGE)
+html_pages.preload('register.html', 'payment.html', 'admin_dashboard.html', 'success.html')
+
+# Responses already sent for payment webhook events (see webhooks.py)
+seen_webhooks = webhooks.from_env(ES_DATA_DIR)
+
+# Received payment webhook events, processed in the background (see webhooks.py)
+webhook_queue = webhooks.queue_from_env(ES_DATA_DIR, lambda data: process_payment_event(data), seen=seen_webhooks)
+
+# Request counts and latency histograms, served on /metrics (see metrics.py)
+request_metrics = metrics.from_env(ES_DATA_DIR).init_app(app)
+
+# Shared Razorpay client and per-license order cache (see payments.py)
+razorpay_gateway = payments.from_env(ES_DATA_DIR)
+
+# Outbound email queue; the sender thread starts on first use (see mailer.py)
+mail_queue = mailer.from_env(ES_DATA_DIR)
+
+# Signs offline license tokens returned by /verify; None if no signing key is configured (see tokens.py)
+token_signer = tokens.from_env()
 
 def generate_license_key():
     """Generate a unique license key"""
     return f"ES-{secrets.token_hex(16).upper()}"
 
-def send_email(to_email, subject, body):
-    """Send email with license key"""
+def verified_response(response, entry, device_fingerprint):
+    """Add the client cache TTL and a signed offline token to a successful /verify response"""
+    response['cache_ttl'] = VERIFY_CACHE_TTL
+    if token_signer is not None:
+        response['token'], response['token_expires'] = token_signer.issue(entry, device_fingerprint)
+    return response
+
+def send_email(to_email, subject, body, html=None):
+    """Queue an email for background delivery; returns True once it is queued"""
     if not SMTP_USER or not SMTP_PASSWORD:
         print(f"SMTP not configured. Would send email to {to_email}: {subject}")
         return False
     
     try:
-        msg = MIMEMultipart()
-        msg['From'] = SMTP_USER
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain'))
-        
-        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT)
-        server.starttls()
-        server.login(SMTP_USER, SMTP_PASSWORD)
-        server.send_message(msg)
-        server.quit()
+        mail_queue.enqueue(to_email, subject, body, html)
         return True
     except Exception as e:
-        print(f"Error sending email: {e}")
+        print(f"Error queueing email: {e}")
         return False
 
 @app.route('/register', methods=['POST'])
@@ -104,6 +118,7 @@ def register():
     email = data.get('email', '').strip().lower()
     device_type = data.get('device_type', 'individual')  # 'individual' or 'organization'
     name = data.get('name', '').strip()  # Individual name or organization name
+    locale = data.get('locale') or emails.parse_accept_language(request.headers.get('Accept-Language'))
     
     if not email or '@' not in email:
         return jsonify({'error': 'Valid email required'}), 400
@@ -111,12 +126,13 @@ def register():
     if not name:
         return jsonify({'error': 'Name is required'}), 400
     
-    db = load_license_db()
-    
-    # Check if email already registered (prevent duplicate registrations/trials)
-    for key, entry in db.items():
-        existing_email = entry.get('email', '').strip().lower()
-        if existing_email == email:
+    # Hold the email lock so two concurrent registrations can't both pass the duplicate check
+    with store.lock_email(email):
+        # Check if email already registered (prevent duplicate registrations/trials)
+        existing = store.find_by_email(email)
+        if existing:
+            entry = existing[0]
+            key = entry.get('key')
             # Email already exists - check if it's active or pending
             if entry.get('active', False):
                 return jsonify({
@@ -133,29 +149,29 @@ def register():
                     'message': 'You have a pending registration. Please complete payment or contact support.'
                 }), 409
     
-    # Generate license key
-    license_key = generate_license_key()
-    
-    # Set device limit based on type
-    device_limit = 2 if device_type == 'individual' else 999999  # Unlimited for org
-    
-    # Create license entry (inactive until payment)
-    license_entry = {
-        'key': license_key,
-        'email': email.lower(),  # Store lowercase for consistency
-        'name': name,
-        'active': False,
-        'created': datetime.now().isoformat(),
-        'expires': None,  # Set after payment
-        'device_type': device_type,
-        'device_limit': device_limit,
-        'devices': [],
-        'payment_status': 'pending',
-        'trial_used': True  # Mark that this email has used registration (prevents free trial)
-    }
-    
-    db[license_key] = license_entry
-    save_license_db(db)
+        # Generate license key
+        license_key = generate_license_key()
+    
+        # Set device limit based on type
+        device_limit = 2 if device_type == 'individual' else 999999  # Unlimited for org
+    
+        # Create license entry (inactive until payment)
+        license_entry = {
+            'key': license_key,
+            'email': email.lower(),  # Store lowercase for consistency
+            'name': name,
+            'active': False,
+            'created': datetime.now().isoformat(),
+            'expires': None,  # Set after payment
+            'device_type': device_type,
+            'device_limit': device_limit,
+            'devices': [],
+            'payment_status': 'pending',
+            'trial_used': True,  # Mark that this email has used registration (prevents free trial)
+            'locale': locale  # Language for customer emails (see emails.py)
+        }
+    
+        store.put(license_entry)
     
     # Return registration success with payment redirect URL
     return jsonify({
@@ -174,51 +190,71 @@ def check_trial_eligibility():
     if not email or '@' not in email:
         return jsonify({'error': 'Valid email required'}), 400
     
-    db = load_license_db()
-    
     # Check if email has any registration (active or pending)
-    for key, entry in db.items():
-        existing_email = entry.get('email', '').strip().lower()
-        if existing_email == email:
-            return jsonify({
-                'eligible': False,
-                'reason': 'Email already registered',
-                'has_active': entry.get('active', False),
-                'has_pending': not entry.get('active', False) and entry.get('payment_status') == 'pending'
-            }), 200
+    existing = store.find_by_email(email)
+    if existing:
+        entry = existing[0]
+        return jsonify({
+            'eligible': False,
+            'reason': 'Email already registered',
+            'has_active': entry.get('active', False),
+            'has_pending': not entry.get('active', False) and entry.get('payment_status') == 'pending'
+        }), 200
     
     return jsonify({
         'eligible': True,
         'message': 'Email is eligible for free trial'
     }), 200
 
-@app.route('/verify', methods=['POST'])
-def verify():
-    """Verify license key and device fingerprint"""
-    data = request.get_json()
-    license_key = data.get('key', '').strip()
-    device_fingerprint = data.get('device_fingerprint', '').strip()
-    
-    if not license_key or not device_fingerprint:
-        return jsonify({'error': 'License key and device fingerprint required'}), 400
-    
-    db = load_license_db()
-    
-    if license_key not in db:
-        return jsonify({
+# Weight of each device signal the client reports (see get_device_identity in client/license.py)
+DEVICE_SIGNAL_WEIGHTS = {'machine_id': 0.4, 'product_uuid': 0.4, 'mac': 0.2}
+
+def device_signals(value):
+    """The known signal hashes from a request's device_signals, or {}"""
+    if not isinstance(value, dict):
+        return {}
+    return {name: str(value[name])[:128] for name in DEVICE_SIGNAL_WEIGHTS if value.get(name)}
+
+def device_similarity(a, b):
+    """Weight of the signals two devices both report and agree on, out of the weight of all signals (0.0-1.0).
+
+    Missing signals count against the match, so clones of one disk image (same
+    machine-id, nothing else in common) never reach DEVICE_MATCH_THRESHOLD.
+    """
+    matched = sum(weight for name, weight in DEVICE_SIGNAL_WEIGHTS.items()
+                  if a.get(name) and a.get(name) == b.get(name))
+    return matched / sum(DEVICE_SIGNAL_WEIGHTS.values())
+
+def matching_device(license_entry, signals):
+    """The registered fingerprint whose signals best match, if it scores DEVICE_MATCH_THRESHOLD"""
+    best, best_score = None, DEVICE_MATCH_THRESHOLD
+    known = license_entry.get('device_signals') or {}
+    for fingerprint in license_entry.get('devices', []):
+        if fingerprint in known:
+            score = device_similarity(known[fingerprint], signals)
+            if score >= best_score:
+                best, best_score = fingerprint, score
+    return best
+
+def check_license(license_entry, device_fingerprint, signals=None):
+    """Checks /verify makes before registering a device.
+
+    Returns (response, status), or None if the device still has to be registered
+    (or its signals recorded).
+    """
+    if license_entry is None:
+        return {
             'valid': False,
             'error': 'License key not found'
-        }), 404
-    
-    license_entry = db[license_key]
+        }, 404
     
     # Check if license is active
     if not license_entry.get('active', False):
-        return jsonify({
+        return {
             'valid': False,
             'error': 'License not activated. Payment pending.',
             'active': False
-        }), 403
+        }, 403
     
     # Check expiration
     expires = license_entry.get('expires')
@@ -226,47 +262,153 @@ def verify():
         try:
             exp_date = datetime.fromisoformat(expires)
             if datetime.now() > exp_date:
-                return jsonify({
+                return {
                     'valid': False,
                     'error': 'License expired',
                     'expired': True
-                }), 403
+                }, 403
         except:
             pass
     
-    # Check device limit
-    devices = license_entry.get('devices', [])
-    device_limit = license_entry.get('device_limit', 2)
-    
     # Check if device is already registered
-    if device_fingerprint in devices:
-        return jsonify({
+    if device_fingerprint in license_entry.get('devices', []):
+        if signals and (license_entry.get('device_signals') or {}).get(device_fingerprint) != signals:
+            return None
+        return verified_response({
             'valid': True,
             'active': True,
             'message': 'Device verified'
-        }), 200
+        }, license_entry, device_fingerprint), 200
     
-    # Check if device limit reached
-    if len(devices) >= device_limit:
-        return jsonify({
-            'valid': False,
-            'error': f'Device limit reached ({device_limit} devices)',
-            'device_limit': device_limit,
-            'registered_devices': len(devices)
-        }), 403
-    
-    # Register new device
-    devices.append(device_fingerprint)
-    license_entry['devices'] = devices
-    db[license_key] = license_entry
-    save_license_db(db)
+    return None
+
+def register_device(license_entry, device_fingerprint, signals=None):
+    """Add a device to a license entry (in place) if the device limit allows.
+
+    A fingerprint whose signals match a registered device takes over that
+    device's slot instead (same machine, reinstalled or with a changed part).
+    Call with the entry re-read under its license lock. Returns (response, status).
+    """
+    devices = license_entry.get('devices', [])
+    device_limit = license_entry.get('device_limit', 2)
+    message = 'Device registered successfully'
+    
+    if device_fingerprint not in devices:
+        previous = matching_device(license_entry, signals) if signals else None
+        if previous is not None:
+            devices[devices.index(previous)] = device_fingerprint
+            license_entry['device_signals'].pop(previous, None)
+            message = 'Device re-identified'
+        # Check if device limit reached
+        elif len(devices) >= device_limit:
+            return {
+                'valid': False,
+                'error': f'Device limit reached ({device_limit} devices)',
+                'device_limit': device_limit,
+                'registered_devices': len(devices)
+            }, 403
+        else:
+            devices.append(device_fingerprint)
+        license_entry['devices'] = devices
+    if signals:
+        license_entry.setdefault('device_signals', {})[device_fingerprint] = signals
     
-    return jsonify({
+    return verified_response({
         'valid': True,
         'active': True,
-        'message': 'Device registered successfully',
+        'message': message,
         'devices_registered': len(devices),
         'device_limit': device_limit
+    }, license_entry, device_fingerprint), 200
+
+@app.route('/verify', methods=['POST'])
+def verify():
+    """Verify license key and device fingerprint"""
+    data = request.get_json()
+    license_key = data.get('key', '').strip()
+    device_fingerprint = data.get('device_fingerprint', '').strip()
+    signals = device_signals(data.get('device_signals'))
+    
+    if not license_key or not device_fingerprint:
+        return jsonify({'error': 'License key and device fingerprint required'}), 400
+    
+    result = check_license(store.get(license_key), device_fingerprint, signals)
+    if result is not None:
+        return jsonify(result[0]), result[1]
+    
+    # Register new device under the license lock, re-reading the entry so a
+    # concurrent registration on another thread/worker isn't lost
+    with store.lock(license_key):
+        license_entry = store.get(license_key)
+        result = check_license(license_entry, device_fingerprint, signals)
+        if result is None:
+            result = register_device(license_entry, device_fingerprint, signals)
+            if result[1] == 200:
+                store.put(license_entry)
+    
+    return jsonify(result[0]), result[1]
+
+@app.route('/verify/batch', methods=['POST'])
+def verify_batch():
+    """Verify many (key, device fingerprint) pairs at once, e.g. a whole exam hall.
+
+    Every pair is checked against one read of the license DB, and all new device
+    registrations are committed in a single write.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'items must be a non-empty list of {key, device_fingerprint}'}), 400
+    if len(items) > VERIFY_BATCH_MAX:
+        return jsonify({'error': f'At most {VERIFY_BATCH_MAX} items per batch'}), 413
+    
+    pairs, signals = [], []
+    for item in items:
+        item = item if isinstance(item, dict) else {}
+        pairs.append((str(item.get('key') or '').strip(), str(item.get('device_fingerprint') or '').strip()))
+        signals.append(device_signals(item.get('device_signals')))
+    
+    results = [None] * len(pairs)
+    to_register = {}  # license key -> indexes of pairs whose device is new
+    entries = {}
+    for i, (license_key, device_fingerprint) in enumerate(pairs):
+        if not license_key or not device_fingerprint:
+            results[i] = ({'valid': False, 'error': 'License key and device fingerprint required'}, 400)
+            continue
+        if license_key not in entries:
+            entries[license_key] = store.get(license_key)
+        results[i] = check_license(entries[license_key], device_fingerprint, signals[i])
+        if results[i] is None:
+            to_register.setdefault(license_key, []).append(i)
+    
+    registered = 0
+    if to_register:
+        with store.lock_many(to_register):
+            changed = []
+            for license_key, indexes in to_register.items():
+                # Re-read under the lock; the license may have changed since the first pass
+                license_entry = store.get(license_key)
+                added = updated = 0
+                for i in indexes:
+                    device_fingerprint = pairs[i][1]
+                    results[i] = check_license(license_entry, device_fingerprint, signals[i])
+                    if results[i] is None:
+                        new = device_fingerprint not in license_entry.get('devices', [])
+                        results[i] = register_device(license_entry, device_fingerprint, signals[i])
+                        added += new and results[i][1] == 200
+                        updated += results[i][1] == 200
+                registered += added
+                if updated:
+                    changed.append(license_entry)
+            if changed:
+                store.put_many(changed)
+    
+    return jsonify({
+        'results': [
+            dict(response, key=license_key, device_fingerprint=device_fingerprint, status=status)
+            for (license_key, device_fingerprint), (response, status) in zip(pairs, results)
+        ],
+        'registered': registered
     }), 200
 
 @app.route('/webhook/payment', methods=['POST'])
@@ -291,8 +433,29 @@ def payment_webhook():
                 'hint': 'Make sure WEBHOOK_SECRET matches in both client and server'
             }), 401
     
-    data = request.get_json()
-    
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'JSON object body required'}), 400
+    
+    # Activation happens on the webhook workers; acknowledge as soon as the event is stored
+    event = webhooks.event_id(data, request.headers)
+    if event is None:
+        return jsonify({'accepted': True, 'queued': webhook_queue.enqueue(None, data)}), 202
+    with seen_webhooks.lock(event):
+        # Provider retries of an event already received get the original response
+        seen = seen_webhooks.get(event)
+        if seen is not None:
+            status, body = seen
+            return Response(body, status, mimetype='application/json', headers={'X-Webhook-Replayed': 'true'})
+        response = jsonify({'accepted': True, 'queued': webhook_queue.enqueue(event, data)})
+        seen_webhooks.put(event, 202, response.get_data(as_text=True))
+    return response, 202
+
+def process_payment_event(data):
+    """Activate the pending license paid for by a webhook event (run by the webhook workers).
+
+    Returns (result, status); see webhooks.EventQueue.
+    """
     # Extract payment information (generic format)
     payment_status = data.get('status') or data.get('payment_status') or data.get('event')
     customer_email = data.get('email') or data.get('customer_email') or data.get('customer', {}).get('email')
@@ -302,103 +465,67 @@ def payment_webhook():
     # Check if payment is successful
     success_statuses = ['paid', 'payment.succeeded', 'payment.captured', 'success', 'completed']
     if payment_status not in success_statuses:
-        return jsonify({
+        return {
             'message': 'Payment not successful',
             'status': payment_status
-        }), 200
+        }, 200
     
     if not customer_email:
-        return jsonify({'error': 'Customer email not found in webhook'}), 400
+        return {'error': 'Customer email not found in webhook'}, 400
     
     # Find license by email and activate it
-    db = load_license_db()
     activated = False
     activated_entry = None
     
-    for key, entry in db.items():
-        if entry.get('email', '').lower() == customer_email.lower() and not entry.get('active', False):
-            # Activate license
-            activation_date = datetime.now()
-            expiry_date = activation_date + timedelta(days=365)  # 1 year validity
-            
-            entry['active'] = True
-            entry['activated'] = activation_date.isoformat()
-            entry['expires'] = expiry_date.isoformat()
-            entry['transaction_id'] = transaction_id
-            entry['payment_amount'] = amount
-            entry['payment_status'] = 'completed'
-            db[key] = entry
-            activated = True
-            activated_entry = entry
-            break
+    with store.lock_email(customer_email):
+        # A payment that already activated a license (a redelivery after the
+        # seen-events TTL, or one confirmed via /verify-payment) activates nothing else
+        paid = store.find_by_transaction(transaction_id)
+        if paid is not None:
+            return {
+                'message': 'Payment already processed',
+                'license_key': paid['key']
+            }, 200
+        
+        for entry in store.find_by_email(customer_email):
+            if not entry.get('active', False):
+                with store.lock(entry['key']):
+                    # Re-read under the license lock so concurrent updates aren't overwritten
+                    entry = store.get(entry['key'])
+                    if entry.get('active', False):
+                        continue  # Activated meanwhile (e.g. via /verify-payment)
+                    
+                    # Activate license
+                    activation_date = datetime.now()
+                    expiry_date = activation_date + timedelta(days=365)  # 1 year validity
+                    
+                    entry['active'] = True
+                    entry['activated'] = activation_date.isoformat()
+                    entry['expires'] = expiry_date.isoformat()
+                    entry['transaction_id'] = transaction_id
+                    entry['payment_amount'] = amount
+                    entry['payment_status'] = 'completed'
+                    store.put(entry)
+                activated = True
+                activated_entry = entry
+                break
     
     if activated and activated_entry:
-        save_license_db(db)
-        
         # Send license email with all details
         license_key = activated_entry.get('key')
-        name = activated_entry.get('name', 'Customer')
-        device_type = activated_entry.get('device_type', 'individual')
-        activation_date_str = activation_date.strftime('%B %d, %Y')
-        expiry_date_str = expiry_date.strftime('%B %d, %Y')
+        email_sent = send_license_email(activated_entry, activation_date, expiry_date, transaction_id)
         
-        email_subject = f"Your ExamShield License is Activated - {license_key}"
-        email_body = f"""Dear {name},
-
-Thank you for your purchase! Your ExamShield license has been successfully activated.
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-
-LICENSE DETAILS:
-
-License Key: {license_key}
-License Type: {device_type.title()}
-Device Limit: {'2 devices' if device_type == 'individual' else 'Unlimited devices'}
-
-Activation Date: {activation_date_str}
-Expiry Date: {expiry_date_str}
-Validity Period: 1 Year
-
-Transaction ID: {transaction_id}
-Payment Amount: ${amount if amount else 'N/A'}
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-
-NEXT STEPS:
-
-1. Download ExamShield from: https://adulsportfolio.vercel.app/shop
-2. During installation, enter your License Key: {license_key}
-3. Your license will be automatically verified and activated
-
-IMPORTANT NOTES:
-
-• Keep this email safe - you'll need your license key for installation
-• Your license is valid for 1 year from the activation date
-• You can use this license on {'2 devices' if device_type == 'individual' else 'unlimited devices'}
-• If you need support, contact us with your license key
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-
-Thank you for choosing ExamShield!
-
-Best regards,
-ExamShield Team
-https://adulsportfolio.vercel.app/shop
-"""
-        
-        email_sent = send_email(customer_email, email_subject, email_body)
-        
-        return jsonify({
+        return {
             'success': True,
             'message': 'License activated successfully',
             'email_sent': email_sent,
             'license_key': license_key
-        }), 200
+        }, 200
     else:
-        return jsonify({
+        return {
             'message': 'No pending license found for this email',
             'email': customer_email
-        }), 200
+        }, 200
 
 @app.route('/admin/revoke', methods=['GET'])
 def admin_revoke():
@@ -413,14 +540,15 @@ def admin_revoke():
     if not license_key:
         return jsonify({'error': 'License key required'}), 400
     
-    db = load_license_db()
+    with store.lock(license_key):
+        entry = store.get(license_key)
     
-    if license_key not in db:
-        return jsonify({'error': 'License key not found'}), 404
+        if entry is None:
+            return jsonify({'error': 'License key not found'}), 404
     
-    db[license_key]['active'] = False
-    db[license_key]['revoked'] = datetime.now().isoformat()
-    save_license_db(db)
+        entry['active'] = False
+        entry['revoked'] = datetime.now().isoformat()
+        store.put(entry)
     
     return jsonify({
         'success': True,
@@ -429,54 +557,90 @@ def admin_revoke():
 
 @app.route('/admin/reports', methods=['GET'])
 def admin_reports():
-    """Get purchase reports and statistics"""
+    """Get purchase reports and statistics, one page at a time.
+
+    Query params (all optional): status (comma list of active, pending, expired,
+    revoked, inactive), device_type, from/to (ISO dates, applied to date_field:
+    created, activated or expires), q (search key/email/name), sort (created,
+    activated, expires, email, name, key or payment_amount; prefix - for
+    descending), limit (max 1000) and cursor (next_cursor of the previous page).
+    """
     admin_secret = request.args.get('secret', '')
     
     if admin_secret != os.getenv('ADMIN_SECRET', 'admin-secret-change-me'):
         return jsonify({'error': 'Unauthorized'}), 401
     
-    db = load_license_db()
-    
-    reports = []
-    stats = {
-        'total': 0,
-        'active': 0,
-        'pending': 0,
-        'revenue': 0.0
-    }
-    
-    for key, entry in db.items():
-        reports.append({
-            'key': entry.get('key'),
-            'name': entry.get('name'),
-            'email': entry.get('email'),
-            'device_type': entry.get('device_type'),
-            'active': entry.get('active', False),
-            'activated': entry.get('activated'),
-            'expires': entry.get('expires'),
-            'created': entry.get('created'),
-            'payment_amount': entry.get('payment_amount', 0),
-            'payment_status': entry.get('payment_status', 'pending'),
-            'transaction_id': entry.get('transaction_id')
-        })
-        
-        stats['total'] += 1
-        if entry.get('active', False):
-            stats['active'] += 1
-        elif entry.get('payment_status') == 'pending':
-            stats['pending'] += 1
-        
-        amount = entry.get('payment_amount', 0)
-        if amount:
-            try:
-                stats['revenue'] += float(amount)
-            except:
-                pass
+    try:
+        query = reports.ReportQuery.from_args(request.args)
+    except reports.ReportQueryError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify({
-        'reports': reports,
-        'stats': stats
-    }), 200
+    result = reports.page(query, store.items())
+    result['stats'] = license_stats.read()
+    return jsonify(result), 200
+
+@app.route('/admin/reports/export', methods=['GET'])
+def admin_reports_export():
+    """Stream every license matching the /admin/reports filters as NDJSON or CSV (format=ndjson|csv).
+
+    Rows are generated while the response is sent, in store (creation) order.
+    """
+    admin_secret = request.args.get('secret', '')
+    
+    if admin_secret != os.getenv('ADMIN_SECRET', 'admin-secret-change-me'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    try:
+        query = reports.ReportQuery.from_args(request.args)
+    except reports.ReportQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    rows = query.rows(store.items())
+    if export_format == 'csv':
+        body, mimetype = reports.export_csv(rows), 'text/csv'
+    else:
+        body, mimetype = reports.export_ndjson(rows), 'application/x-ndjson'
+    filename = f"examshield-reports-{datetime.now().strftime('%Y-%m-%d')}.{export_format}"
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/admin/analytics', methods=['GET'])
+def admin_analytics():
+    """Registrations, activations, trials, revocations and revenue per period.
+
+    Query params: period (day, week or month), from/to (ISO dates; default the
+    last 30 days, 12 weeks or 12 months).
+    """
+    admin_secret = request.args.get('secret', '')
+    
+    if admin_secret != os.getenv('ADMIN_SECRET', 'admin-secret-change-me'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        start = request.args.get('from')
+        end = request.args.get('to')
+        result = license_analytics.series(
+            request.args.get('period', 'day'),
+            datetime.fromisoformat(start).date() if start else None,
+            datetime.fromisoformat(end).date() if end else None
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(result), 200
+
+@app.route('/admin/webhooks', methods=['GET'])
+def admin_webhooks():
+    """Webhook queue depth: queued and dead events, and the oldest queued event's age"""
+    admin_secret = request.args.get('secret', '')
+    
+    if admin_secret != os.getenv('ADMIN_SECRET', 'admin-secret-change-me'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return jsonify(webhook_queue.status()), 200
 
 @app.route('/public/reports', methods=['GET'])
 def public_reports():
@@ -487,15 +651,12 @@ def public_reports():
     if not public_enabled:
         return jsonify({'error': 'Public reports are disabled'}), 403
     
-    db = load_license_db()
-    
     # Only return count, no sensitive data
-    total = len(db)
-    active = sum(1 for entry in db.values() if entry.get('active', False))
+    counters = license_stats.read()
     
     return jsonify({
-        'total_licenses': total,
-        'active_licenses': active,
+        'total_licenses': counters['total'],
+        'active_licenses': counters['active'],
         'last_updated': datetime.now().isoformat()
     }), 200
 
@@ -512,23 +673,24 @@ def admin_extend():
     if not license_key:
         return jsonify({'error': 'License key required'}), 400
     
-    db = load_license_db()
+    with store.lock(license_key):
+        entry = store.get(license_key)
     
-    if license_key not in db:
-        return jsonify({'error': 'License key not found'}), 404
+        if entry is None:
+            return jsonify({'error': 'License key not found'}), 404
     
-    current_expires = db[license_key].get('expires')
-    if current_expires:
-        try:
-            exp_date = datetime.fromisoformat(current_expires)
-            new_expires = exp_date + timedelta(days=days)
-        except:
+        current_expires = entry.get('expires')
+        if current_expires:
+            try:
+                exp_date = datetime.fromisoformat(current_expires)
+                new_expires = exp_date + timedelta(days=days)
+            except:
+                new_expires = datetime.now() + timedelta(days=days)
+        else:
             new_expires = datetime.now() + timedelta(days=days)
-    else:
-        new_expires = datetime.now() + timedelta(days=days)
     
-    db[license_key]['expires'] = new_expires.isoformat()
-    save_license_db(db)
+        entry['expires'] = new_expires.isoformat()
+        store.put(entry)
     
     return jsonify({
         'success': True,
@@ -539,38 +701,22 @@ def admin_extend():
 @app.route('/register-page', methods=['GET'])
 def register_page():
     """Serve registration HTML page"""
-    html_path = os.path.join(os.path.dirname(__file__), 'register.html')
-    if os.path.exists(html_path):
-        with open(html_path, 'r') as f:
-            return f.read(), 200, {'Content-Type': 'text/html'}
-    return '<h1>Registration page not found</h1>', 404
+    return html_pages.serve('register.html', '<h1>Registration page not found</h1>')
 
 @app.route('/payment', methods=['GET'])
 def payment_page():
     """Serve payment HTML page"""
-    html_path = os.path.join(os.path.dirname(__file__), 'payment.html')
-    if os.path.exists(html_path):
-        with open(html_path, 'r') as f:
-            return f.read(), 200, {'Content-Type': 'text/html'}
-    return '<h1>Payment page not found</h1>', 404
+    return html_pages.serve('payment.html', '<h1>Payment page not found</h1>')
 
 @app.route('/admin', methods=['GET'])
 def admin_dashboard():
     """Serve admin dashboard HTML page"""
-    html_path = os.path.join(os.path.dirname(__file__), 'admin_dashboard.html')
-    if os.path.exists(html_path):
-        with open(html_path, 'r') as f:
-            return f.read(), 200, {'Content-Type': 'text/html'}
-    return '<h1>Admin dashboard not found</h1>', 404
+    return html_pages.serve('admin_dashboard.html', '<h1>Admin dashboard not found</h1>')
 
 @app.route('/success', methods=['GET'])
 def success_page():
     """Serve success page after payment"""
-    html_path = os.path.join(os.path.dirname(__file__), 'success.html')
-    if os.path.exists(html_path):
-        with open(html_path, 'r') as f:
-            return f.read(), 200, {'Content-Type': 'text/html'}
-    return '<h1>Success page not found</h1>', 404
+    return html_pages.serve('success.html', '<h1>Success page not found</h1>')
 
 @app.route('/license-info', methods=['GET'])
 def license_info():
@@ -580,12 +726,11 @@ def license_info():
     if not license_key:
         return jsonify({'error': 'License key required'}), 400
     
-    db = load_license_db()
+    entry = store.get(license_key)
     
-    if license_key not in db:
+    if entry is None:
         return jsonify({'error': 'License key not found'}), 404
     
-    entry = db[license_key]
     return jsonify({
         'key': entry.get('key'),
         'name': entry.get('name'),
@@ -598,7 +743,7 @@ def license_info():
 @app.route('/payment-config', methods=['GET'])
 def payment_config():
     """Return payment provider availability to toggle UI buttons"""
-    razorpay_enabled = bool(os.getenv('RAZORPAY_KEY_ID')) and bool(os.getenv('RAZORPAY_KEY_SECRET'))
+    razorpay_enabled = razorpay_gateway.configured
     stripe_enabled = False  # Placeholder until implemented
     return jsonify({
         'razorpay_enabled': razorpay_enabled,
@@ -617,11 +762,10 @@ def create_razorpay_order():
         return jsonify({'error': 'License key required'}), 400
     
     # Load license to get device type and determine price
-    db = load_license_db()
-    if license_key not in db:
+    license_entry = store.get(license_key)
+    if license_entry is None:
         return jsonify({'error': 'License key not found'}), 404
     
-    license_entry = db[license_key]
     device_type = license_entry.get('device_type', 'individual')
     
     # Set amount based on license type if not provided
@@ -632,32 +776,19 @@ def create_razorpay_order():
             amount = 9999   # $99.99 in paise (₹99.99)
     
     # Check if Razorpay is configured
-    razorpay_key_id = os.getenv('RAZORPAY_KEY_ID', '')
-    razorpay_key_secret = os.getenv('RAZORPAY_KEY_SECRET', '')
-    
-    if not razorpay_key_id or not razorpay_key_secret:
+    if not razorpay_gateway.configured:
         return jsonify({
             'error': 'Razorpay not configured',
             'message': 'Please configure RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET in .env file'
         }), 500
     
     try:
-        import razorpay
-        client = razorpay.Client(auth=(razorpay_key_id, razorpay_key_secret))
-        
-        order = client.order.create({
-            'amount': amount,
-            'currency': currency,
-            'receipt': license_key,
-            'notes': {
-                'license_key': license_key,
-                'product': 'ExamShield License'
-            }
-        })
+        # Repeated clicks get the license's existing unpaid order back
+        order = razorpay_gateway.order_for(license_entry, amount, currency)
         
         return jsonify({
             'order_id': order['id'],
-            'razorpay_key': razorpay_key_id,
+            'razorpay_key': razorpay_gateway.key_id,
             'amount': amount,
             'currency': currency
         }), 200
@@ -683,21 +814,17 @@ def verify_payment():
     if not license_key:
         return jsonify({'error': 'License key required'}), 400
     
-    db = load_license_db()
+    entry = store.get(license_key)
     
-    if license_key not in db:
+    if entry is None:
         return jsonify({'error': 'License key not found'}), 404
     
     # Verify payment based on provider
     if provider == 'razorpay':
-        razorpay_key_secret = os.getenv('RAZORPAY_KEY_SECRET', '')
-        if not razorpay_key_secret:
+        if not razorpay_gateway.configured:
             return jsonify({'error': 'Razorpay not configured'}), 500
         
         try:
-            import razorpay
-            client = razorpay.Client(auth=(os.getenv('RAZORPAY_KEY_ID'), razorpay_key_secret))
-            
             # Verify payment signature
             params_dict = {
                 'razorpay_order_id': payment_response.get('razorpay_order_id'),
@@ -705,38 +832,39 @@ def verify_payment():
                 'razorpay_signature': payment_response.get('razorpay_signature')
             }
             
-            client.utility.verify_payment_signature(params_dict)
+            razorpay_gateway.verify_payment_signature(params_dict)
             
-            # Payment verified - activate license via webhook simulation
-            entry = db[license_key]
-            customer_email = entry.get('email', '')
-            device_type = entry.get('device_type', 'individual')
+            with store.lock(license_key):
+                # Payment verified - activate license via webhook simulation
+                # (re-read under the license lock so concurrent updates aren't overwritten)
+                entry = store.get(license_key)
+                customer_email = entry.get('email', '')
+                device_type = entry.get('device_type', 'individual')
             
-            # Get payment amount based on device type
-            payment_amount = entry.get('payment_amount')
-            if not payment_amount:
-                payment_amount = 299.99 if device_type == 'organization' else 99.99
-                entry['payment_amount'] = payment_amount
+                # Get payment amount based on device type
+                payment_amount = entry.get('payment_amount')
+                if not payment_amount:
+                    payment_amount = 299.99 if device_type == 'organization' else 99.99
+                    entry['payment_amount'] = payment_amount
             
-            # Simulate webhook call
-            webhook_data = {
-                'status': 'paid',
-                'email': customer_email,
-                'id': payment_response.get('razorpay_payment_id'),
-                'amount': payment_amount
-            }
+                # Simulate webhook call
+                webhook_data = {
+                    'status': 'paid',
+                    'email': customer_email,
+                    'id': payment_response.get('razorpay_payment_id'),
+                    'amount': payment_amount
+                }
             
-            # Activate license (reuse webhook logic)
-            activation_date = datetime.now()
-            expiry_date = activation_date + timedelta(days=365)
+                # Activate license (reuse webhook logic)
+                activation_date = datetime.now()
+                expiry_date = activation_date + timedelta(days=365)
             
-            entry['active'] = True
-            entry['activated'] = activation_date.isoformat()
-            entry['expires'] = expiry_date.isoformat()
-            entry['transaction_id'] = payment_response.get('razorpay_payment_id')
-            entry['payment_status'] = 'completed'
-            db[license_key] = entry
-            save_license_db(db)
+                entry['active'] = True
+                entry['activated'] = activation_date.isoformat()
+                entry['expires'] = expiry_date.isoformat()
+                entry['transaction_id'] = payment_response.get('razorpay_payment_id')
+                entry['payment_status'] = 'completed'
+                store.put(entry)
             
             # Send email
             send_license_email(entry, activation_date, expiry_date, payment_response.get('razorpay_payment_id'))
@@ -757,64 +885,31 @@ def verify_payment():
     return jsonify({'error': 'Unsupported payment provider'}), 400
 
 def send_license_email(entry, activation_date, expiry_date, transaction_id):
-    """Helper function to send license email"""
-    license_key = entry.get('key')
-    name = entry.get('name', 'Customer')
-    device_type = entry.get('device_type', 'individual')
-    customer_email = entry.get('email')
-    # Get payment amount from entry or set default based on device type
-    amount = entry.get('payment_amount')
-    if not amount:
-        amount = 299.99 if device_type == 'organization' else 99.99
-    
-    activation_date_str = activation_date.strftime('%B %d, %Y')
-    expiry_date_str = expiry_date.strftime('%B %d, %Y')
-    
-    email_subject = f"Your ExamShield License is Activated - {license_key}"
-    email_body = f"""Dear {name},
-
-Thank you for your purchase! Your ExamShield license has been successfully activated.
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-
-LICENSE DETAILS:
-
-License Key: {license_key}
-License Type: {device_type.title()}
-Device Limit: {'2 devices' if device_type == 'individual' else 'Unlimited devices'}
-
-Activation Date: {activation_date_str}
-Expiry Date: {expiry_date_str}
-Validity Period: 1 Year
-
-Transaction ID: {transaction_id}
-Payment Amount: ${amount if amount else 'N/A'}
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-
-NEXT STEPS:
-
-1. Download ExamShield from: https://adulsportfolio.vercel.app/shop
-2. During installation, enter your License Key: {license_key}
-3. Your license will be automatically verified and activated
-
-IMPORTANT NOTES:
-
-• Keep this email safe - you'll need your license key for installation
-• Your license is valid for 1 year from the activation date
-• You can use this license on {'2 devices' if device_type == 'individual' else 'unlimited devices'}
-• If you need support, contact us with your license key
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-
-Thank you for choosing ExamShield!
-
-Best regards,
-ExamShield Team
-https://adulsportfolio.vercel.app/shop
-"""
-    
-    send_email(customer_email, email_subject, email_body)
+    """Send the license activation email; returns True once it is queued"""
+    subject, body, html = emails.render(
+        'activation', entry.get('locale'),
+        name=entry.get('name', 'Customer'),
+        license_key=entry.get('key'),
+        device_type=entry.get('device_type', 'individual'),
+        activation_date=activation_date.strftime('%B %d, %Y'),
+        expiry_date=expiry_date.strftime('%B %d, %Y'),
+        transaction_id=transaction_id,
+        amount=entry.get('payment_amount'),
+        shop_url=SHOP_URL,
+    )
+    return send_email(entry.get('email'), subject, body, html)
+
+def send_trial_email(entry, trial_start, trial_end):
+    """Send the free trial started email; returns True once it is queued"""
+    subject, body, html = emails.render(
+        'trial', entry.get('locale'),
+        name=entry.get('name', 'Customer'),
+        device_type=entry.get('device_type', 'individual'),
+        trial_started=trial_start.strftime('%B %d, %Y'),
+        trial_expires=trial_end.strftime('%B %d, %Y'),
+        shop_url=SHOP_URL,
+    )
+    return send_email(entry.get('email'), subject, body, html)
 
 @app.route('/activate-trial', methods=['POST'])
 def activate_trail():
@@ -823,62 +918,64 @@ def activate_trail():
     license_key = (data or {}).get('license_key', '').strip()
     if not license_key:
         return jsonify({'error': 'License key required'}), 400
-    db = load_license_db()
-    if license_key not in db:
-        return jsonify({'error': 'License key not found'}), 404
-    entry = db[license_key]
-    if entry.get('active', False):
-        return jsonify({'error': 'License already active'}), 400
-    if entry.get('trial_active', False):
-        return jsonify({'error': 'Trial already activated for this license'}), 400
-    # Activate trial (client will enforce; server records for reporting)
-    trial_start = datetime.now()
-    trial_end = trial_start + timedelta(days=7)
-    entry['trial_active'] = True
-    entry['trial_started'] = trial_start.isoformat()
-    entry['trial_expires'] = trial_end.isoformat()
-    db[license_key] = entry
-    save_license_db(db)
+    with store.lock(license_key):
+        entry = store.get(license_key)
+        if entry is None:
+            return jsonify({'error': 'License key not found'}), 404
+        if entry.get('active', False):
+            return jsonify({'error': 'License already active'}), 400
+        if entry.get('trial_active', False):
+            return jsonify({'error': 'Trial already activated for this license'}), 400
+        # Activate trial (client will enforce; server records for reporting)
+        trial_start = datetime.now()
+        trial_end = trial_start + timedelta(days=7)
+        entry['trial_active'] = True
+        entry['trial_started'] = trial_start.isoformat()
+        entry['trial_expires'] = trial_end.isoformat()
+        store.put(entry)
     # Send email with trial details
     try:
-        name = entry.get('name', 'Customer')
-        customer_email = entry.get('email')
-        device_type = entry.get('device_type', 'individual')
-        email_subject = f"Your ExamShield Free Trial Started"
-        email_body = f"""Dear {name},
-
-Your 7-day free trial for ExamShield has started.
-
-TRIAL DETAILS:
-
-License Type: {device_type.title()}
-Trial Started: {trial_start.strftime('%B %d, %Y')}
-Trial Expires: {trial_end.strftime('%B %d, %Y')}
-
-NEXT STEPS:
-1. Download ExamShield from: https://adulsportfolio.vercel.app/shop
-2. Install normally. The client will allow usage in trial mode for 7 days.
-3. You can purchase anytime to activate a full license.
-
-Thank you for trying ExamShield!
-
-Best regards,
-ExamShield Team
-https://adulsportfolio.vercel.app/shop
-"""
-        send_email(customer_email, email_subject, email_body)
+        send_trial_email(entry, trial_start, trial_end)
     except Exception:
         pass
     return jsonify({'success': True, 'message': 'Free trial activated', 'trial_expires': entry['trial_expires']}), 200
 
+def init_worker():
+    """Per-process setup for multi-worker servers (called from gunicorn's post_fork hook).
+
+    Nothing opened at import time is shared with the forked master: SQLite
+    connections and lock files are reopened per process on first use. Workers
+    start from a fresh view of the license DB rather than the master's cache,
+    and each runs a mail sender thread and a webhook dispatcher to work through
+    mail and payment events queued before a restart.
+    """
+    store.refresh()
+    webhook_queue.start()
+    if SMTP_USER and SMTP_PASSWORD:
+        mail_queue.start()
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({'status': 'ok', 'service': 'ExamShield License Server'}), 200
+    return jsonify({
+        'status': 'ok',
+        'service': 'ExamShield License Server',
+        'storage': STORAGE_BACKEND,
+        'cache': store.cache_stats(),
+        'webhook_queue': webhook_queue.status()
+    }), 200
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request and phase metrics of every server process, in Prometheus text format"""
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     print(f"Starting ExamShield License Server on {FLASK_HOST}:{PORT}")
-    print(f"License DB: {LICENSE_DB_PATH}")
+    print(f"License DB: {store.path} (backend: {STORAGE_BACKEND})")
     print(f"Debug mode: {DEBUG}")
+    webhook_queue.start()
+    if SMTP_USER and SMTP_PASSWORD:
+        mail_queue.start()
     app.run(host=FLASK_HOST, port=PORT, debug=DEBUG)
 
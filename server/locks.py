@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+ExamShield License Server Locks
+File locks that work across threads and processes (e.g. several gunicorn
+workers sharing one data directory), and striped per-key locks built on them.
+"""
+
+import os
+import zlib
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Exclusive advisory lock on a lock file.
+
+    Reentrant within a thread; other threads block on an in-process lock and
+    other processes block on the OS file lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+        self._pid = None
+
+    def _open(self):
+        # Lock files are opened once per process; a forked worker must not reuse its parent's descriptor
+        if self._fd is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        return self._fd
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        try:
+            if self._depth == 0:
+                fd = self._open()
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            self._depth += 1
+        except Exception:
+            self._thread_lock.release()
+            raise
+
+    def release(self):
+        try:
+            self._depth -= 1
+            if self._depth == 0:
+                if fcntl:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(self._fd, 0, os.SEEK_SET)
+                    msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class KeyLocks:
+    """Per-key locks, striped over a fixed set of lock files.
+
+    Unrelated keys almost always land on different stripes, so they don't
+    serialize; the same key always maps to the same stripe in every process.
+    """
+
+    def __init__(self, lock_dir, prefix='key', stripes=64):
+        self.stripes = [FileLock(os.path.join(lock_dir, f'{prefix}-{i:02d}.lock')) for i in range(stripes)]
+
+    def _index(self, key):
+        return zlib.crc32((key or '').encode()) % len(self.stripes)
+
+    def __call__(self, key):
+        return self.stripes[self._index(key)]
+
+    def many(self, keys):
+        """The distinct locks covering several keys, in a fixed (stripe) order"""
+        return [self.stripes[i] for i in sorted({self._index(key) for key in keys})]
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+ExamShield License Mailer
+Persistent outbound email queue drained by a background sender thread.
+
+Messages are spooled as one JSON file each under <ES_DATA_DIR>/mail/outbox, so
+they survive restarts (see spool.py). The sender keeps a single SMTP session open across
+messages, sends whatever is due in batches, retries failures with exponential
+backoff and moves messages that keep failing to mail/dead.
+
+Usage:
+    python mailer.py status
+    python mailer.py requeue     # move dead letters back to the outbox
+"""
+
+import os
+import sys
+import time
+import smtplib
+import argparse
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+from metrics import phase
+from spool import SpoolQueue
+
+
+class SMTPSession:
+    """One long-lived, lazily (re)connected SMTP session"""
+
+    def __init__(self, host, port, user, password, idle_timeout=60, factory=smtplib.SMTP):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.idle_timeout = idle_timeout
+        self.factory = factory
+        self._smtp = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        smtp = self.factory(self.host, self.port, timeout=30)
+        smtp.starttls()
+        smtp.login(self.user, self.password)
+        return smtp
+
+    def send(self, msg):
+        """Send a message, reconnecting once if the server dropped the session"""
+        with phase('smtp'):
+            if self._smtp is None:
+                self._smtp = self._connect()
+            try:
+                self._smtp.send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                self._smtp = self._connect()
+                self._smtp.send_message(msg)
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self):
+        """Close the session once it has been idle for idle_timeout seconds"""
+        if self._smtp is not None and time.monotonic() - self._last_used >= self.idle_timeout:
+            self.close()
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+
+class MailQueue(SpoolQueue):
+    """Spool directory of outgoing messages plus the thread that sends them"""
+
+    thread_name = 'mail-sender'
+
+    def __init__(self, mail_dir, session, sender, batch_size=20, max_attempts=8,
+                 retry_base=30, retry_max=3600, poll_interval=5):
+        super().__init__(mail_dir, 'outbox', 'sender.lock', max_attempts=max_attempts,
+                         retry_base=retry_base, retry_max=retry_max, poll_interval=poll_interval)
+        self.session = session
+        self.sender = sender
+        self.batch_size = batch_size
+
+    def enqueue(self, to_email, subject, body, html=None):
+        """Durably queue a message and wake the sender. Returns the message id."""
+        return self._spool({'to': to_email, 'subject': subject, 'body': body, 'html': html})
+
+    def describe(self, message):
+        return f"email to {message['to']}"
+
+    def drain(self):
+        """Send every due message in the outbox. Returns the number sent."""
+        sent = 0
+        with self._drain_lock:
+            while True:
+                batch = self._messages(due_only=True, limit=self.batch_size)
+                if not batch:
+                    break
+                for path, message in batch:
+                    if self._deliver(path, message):
+                        sent += 1
+                if len(batch) < self.batch_size:
+                    break
+            self.session.close_if_idle()
+        return sent
+
+    def _build(self, message):
+        msg = MIMEMultipart('alternative') if message.get('html') else MIMEMultipart()
+        msg['From'] = self.sender
+        msg['To'] = message['to']
+        msg['Subject'] = message['subject']
+        msg.attach(MIMEText(message['body'], 'plain', 'utf-8'))
+        if message.get('html'):
+            msg.attach(MIMEText(message['html'], 'html', 'utf-8'))
+        return msg
+
+    def _deliver(self, path, message):
+        try:
+            self.session.send(self._build(message))
+        except Exception as e:
+            # Drop the session; it may be what's broken
+            self.session.close()
+            self._retry_later(path, message, e)
+            return False
+        os.remove(path)
+        return True
+
+
+def from_env(data_dir):
+    """Build the mail queue for a data directory from SMTP_* and ES_MAIL_* settings"""
+    user = os.getenv('SMTP_USER', '')
+    session = SMTPSession(
+        os.getenv('SMTP_HOST', 'smtp.gmail.com'),
+        int(os.getenv('SMTP_PORT', '587')),
+        user,
+        os.getenv('SMTP_PASSWORD', ''),
+        idle_timeout=int(os.getenv('ES_MAIL_IDLE_TIMEOUT', '60')),
+    )
+    return MailQueue(
+        os.path.join(data_dir, 'mail'),
+        session,
+        sender=user,
+        batch_size=int(os.getenv('ES_MAIL_BATCH_SIZE', '20')),
+        max_attempts=int(os.getenv('ES_MAIL_MAX_ATTEMPTS', '8')),
+        retry_base=int(os.getenv('ES_MAIL_RETRY_BASE', '30')),
+        poll_interval=int(os.getenv('ES_MAIL_POLL_INTERVAL', '5')),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ExamShield outbound mail queue')
+    parser.add_argument('command', choices=['status', 'requeue'])
+    args = parser.parse_args()
+
+    queue = from_env(os.getenv('ES_DATA_DIR', './data'))
+    if args.command == 'status':
+        status = queue.status()
+        print(f"Queued: {status['queued']}  Dead letters: {status['dead']}")
+    else:
+        print(f"Requeued {queue.requeue_dead()} messages")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+ExamShield License Server Metrics
+Request counts, status codes and latency histograms, served on /metrics in the
+Prometheus text format.
+
+Every request is counted by endpoint (the route pattern, e.g. /verify), method
+and status, and timed as a whole. Code paths that do slow work time it as a
+phase with `with metrics.phase('db_load'):`; phases are attributed to the
+endpoint of the request being handled, or to "background" when they run on a
+worker thread (mail sender, webhook workers). Phases in use: db_load, db_save,
+smtp, provider.
+
+Metrics are kept per process. With several server processes (gunicorn workers),
+each one periodically writes its own to <ES_DATA_DIR>/metrics/<pid>.json and
+/metrics adds them up, so any worker can answer the scrape.
+"""
+
+import os
+import json
+import time
+import threading
+import contextlib
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUESTS = 'es_http_requests_total'
+REQUEST_DURATION = 'es_http_request_duration_seconds'
+PHASE_DURATION = 'es_phase_duration_seconds'
+
+HELP = {
+    REQUESTS: ('counter', 'Requests handled, by endpoint, method and status code'),
+    REQUEST_DURATION: ('histogram', 'Request latency in seconds, by endpoint'),
+    PHASE_DURATION: ('histogram', 'Time spent in one phase of the work (db_load, db_save, smtp, provider), by endpoint'),
+}
+LABELS = {
+    REQUESTS: ('endpoint', 'method', 'status'),
+    REQUEST_DURATION: ('endpoint',),
+    PHASE_DURATION: ('endpoint', 'phase'),
+}
+
+
+def _bucket_index(seconds):
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            return i
+    return len(BUCKETS)
+
+
+class Registry:
+    """The metrics of one process"""
+
+    def __init__(self, metrics_dir=None, flush_interval=5.0):
+        self.metrics_dir = metrics_dir
+        self.flush_interval = flush_interval
+        self._counters = {}    # (name, labels) -> count
+        self._histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._last_flush = 0.0
+
+    def configure(self, metrics_dir, flush_interval=5.0):
+        self.metrics_dir = metrics_dir
+        self.flush_interval = flush_interval
+        return self
+
+    # -------------------------------------------------------------- recording
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self._counters[(name, labels)] = self._counters.get((name, labels), 0) + amount
+
+    def observe(self, name, labels, seconds):
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[(name, labels)] = [0] * (len(BUCKETS) + 1) + [0.0]
+            histogram[_bucket_index(seconds)] += 1
+            histogram[-1] += seconds
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time a block of work as one phase of the current request"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            endpoint = getattr(self._local, 'endpoint', None) or 'background'
+            self.observe(PHASE_DURATION, (endpoint, name), time.perf_counter() - start)
+
+    def init_app(self, app):
+        """Count and time every request an app handles"""
+
+        @app.before_request
+        def _start_timer():
+            from flask import request
+            self._local.endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            self._local.started = time.perf_counter()
+
+        @app.after_request
+        def _record(response):
+            from flask import request
+            endpoint = getattr(self._local, 'endpoint', None) or 'unmatched'
+            started = getattr(self._local, 'started', None)
+            self.inc(REQUESTS, (endpoint, request.method, str(response.status_code)))
+            if started is not None:
+                self.observe(REQUEST_DURATION, (endpoint,), time.perf_counter() - started)
+            self._local.endpoint = self._local.started = None
+            self.maybe_flush()
+            return response
+
+        return self
+
+    # ------------------------------------------------------ sharing/rendering
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(labels), list(values)] for (name, labels), values in self._histograms.items()],
+            }
+
+    def maybe_flush(self):
+        if self.metrics_dir and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write this process's metrics for the other processes' /metrics"""
+        if not self.metrics_dir:
+            return
+        self._last_flush = time.monotonic()
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        path = os.path.join(self.metrics_dir, f"{os.getpid()}.json")
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def _snapshots(self):
+        """This process's live metrics plus the last flush of every other running process"""
+        snapshots = [self.snapshot()]
+        if not self.metrics_dir or not os.path.isdir(self.metrics_dir):
+            return snapshots
+        self.flush()
+        for name in os.listdir(self.metrics_dir):
+            if not name.endswith('.json'):
+                continue
+            pid = int(name[:-5])
+            if pid == os.getpid():
+                continue
+            path = os.path.join(self.metrics_dir, name)
+            if not _alive(pid):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path, 'r') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self):
+        """All processes' metrics in the Prometheus text exposition format"""
+        counters, histograms = {}, {}
+        for snapshot in self._snapshots():
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, values in snapshot['histograms']:
+                key = (name, tuple(labels))
+                total = histograms.setdefault(key, [0] * (len(BUCKETS) + 1) + [0.0])
+                for i, value in enumerate(values):
+                    total[i] += value
+
+        lines = []
+        for name, (kind, help_text) in HELP.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            label_names = LABELS[name]
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_labels(label_names, labels)} {value}")
+                continue
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), values[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(label_names + ('le',), labels + (str(bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(label_names, labels)} {round(values[-1], 6)}")
+                lines.append(f"{name}_count{_labels(label_names, labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(names, values):
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return '{' + ','.join(f'{n}="{v}"' for n, v in zip(names, escaped)) + '}'
+
+
+def _alive(pid):
+    if os.name == 'nt':
+        return True  # os.kill would terminate it; one process per server there anyway
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # Exists but belongs to someone else (or Windows); keep it
+    return True
+
+
+# Shared by the server and the modules it instruments
+registry = Registry()
+phase = registry.phase
+
+
+def from_env(data_dir):
+    """Point the shared registry at a data directory using ES_METRICS_* settings"""
+    return registry.configure(
+        os.path.join(data_dir, 'metrics'),
+        flush_interval=float(os.getenv('ES_METRICS_FLUSH_INTERVAL', '5')),
+    )
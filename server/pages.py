@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+ExamShield Static Pages
+Serves the server's HTML pages (register, payment, admin, success) from memory.
+
+Each page is read once and compressed once (gzip, and brotli when the Brotli
+package is installed); requests get the smallest encoding the browser accepts,
+with a strong ETag, Last-Modified and Cache-Control, and conditional requests
+are answered with 304 Not Modified. In dev mode (ES_DEV_MODE, defaults to
+DEBUG) pages are re-read from disk on every request and sent uncached, so edits
+show up on reload.
+"""
+
+import os
+import gzip
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+HTML_TYPE = 'text/html; charset=utf-8'
+
+
+class Page:
+    """One HTML file with its precomputed encodings"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            body = f.read()
+        self.last_modified = datetime.fromtimestamp(int(os.path.getmtime(path)), timezone.utc)
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        # Strong ETags must differ per encoding (the bytes differ)
+        self.encodings = {'identity': (body, digest)}
+        self.encodings['gzip'] = (gzip.compress(body, 9, mtime=0), digest + '-gz')
+        if brotli is not None:
+            self.encodings['br'] = (brotli.compress(body, mode=brotli.MODE_TEXT), digest + '-br')
+
+    def choose(self, accept_encodings):
+        """The smallest encoding the client accepts"""
+        best = 'identity'
+        for encoding, (body, _) in self.encodings.items():
+            if encoding != 'identity' and accept_encodings[encoding] > 0 \
+                    and len(body) < len(self.encodings[best][0]):
+                best = encoding
+        return best
+
+
+class PageCache:
+    """HTML pages from one directory, kept in memory unless dev_mode"""
+
+    def __init__(self, directory, dev_mode=False, max_age=300):
+        self.directory = directory
+        self.dev_mode = dev_mode
+        self.max_age = max_age
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def _page(self, name):
+        """The loaded page, or None if the file does not exist"""
+        page = self._pages.get(name)
+        if page is None:
+            with self._lock:
+                page = self._pages.get(name)
+                if page is None:
+                    path = os.path.join(self.directory, name)
+                    if not os.path.exists(path):
+                        return None
+                    page = self._pages[name] = Page(path)
+        return page
+
+    def preload(self, *names):
+        """Load and compress pages ahead of their first request"""
+        if not self.dev_mode:
+            for name in names:
+                self._page(name)
+        return self
+
+    def serve(self, name, not_found):
+        """Response for the current request, or a 404 with not_found as its body"""
+        if self.dev_mode:
+            path = os.path.join(self.directory, name)
+            if not os.path.exists(path):
+                return Response(not_found, 404, content_type=HTML_TYPE)
+            with open(path, 'rb') as f:
+                response = Response(f.read(), content_type=HTML_TYPE)
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+
+        page = self._page(name)
+        if page is None:
+            return Response(not_found, 404, content_type=HTML_TYPE)
+        encoding = page.choose(request.accept_encodings)
+        body, etag = page.encodings[encoding]
+        response = Response(body, content_type=HTML_TYPE)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = f'public, max-age={self.max_age}'
+        response.set_etag(etag)
+        response.last_modified = page.last_modified
+        return response.make_conditional(request)
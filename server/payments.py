@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+ExamShield Razorpay Payments
+One Razorpay API client per server process, and a cache of the orders created
+for each license.
+
+The client (and its HTTP session) is created on first use and reused, so
+requests share pooled keep-alive connections to the Razorpay API. Orders are
+remembered in <ES_DATA_DIR>/razorpay_orders.json by license key: asking again for
+the same license, amount and currency returns the existing order instead of
+creating a duplicate, as long as it is younger than ES_RAZORPAY_ORDER_TTL and
+the license hasn't been activated since it was created.
+
+Point RAZORPAY_API_URL at razorpay_stub.py to run the payment flow offline.
+"""
+
+import os
+import json
+import time
+import threading
+from datetime import datetime
+
+from locks import FileLock, KeyLocks
+from metrics import phase
+
+try:
+    import razorpay
+except ImportError:  # Razorpay checkout is optional
+    razorpay = None
+
+API_URL = 'https://api.razorpay.com'  # The SDK adds the /v1 paths
+
+
+class RazorpayGateway:
+    """Process-wide Razorpay client plus the per-license order cache"""
+
+    def __init__(self, key_id, key_secret, orders_path, api_url=API_URL, order_ttl=3600):
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.api_url = api_url
+        self.order_ttl = order_ttl
+        self.orders_path = orders_path
+        self._orders_lock = FileLock(orders_path + '.lock')
+        # Serializes order creation per license, so double clicks share one order
+        self._license_locks = KeyLocks(os.path.join(os.path.dirname(orders_path), 'locks'), 'order')
+        self._client = None
+        self._client_pid = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def configured(self):
+        return bool(self.key_id and self.key_secret)
+
+    def client(self):
+        """The shared razorpay.Client (raises ImportError if the SDK is missing)"""
+        if razorpay is None:
+            raise ImportError('razorpay')
+        with self._client_lock:
+            # A forked worker gets its own session rather than its parent's sockets
+            if self._client is None or self._client_pid != os.getpid():
+                self._client = razorpay.Client(auth=(self.key_id, self.key_secret), base_url=self.api_url)
+                self._client_pid = os.getpid()
+            return self._client
+
+    # ------------------------------------------------------------ order cache
+
+    def _load_orders(self):
+        try:
+            with open(self.orders_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_orders(self, orders):
+        tmp_path = self.orders_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(orders, f)
+        os.replace(tmp_path, self.orders_path)
+
+    def cached_order(self, entry, amount, currency):
+        """The reusable order for a license, or None"""
+        cached = self._load_orders().get(entry['key'])
+        if cached is None or cached['amount'] != amount or cached['currency'] != currency:
+            return None
+        if time.time() - cached['created'] >= self.order_ttl:
+            return None
+        activated = entry.get('activated')
+        if activated and datetime.fromisoformat(activated).timestamp() >= cached['created']:
+            return None  # Paid since; a new payment needs a new order
+        return cached['order']
+
+    def order_for(self, entry, amount, currency='INR'):
+        """An unpaid order for a license: the cached one, or a newly created one"""
+        license_key = entry['key']
+        with self._license_locks(license_key):
+            order = self.cached_order(entry, amount, currency)
+            if order is not None:
+                return order
+            with phase('provider'):
+                order = self.client().order.create({
+                    'amount': amount,
+                    'currency': currency,
+                    'receipt': license_key,
+                    'notes': {
+                        'license_key': license_key,
+                        'product': 'ExamShield License'
+                    }
+                })
+            now = time.time()
+            with self._orders_lock:
+                orders = {key: cached for key, cached in self._load_orders().items()
+                          if now - cached['created'] < self.order_ttl}
+                orders[license_key] = {'order': order, 'amount': amount, 'currency': currency, 'created': now}
+                self._save_orders(orders)
+            return order
+
+    def verify_payment_signature(self, params):
+        """Raises razorpay.errors.SignatureVerificationError if the checkout response is forged"""
+        self.client().utility.verify_payment_signature(params)
+
+
+def from_env(data_dir):
+    """Build the gateway for a data directory from RAZORPAY_* settings"""
+    return RazorpayGateway(
+        os.getenv('RAZORPAY_KEY_ID', ''),
+        os.getenv('RAZORPAY_KEY_SECRET', ''),
+        os.path.join(data_dir, 'razorpay_orders.json'),
+        api_url=os.getenv('RAZORPAY_API_URL', API_URL),
+        order_ttl=int(os.getenv('ES_RAZORPAY_ORDER_TTL', '3600')),
+    )
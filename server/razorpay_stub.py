@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Razorpay API, for offline development and load tests.
+
+Implements the calls the license server makes (create and fetch orders) plus a
+checkout shortcut that "pays" an order and returns the same
+razorpay_order_id/razorpay_payment_id/razorpay_signature the real checkout
+hands to the payment page, signed with the caller's key secret so
+/verify-payment accepts it. Orders live in memory.
+
+Usage:
+    python razorpay_stub.py [--port 9090]
+    # then start the license server with
+    RAZORPAY_API_URL=http://localhost:9090 RAZORPAY_KEY_ID=rzp_test_stub RAZORPAY_KEY_SECRET=stub-secret
+
+    # pay an order (what the checkout widget would do):
+    curl -u rzp_test_stub:stub-secret -X POST http://localhost:9090/v1/stub/orders/<order_id>/pay
+"""
+
+import sys
+import hmac
+import time
+import hashlib
+import secrets
+import argparse
+import threading
+
+from flask import Flask, jsonify, request
+
+app = Flask(__name__)
+
+orders = {}
+orders_lock = threading.Lock()
+
+
+def _error(status, description):
+    return jsonify({'error': {'code': 'BAD_REQUEST_ERROR', 'description': description}}), status
+
+
+def _authorized():
+    auth = request.authorization
+    return auth is not None and auth.username and auth.password
+
+
+@app.route('/v1/orders', methods=['POST'])
+def create_order():
+    if not _authorized():
+        return _error(401, 'Authentication failed')
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get('amount'), int) or data['amount'] < 100:
+        return _error(400, 'The amount must be at least INR 1.00')
+    order = {
+        'id': f"order_{secrets.token_hex(7)}",
+        'entity': 'order',
+        'amount': data['amount'],
+        'amount_paid': 0,
+        'amount_due': data['amount'],
+        'currency': data.get('currency', 'INR'),
+        'receipt': data.get('receipt'),
+        'status': 'created',
+        'attempts': 0,
+        'notes': data.get('notes', {}),
+        'created_at': int(time.time()),
+    }
+    with orders_lock:
+        orders[order['id']] = order
+    return jsonify(order), 200
+
+
+@app.route('/v1/orders/<order_id>', methods=['GET'])
+def fetch_order(order_id):
+    if not _authorized():
+        return _error(401, 'Authentication failed')
+    order = orders.get(order_id)
+    if order is None:
+        return _error(400, 'The id provided does not exist')
+    return jsonify(order), 200
+
+
+@app.route('/v1/stub/orders/<order_id>/pay', methods=['POST'])
+def pay_order(order_id):
+    """Simulate a successful checkout; returns the payment page's payment_response"""
+    if not _authorized():
+        return _error(401, 'Authentication failed')
+    with orders_lock:
+        order = orders.get(order_id)
+        if order is None:
+            return _error(400, 'The id provided does not exist')
+        if order['status'] == 'paid':
+            return _error(400, 'Order has already been paid')
+        order.update(status='paid', amount_paid=order['amount'], amount_due=0, attempts=order['attempts'] + 1)
+    payment_id = f"pay_{secrets.token_hex(7)}"
+    signature = hmac.new(request.authorization.password.encode(), f"{order_id}|{payment_id}".encode(),
+                         hashlib.sha256).hexdigest()
+    return jsonify({
+        'razorpay_order_id': order_id,
+        'razorpay_payment_id': payment_id,
+        'razorpay_signature': signature,
+    }), 200
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Razorpay API stub')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9090)
+    args = parser.parse_args()
+    print(f"Razorpay stub on http://{args.host}:{args.port} (set RAZORPAY_API_URL to this)")
+    app.run(host=args.host, port=args.port, threaded=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
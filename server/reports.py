@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+ExamShield License Reports
+Filtering, sorting and cursor pagination for the admin reports API, plus
+streaming NDJSON/CSV export.
+
+Everything here works in one pass over store.items() without building a list of
+all licenses: a page keeps only the best `limit` rows in a heap, and exports
+yield rows as they are read.
+"""
+
+import io
+import csv
+import json
+import heapq
+import base64
+from datetime import datetime
+
+REPORT_FIELDS = [
+    'key', 'name', 'email', 'device_type', 'status', 'active', 'activated', 'expires',
+    'created', 'payment_amount', 'payment_status', 'transaction_id',
+]
+STATUSES = ('active', 'pending', 'expired', 'revoked', 'inactive')
+SORT_FIELDS = ('created', 'activated', 'expires', 'email', 'name', 'key', 'payment_amount')
+DATE_FIELDS = ('created', 'activated', 'expires')
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+class ReportQueryError(ValueError):
+    """Invalid report query parameter"""
+
+
+def license_status(entry, now=None):
+    """One of STATUSES for a license entry"""
+    if entry.get('active', False):
+        expires = entry.get('expires')
+        if expires:
+            try:
+                if datetime.fromisoformat(expires) < (now or datetime.now()):
+                    return 'expired'
+            except ValueError:
+                pass
+        return 'active'
+    if entry.get('revoked'):
+        return 'revoked'
+    if entry.get('payment_status', 'pending') == 'pending':
+        return 'pending'
+    return 'inactive'
+
+
+def payment_amount(entry):
+    """A license's payment amount as a number (0.0 if missing or malformed)"""
+    try:
+        return float(entry.get('payment_amount') or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def report_row(entry, now=None):
+    """The admin-facing view of one license entry"""
+    return {
+        'key': entry.get('key'),
+        'name': entry.get('name'),
+        'email': entry.get('email'),
+        'device_type': entry.get('device_type'),
+        'status': license_status(entry, now),
+        'active': entry.get('active', False),
+        'activated': entry.get('activated'),
+        'expires': entry.get('expires'),
+        'created': entry.get('created'),
+        'payment_amount': entry.get('payment_amount', 0),
+        'payment_status': entry.get('payment_status', 'pending'),
+        'transaction_id': entry.get('transaction_id')
+    }
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise ReportQueryError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != 3:
+        raise ReportQueryError('Invalid cursor')
+    return values
+
+
+class ReportQuery:
+    """Filters, sort order and page position for one reports request"""
+
+    def __init__(self, statuses=None, device_type=None, date_field='created', date_from=None,
+                 date_to=None, search=None, sort='created', limit=DEFAULT_LIMIT, cursor=None):
+        self.statuses = set(statuses) if statuses else None
+        self.device_type = device_type
+        self.date_field = date_field
+        self.date_from = date_from
+        self.date_to = date_to
+        self.search = search.lower() if search else None
+        self.sort = sort
+        self.descending = sort.startswith('-')
+        self.sort_field = sort.lstrip('-')
+        self.limit = limit
+        self.after = None
+        if cursor:
+            # Cursors are [sort, value, key] of the last row of the previous page
+            cursor_sort, value, key = decode_cursor(cursor)
+            if cursor_sort != sort:
+                raise ReportQueryError('Cursor belongs to a different sort order')
+            # Must compare with sort_key() values: a number for payment_amount, else a string
+            if self.sort_field == 'payment_amount':
+                valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+            else:
+                valid = isinstance(value, str)
+            if not valid or not isinstance(key, str):
+                raise ReportQueryError('Invalid cursor')
+            self.after = (value, key)
+
+    @classmethod
+    def from_args(cls, args):
+        """Build a query from request args (raises ReportQueryError on bad input)"""
+        statuses = [s for s in args.get('status', '').lower().split(',') if s]
+        for status in statuses:
+            if status not in STATUSES:
+                raise ReportQueryError(f"Unknown status '{status}' (use {', '.join(STATUSES)})")
+        date_field = args.get('date_field', 'created')
+        if date_field not in DATE_FIELDS:
+            raise ReportQueryError(f"date_field must be one of {', '.join(DATE_FIELDS)}")
+        sort = args.get('sort', 'created')
+        if sort.lstrip('-') not in SORT_FIELDS:
+            raise ReportQueryError(f"sort must be one of {', '.join(SORT_FIELDS)} (prefix - for descending)")
+        try:
+            limit = min(max(int(args.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        except ValueError:
+            raise ReportQueryError('limit must be a number')
+        return cls(
+            statuses=statuses,
+            device_type=args.get('device_type') or None,
+            date_field=date_field,
+            date_from=cls._date_arg(args, 'from'),
+            date_to=cls._date_arg(args, 'to'),
+            search=args.get('q', '').strip() or None,
+            sort=sort,
+            limit=limit,
+            cursor=args.get('cursor') or None,
+        )
+
+    @staticmethod
+    def _date_arg(args, name):
+        value = args.get(name)
+        if not value:
+            return None
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            raise ReportQueryError(f"'{name}' must be an ISO date, e.g. 2026-01-31")
+        # Compared as strings against the stored isoformat() values; bare dates stay bare
+        return value if len(value) == 10 else parsed.isoformat()
+
+    def matches(self, entry, status):
+        if self.statuses is not None and status not in self.statuses:
+            return False
+        if self.device_type and entry.get('device_type', 'individual') != self.device_type:
+            return False
+        if self.date_from or self.date_to:
+            value = entry.get(self.date_field)
+            if not value:
+                return False
+            if self.date_from and value < self.date_from:
+                return False
+            # A bare date as 'to' includes that whole day
+            if self.date_to and value[:len(self.date_to)] > self.date_to:
+                return False
+        if self.search:
+            haystack = ' '.join(str(entry.get(f) or '') for f in ('key', 'email', 'name')).lower()
+            if self.search not in haystack:
+                return False
+        return True
+
+    def sort_key(self, entry):
+        """(value, license key); the key breaks ties so cursors are exact"""
+        if self.sort_field == 'payment_amount':
+            value = payment_amount(entry)
+        else:
+            value = str(entry.get(self.sort_field) or '')
+        return (value, entry.get('key') or '')
+
+    def after_cursor(self, sort_key):
+        """True if a row with this sort key belongs after the cursor"""
+        if self.after is None:
+            return True
+        return sort_key < self.after if self.descending else sort_key > self.after
+
+    def next_cursor(self, sort_key):
+        return encode_cursor([self.sort, *sort_key])
+
+    def rows(self, items, now=None):
+        """Lazily yield report rows for matching entries, in store order"""
+        now = now or datetime.now()
+        for _, entry in items:
+            status = license_status(entry, now)
+            if self.matches(entry, status):
+                yield report_row(entry, now)
+
+
+def page(query, items, now=None):
+    """One page of report rows.
+
+    Returns {'reports', 'next_cursor', 'matched'}; matched counts every license
+    passing the filters.
+    """
+    now = now or datetime.now()
+    matched = 0
+    candidates = []
+    for _, entry in items:
+        if not query.matches(entry, license_status(entry, now)):
+            continue
+        matched += 1
+        sort_key = query.sort_key(entry)
+        if query.after_cursor(sort_key):
+            candidates.append((sort_key, entry))
+            # Keep only what the page (plus one look-ahead row) can use
+            if len(candidates) > 4 * (query.limit + 1):
+                candidates = _best(query, candidates, query.limit + 1)
+    best = _best(query, candidates, query.limit + 1)
+    has_more = len(best) > query.limit
+    best = best[:query.limit]
+    return {
+        'reports': [report_row(entry, now) for _, entry in best],
+        'next_cursor': query.next_cursor(best[-1][0]) if has_more else None,
+        'matched': matched,
+    }
+
+
+def _best(query, candidates, n):
+    select = heapq.nlargest if query.descending else heapq.nsmallest
+    return select(n, candidates, key=lambda c: c[0])
+
+
+def export_ndjson(rows):
+    """Yield report rows as newline-delimited JSON"""
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+def export_csv(rows):
+    """Yield report rows as CSV, one chunk per row"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=REPORT_FIELDS)
+
+    def drain():
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    writer.writeheader()
+    yield drain()
+    for row in rows:
+        writer.writerow(row)
+        yield drain()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+ExamShield Spool Queues
+Durable on-disk queue shared by the outbound mail queue (mailer.py) and the
+payment webhook inbox (webhooks.py).
+
+Each message is one JSON file, named <time>-<pid>-<random>.json so a sorted
+directory listing is arrival order, in the queue directory; messages that keep
+failing are moved to a dead directory next to it and can be requeued. A
+background thread in each server process wakes up when something is queued
+(or every poll_interval seconds) and drains the queue, holding a file lock so
+only one process drains at a time. Failed messages are retried with jittered
+exponential backoff.
+
+Subclasses implement drain() with whatever delivering a message means, and
+describe() for log lines; maintain() is an optional hook for periodic
+housekeeping on the drainer thread.
+"""
+
+import os
+import json
+import time
+import random
+import threading
+from datetime import datetime
+
+from locks import FileLock
+
+
+class SpoolQueue:
+    """Spool directory of messages plus the background thread that drains it"""
+
+    thread_name = 'spool-drainer'
+
+    def __init__(self, spool_dir, queue_name, lock_name, max_attempts=8,
+                 retry_base=30, retry_max=3600, poll_interval=5):
+        self.queue_dir = os.path.join(spool_dir, queue_name)
+        self.dead_dir = os.path.join(spool_dir, 'dead')
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.poll_interval = poll_interval
+        # Only one process drains the queue at a time
+        self._drain_lock = FileLock(os.path.join(spool_dir, lock_name))
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        self._start_lock = threading.Lock()
+        os.makedirs(self.queue_dir, exist_ok=True)
+        os.makedirs(self.dead_dir, exist_ok=True)
+
+    # ---------------------------------------------------------------- enqueue
+
+    def _spool(self, fields, created_field='created'):
+        """Durably queue a message with the given fields and wake the drainer. Returns its id."""
+        msg_id = f"{time.time():.6f}-{os.getpid()}-{random.getrandbits(32):08x}"
+        message = {'id': msg_id}
+        message.update(fields)
+        message.update({
+            created_field: datetime.now().isoformat(),
+            'attempts': 0,
+            'next_attempt': 0,
+            'last_error': None,
+        })
+        self._write(os.path.join(self.queue_dir, f"{msg_id}.json"), message)
+        self.start()
+        self._wakeup.set()
+        return msg_id
+
+    @staticmethod
+    def _write(path, message):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(message, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    # ---------------------------------------------------------------- drainer
+
+    def start(self):
+        """Start the drainer thread in this process (no-op if already running)"""
+        with self._start_lock:
+            # A thread started before fork() doesn't exist in the child
+            if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                self.drain()
+                self.maintain()
+            except Exception as e:
+                print(f"{self.thread_name} error: {e}")
+
+    def drain(self):
+        """Deliver what is due. Returns the number of messages done with."""
+        raise NotImplementedError
+
+    def describe(self, message):
+        """How log lines name a message, e.g. 'email to a@example.com'"""
+        return f"message {message['id']}"
+
+    def maintain(self):
+        """Housekeeping for the drainer thread to do after each drain (none by default)"""
+
+    def _messages(self, due_only=False, limit=None):
+        """(path, message) for queued messages in arrival order"""
+        now = time.time()
+        found = []
+        for name in sorted(os.listdir(self.queue_dir)):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.queue_dir, name)
+            try:
+                with open(path, 'r') as f:
+                    message = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if due_only and message.get('next_attempt', 0) > now:
+                continue
+            found.append((path, message))
+            if limit is not None and len(found) >= limit:
+                break
+        return found
+
+    def _bury(self, path, message):
+        """Move a message to the dead directory"""
+        self._write(os.path.join(self.dead_dir, os.path.basename(path)), message)
+        os.remove(path)
+
+    def _retry_later(self, path, message, error):
+        message['attempts'] += 1
+        message['last_error'] = str(error)
+        if message['attempts'] >= self.max_attempts:
+            print(f"Giving up on {self.describe(message)} after {message['attempts']} attempts: {error}")
+            self._bury(path, message)
+            return
+        delay = min(self.retry_max, self.retry_base * 2 ** (message['attempts'] - 1))
+        message['next_attempt'] = time.time() + delay * random.uniform(0.8, 1.2)
+        print(f"Error handling {self.describe(message)} (attempt {message['attempts']}), retrying in {delay}s: {error}")
+        self._write(path, message)
+
+    # ------------------------------------------------------------ maintenance
+
+    def status(self):
+        count = lambda d: sum(1 for n in os.listdir(d) if n.endswith('.json'))
+        return {'queued': count(self.queue_dir), 'dead': count(self.dead_dir)}
+
+    def requeue_dead(self):
+        """Move dead letters back to the queue with a fresh retry budget"""
+        moved = 0
+        for name in os.listdir(self.dead_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.dead_dir, name)
+            with open(path, 'r') as f:
+                message = json.load(f)
+            message['attempts'] = 0
+            message['next_attempt'] = 0
+            self._write(os.path.join(self.queue_dir, name), message)
+            os.remove(path)
+            moved += 1
+        return moved
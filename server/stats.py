@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+ExamShield License Stats
+Aggregate counters (total, active, expired, pending, revenue) kept up to date
+on every license change, so dashboards read them in O(1).
+
+The counters live in <ES_DATA_DIR>/stats.json, shared by all server processes.
+Each store change applies the difference between the old and new entry. Active
+licenses are also counted per expiry day; once a day has passed, its count
+rolls over from active to expired. A periodic reconciliation recounts the whole
+store and repairs any drift (e.g. after a restore).
+
+Usage:
+    python stats.py show
+    python stats.py reconcile
+"""
+
+import os
+import sys
+import json
+import argparse
+import threading
+from datetime import date, datetime
+
+from locks import FileLock
+from reports import payment_amount
+
+COUNTERS = ('total', 'active', 'expired', 'pending', 'revenue')
+
+
+class LicenseStats:
+    """Materialized license counters for one data directory"""
+
+    def __init__(self, path, reconcile_interval=3600):
+        self.path = path
+        self.reconcile_interval = reconcile_interval
+        self.store = None
+        self._lock = FileLock(path + '.lock')
+        self._reconcile_thread = None
+
+    def attach(self, store):
+        """Count changes made through a license store (building the counters if missing)"""
+        self.store = store
+        store.add_listener(self.record)
+        with self._lock:
+            if self._load() is None:
+                self._save(self._compute())
+        return self
+
+    # -------------------------------------------------------------- counters
+
+    @staticmethod
+    def _empty(today):
+        counters = dict.fromkeys(COUNTERS, 0)
+        counters.update({'revenue': 0.0, 'expiring': {}, 'rolled_until': today, 'reconciled_at': None})
+        return counters
+
+    @staticmethod
+    def _apply(counters, entry, sign):
+        """Add (sign=1) or remove (sign=-1) one entry's contribution"""
+        counters['total'] += sign
+        counters['revenue'] = round(counters['revenue'] + sign * payment_amount(entry), 2)
+        if entry.get('active', False):
+            expiry_day = (entry.get('expires') or '')[:10]
+            if expiry_day and expiry_day < counters['rolled_until']:
+                counters['expired'] += sign
+            else:
+                counters['active'] += sign
+                if expiry_day:
+                    expiring = counters['expiring']
+                    expiring[expiry_day] = expiring.get(expiry_day, 0) + sign
+                    if not expiring[expiry_day]:
+                        del expiring[expiry_day]
+        elif entry.get('payment_status') == 'pending':
+            counters['pending'] += sign
+
+    @staticmethod
+    def _roll_over(counters, today):
+        """Move licenses whose expiry day has passed from active to expired"""
+        if counters['rolled_until'] >= today:
+            return False
+        for day in [d for d in counters['expiring'] if d < today]:
+            count = counters['expiring'].pop(day)
+            counters['active'] -= count
+            counters['expired'] += count
+        counters['rolled_until'] = today
+        return True
+
+    def _compute(self, today=None):
+        """Count everything from scratch"""
+        counters = self._empty(today or date.today().isoformat())
+        for _, entry in self.store.items():
+            self._apply(counters, entry, 1)
+        return counters
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, counters):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(counters, f)
+        os.replace(tmp_path, self.path)
+
+    # ------------------------------------------------------------ updates/reads
+
+    def record(self, key, old, new):
+        """Store listener: apply one change to the counters"""
+        today = date.today().isoformat()
+        with self._lock:
+            counters = self._load()
+            if counters is None:
+                # Counted from the store, which already includes this change
+                self._save(self._compute(today))
+                return
+            self._roll_over(counters, today)
+            if old is not None:
+                self._apply(counters, old, -1)
+            if new is not None:
+                self._apply(counters, new, 1)
+            self._save(counters)
+
+    def read(self):
+        """Current counters as {total, active, expired, pending, revenue}"""
+        today = date.today().isoformat()
+        counters = self._load()
+        if counters is None or counters['rolled_until'] < today:
+            with self._lock:
+                counters = self._load() or self._compute(today)
+                self._roll_over(counters, today)
+                self._save(counters)
+        self.maybe_reconcile(counters)
+        return {name: counters[name] for name in COUNTERS}
+
+    # ---------------------------------------------------------- reconciliation
+
+    @staticmethod
+    def _diff(stored, actual):
+        drift = {}
+        for name in COUNTERS + ('expiring',):
+            if stored.get(name) != actual[name]:
+                drift[name] = {'stored': stored.get(name), 'actual': actual[name]}
+        return drift
+
+    def reconcile(self, repair=True):
+        """Recount the store and compare with the counters.
+
+        Returns the drift found ({} if none). With repair, the counters are
+        replaced by the recount. A first pass runs without blocking writers; only
+        if it finds drift is the store recounted again under the stats lock, so
+        changes still being applied by other requests aren't mistaken for drift.
+        """
+        today = date.today().isoformat()
+        stored = self._load() or self._empty(today)
+        self._roll_over(stored, today)
+        drift = self._diff(stored, self._compute(today))
+        with self._lock:
+            stored = self._load() or self._empty(today)
+            self._roll_over(stored, today)
+            if drift:
+                actual = self._compute(today)
+                drift = self._diff(stored, actual)
+                if drift and repair:
+                    print(f"License stats drifted, repaired: {drift}")
+                    stored = actual
+            stored['reconciled_at'] = datetime.now().isoformat()
+            self._save(stored)
+        return drift
+
+    def maybe_reconcile(self, counters):
+        """Start a background reconciliation if the last one is older than the interval"""
+        if self.store is None or not self.reconcile_interval:
+            return
+        last = counters.get('reconciled_at')
+        if last and (datetime.now() - datetime.fromisoformat(last)).total_seconds() < self.reconcile_interval:
+            return
+        if self._reconcile_thread is not None and self._reconcile_thread.is_alive():
+            return
+        self._reconcile_thread = threading.Thread(target=self._reconcile_quietly, name='stats-reconcile', daemon=True)
+        self._reconcile_thread.start()
+
+    def _reconcile_quietly(self):
+        try:
+            self.reconcile()
+        except Exception as e:
+            print(f"License stats reconciliation failed: {e}")
+
+
+def from_env(data_dir):
+    """Build the LicenseStats for a data directory using ES_STATS_* settings"""
+    return LicenseStats(
+        os.path.join(data_dir, 'stats.json'),
+        reconcile_interval=int(os.getenv('ES_STATS_RECONCILE_INTERVAL', '3600')),
+    )
+
+
+def main():
+    from storage import open_store
+
+    parser = argparse.ArgumentParser(description='ExamShield license stats')
+    parser.add_argument('command', choices=['show', 'reconcile'])
+    args = parser.parse_args()
+
+    data_dir = os.getenv('ES_DATA_DIR', './data')
+    store = open_store(data_dir, os.getenv('ES_STORAGE_BACKEND', 'json').lower())
+    license_stats = from_env(data_dir)
+    license_stats.reconcile_interval = 0  # no background thread in the CLI
+    license_stats.attach(store)
+    if args.command == 'show':
+        print(json.dumps(license_stats.read(), indent=2))
+    else:
+        drift = license_stats.reconcile()
+        print(f"Repaired drift: {json.dumps(drift, indent=2)}" if drift else "Counters match the license store")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
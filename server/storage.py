@@ -0,0 +1,625 @@
+#!/usr/bin/env python3
+"""
+ExamShield License Storage
+Storage backends for the license database: the original JSON file or an embedded SQLite engine.
+
+Usage:
+    python storage.py migrate [--json PATH] [--sqlite PATH]
+"""
+
+import os
+import sys
+import copy
+import contextlib
+import json
+import time
+import sqlite3
+import argparse
+import threading
+
+from locks import FileLock, KeyLocks
+from metrics import phase
+
+
+def normalize_email(email):
+    """Normalize an email address for lookups"""
+    return (email or '').strip().lower()
+
+
+class LicenseStore:
+    """Interface shared by all license storage backends.
+
+    Entries are plain dicts keyed by their license key (entry['key']).
+    Listeners registered with add_listener() are called as
+    listener(key, old_entry, new_entry) after every committed change;
+    new_entry is None for deletions.
+
+    Read-modify-write sequences on one license must hold lock(key); sequences
+    that look licenses up by email (registration, payment activation) hold
+    lock_email(email) first. Both work across threads and processes.
+    """
+
+    listeners = ()
+
+    def _init_locks(self, data_dir):
+        lock_dir = os.path.join(data_dir, 'locks')
+        self.key_locks = KeyLocks(lock_dir, 'key')
+        self.email_locks = KeyLocks(lock_dir, 'email')
+
+    @contextlib.contextmanager
+    def _locked(self, file_lock):
+        with file_lock:
+            # Another process may have written just before we got the lock
+            self.refresh()
+            yield
+
+    def lock(self, key):
+        """Lock guarding one license entry"""
+        return self._locked(self.key_locks(key))
+
+    def lock_email(self, email):
+        """Lock guarding registrations/activations for one email (take before lock(key))"""
+        return self._locked(self.email_locks(normalize_email(email)))
+
+    @contextlib.contextmanager
+    def lock_many(self, keys):
+        """Hold lock(key) for several licenses at once"""
+        with contextlib.ExitStack() as stack:
+            # Always in stripe order, so two batches can't deadlock
+            for file_lock in self.key_locks.many(keys):
+                stack.enter_context(file_lock)
+            self.refresh()
+            yield
+
+    def add_listener(self, listener):
+        """Register a callback for committed changes"""
+        self.listeners = tuple(self.listeners) + (listener,)
+
+    def _notify(self, key, old, new):
+        for listener in self.listeners:
+            try:
+                listener(key, old, new)
+            except Exception as e:
+                print(f"Error in license store listener: {e}")
+
+    def get(self, key):
+        """Return the entry for a license key, or None"""
+        raise NotImplementedError
+
+    def put(self, entry):
+        """Insert or replace an entry (keyed by entry['key'])"""
+        raise NotImplementedError
+
+    def put_many(self, entries):
+        """Insert or replace several entries in a single write"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Remove an entry; returns True if it existed"""
+        raise NotImplementedError
+
+    def find_by_email(self, email):
+        """Return all entries registered to an email, oldest first"""
+        raise NotImplementedError
+
+    def find_by_transaction(self, transaction_id):
+        """Return the entry activated by a payment transaction, or None"""
+        raise NotImplementedError
+
+    def items(self):
+        """Iterate (key, entry) pairs in insertion order"""
+        raise NotImplementedError
+
+    def count(self):
+        """Return the number of stored licenses"""
+        raise NotImplementedError
+
+    def replace_all(self, db):
+        """Replace the whole database with a {key: entry} dict (used by restore)"""
+        raise NotImplementedError
+
+    def refresh(self):
+        """Drop anything cached so the next read sees other processes' writes"""
+        pass
+
+    def cache_stats(self):
+        """Return read cache hit/miss counters, if the backend has a cache"""
+        return {}
+
+    def close(self):
+        """Release any resources held by the backend"""
+        pass
+
+
+class LicenseIndex:
+    """In-memory hash indexes over license entries.
+
+    email -> license keys and transaction_id -> license key. Key sets are insertion-ordered dicts
+    so lookups return licenses oldest first, like a scan of the DB would.
+
+    An index that readers can see is never modified: writers change a copy()
+    (which replaces, rather than mutates, the key sets it touches) and publish it.
+    """
+
+    def __init__(self):
+        self.by_email = {}
+        self.by_transaction = {}
+
+    @classmethod
+    def build(cls, items):
+        """A new index over every (key, entry) pair"""
+        index = cls()
+        for key, entry in items:
+            index.add(key, entry)
+        return index
+
+    def copy(self):
+        index = LicenseIndex()
+        index.by_email = dict(self.by_email)
+        index.by_transaction = dict(self.by_transaction)
+        return index
+
+    @staticmethod
+    def _add_key(slots, slot, key):
+        keys = dict(slots.get(slot, ()))
+        keys[key] = None
+        slots[slot] = keys
+
+    @staticmethod
+    def _remove_key(slots, slot, key):
+        keys = slots.get(slot)
+        if keys is not None and key in keys:
+            keys = dict(keys)
+            del keys[key]
+            if keys:
+                slots[slot] = keys
+            else:
+                del slots[slot]
+
+    def add(self, key, entry):
+        self._add_key(self.by_email, normalize_email(entry.get('email')), key)
+        if entry.get('transaction_id'):
+            self.by_transaction.setdefault(entry['transaction_id'], key)
+
+    def remove(self, key, entry, email=True):
+        if email:
+            self._remove_key(self.by_email, normalize_email(entry.get('email')), key)
+        if self.by_transaction.get(entry.get('transaction_id')) == key:
+            del self.by_transaction[entry['transaction_id']]
+
+    def update(self, key, old, new):
+        """Move a key from its old entry's index slots to the new entry's"""
+        # When the email is unchanged (device added, activation) its slot is left
+        # alone so the license keeps its place ahead of newer registrations
+        same_email = old is not None and new is not None and \
+            normalize_email(old.get('email')) == normalize_email(new.get('email'))
+        if old is not None:
+            self.remove(key, old, email=not same_email)
+        if new is not None:
+            self.add(key, new)
+
+    def emails(self, email):
+        return list(self.by_email.get(normalize_email(email), ()))
+
+    def transaction(self, transaction_id):
+        return self.by_transaction.get(transaction_id)
+
+
+class JSONLicenseStore(LicenseStore):
+    """Original storage format: one JSON document holding every license.
+
+    The parsed document is cached for the life of the process and updated in
+    place by our own writes. It is re-read only when the file's inode, mtime
+    or size changes (another process wrote it). By default the file is stat'ed
+    on every read, so a write by another worker is visible to the very next
+    request; check_interval > 0 trades that for fewer stats (single-process
+    deployments only). Lookups by email and transaction
+    go through an in-memory LicenseIndex that is rebuilt on every re-read; the
+    cached document, its file signature and its index are always replaced
+    together, so a lookup never sees an index for a different document.
+
+    The cache is shared, so entries are handed out as copies.
+    """
+
+    def __init__(self, path, check_interval=0.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.index = LicenseIndex()
+        self.load_error = None
+        self._db = None
+        self._signature = None
+        self._cache_lock = threading.Lock()
+        self._checked_at = 0.0
+        data_dir = os.path.dirname(os.path.abspath(path))
+        os.makedirs(data_dir, exist_ok=True)
+        self._init_locks(data_dir)
+        self._write_lock = FileLock(path + '.lock')
+        self.init_db()
+        self.load()
+
+    def init_db(self):
+        """Create an empty database file if it doesn't exist"""
+        if not os.path.exists(self.path):
+            with self._write_lock:
+                if not os.path.exists(self.path):
+                    self.save({})
+
+    def _file_signature(self):
+        st = os.stat(self.path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def load(self, refresh=False):
+        """Return the parsed database from cache, re-reading it if the file changed.
+
+        The returned dict is the cache itself and must not be modified.
+        refresh=True always checks the file (used under the write lock).
+        """
+        now = time.monotonic()
+        if self._db is not None and not refresh and now - self._checked_at < self.check_interval:
+            self.cache_hits += 1
+            return self._db
+
+        try:
+            signature = self._file_signature()
+        except FileNotFoundError:
+            self.init_db()
+            signature = self._file_signature()
+        self._checked_at = now
+        if self._db is not None and signature == self._signature:
+            self.cache_hits += 1
+            return self._db
+
+        self.cache_misses += 1
+        with phase('db_load'):
+            try:
+                with open(self.path, 'r') as f:
+                    db = json.load(f)
+            except Exception as e:
+                # Keep serving the last good copy; writes are refused until the file parses again
+                print(f"Error loading license DB: {e}")
+                self.load_error = e
+                return self._db if self._db is not None else {}
+            self.load_error = None
+            self._publish(db, signature, LicenseIndex.build(db.items()))
+        return db
+
+    def _publish(self, db, signature, index):
+        """Make a document, its file signature and its index the cache, all at once"""
+        with self._cache_lock:
+            self._db, self._signature, self.index = db, signature, index
+
+    def _snapshot(self):
+        """The cached document and its index, refreshed first if due"""
+        self.load()
+        with self._cache_lock:
+            return self._db if self._db is not None else {}, self.index
+
+    def save(self, db, index=None):
+        """Atomically write the whole database file and make it the cached copy.
+
+        Callers hold the write lock. The new file is written and fsync'ed next to
+        the old one and renamed over it, so readers never see a partial file.
+        `index` is the already updated index for `db` (built from it if omitted).
+        """
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with phase('db_save'):
+                with open(tmp_path, 'w') as f:
+                    json.dump(db, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                self._fsync_dir()
+            if index is None:
+                index = LicenseIndex.build(db.items())
+            self._publish(db, self._file_signature(), index)
+            self._checked_at = time.monotonic()
+            return True
+        except Exception as e:
+            print(f"Error saving license DB: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+
+    def _fsync_dir(self):
+        """Persist the rename itself (not possible on Windows)"""
+        if os.name != 'posix':
+            return
+        fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _load_for_write(self):
+        """Fresh copy of the DB to modify, or None if the file is unreadable"""
+        db = self.load(refresh=True)
+        if self.load_error is not None:
+            print(f"Refusing to write license DB: {self.path} could not be parsed")
+            return None
+        # Copy-on-write so a failed save leaves the cache matching the file
+        return dict(db)
+
+    def refresh(self):
+        self.load(refresh=True)
+
+    def cache_stats(self):
+        return {'hits': self.cache_hits, 'misses': self.cache_misses}
+
+    def get(self, key):
+        entry = self.load().get(key)
+        return copy.deepcopy(entry) if entry is not None else None
+
+    def put(self, entry):
+        return self.put_many([entry])
+
+    def put_many(self, entries):
+        with self._write_lock:
+            db = self._load_for_write()
+            if db is None:
+                return False
+            changes = []
+            index = self.index.copy()
+            for entry in entries:
+                entry = copy.deepcopy(entry)
+                changes.append((entry['key'], db.get(entry['key']), entry))
+                index.update(entry['key'], db.get(entry['key']), entry)
+                db[entry['key']] = entry
+            if not self.save(db, index):
+                return False
+            for key, old, entry in changes:
+                self._notify(key, old, entry)
+        return True
+
+    def delete(self, key):
+        with self._write_lock:
+            db = self._load_for_write()
+            if db is None or key not in db:
+                return False
+            old = db.pop(key)
+            index = self.index.copy()
+            index.update(key, old, None)
+            if not self.save(db, index):
+                return False
+            self._notify(key, old, None)
+        return True
+
+    def _lookup(self, keys_for):
+        db, index = self._snapshot()
+        return [copy.deepcopy(db[key]) for key in keys_for(index) if key in db]
+
+    def find_by_email(self, email):
+        return self._lookup(lambda index: index.emails(email))
+
+    def find_by_transaction(self, transaction_id):
+        if not transaction_id:
+            return None
+        found = self._lookup(lambda index: [index.transaction(transaction_id)])
+        return found[0] if found else None
+
+    def items(self):
+        for key, entry in list(self.load().items()):
+            yield key, copy.deepcopy(entry)
+
+    def count(self):
+        return len(self.load())
+
+    def replace_all(self, db):
+        with self._write_lock:
+            if not self.save(copy.deepcopy(db)):
+                return False
+            self.load_error = None
+        return True
+
+
+class SQLiteLicenseStore(LicenseStore):
+    """Embedded SQLite storage with indexed lookup columns.
+
+    The full entry is kept as a JSON blob in `data`; the columns next to it
+    are copies of the fields we query on so every lookup is an index seek.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS licenses (
+            key TEXT PRIMARY KEY,
+            email TEXT NOT NULL DEFAULT '',
+            transaction_id TEXT,
+            active INTEGER NOT NULL DEFAULT 0,
+            payment_status TEXT,
+            created TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_licenses_email ON licenses (email);
+        CREATE INDEX IF NOT EXISTS idx_licenses_transaction ON licenses (transaction_id);
+        -- Device lookup table of earlier versions; nothing reads it
+        DROP TABLE IF EXISTS license_devices;
+    """
+
+    UPSERT = """
+        INSERT INTO licenses (key, email, transaction_id, active, payment_status, created, data)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET
+            email = excluded.email,
+            transaction_id = excluded.transaction_id,
+            active = excluded.active,
+            payment_status = excluded.payment_status,
+            created = excluded.created,
+            data = excluded.data
+    """
+
+    def __init__(self, path):
+        self.path = path
+        data_dir = os.path.dirname(os.path.abspath(path))
+        os.makedirs(data_dir, exist_ok=True)
+        self._init_locks(data_dir)
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            conn.executescript(self.SCHEMA)
+
+    def _conn(self):
+        """Return this thread's connection (sqlite3 connections are per-thread).
+
+        A connection inherited across fork() (e.g. gunicorn with preload_app)
+        must not be used by the child, so connections are also per-process.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _row(entry):
+        return (
+            entry['key'],
+            normalize_email(entry.get('email')),
+            entry.get('transaction_id'),
+            1 if entry.get('active', False) else 0,
+            entry.get('payment_status'),
+            entry.get('created'),
+            json.dumps(entry),
+        )
+
+    def get(self, key):
+        with phase('db_load'):
+            row = self._conn().execute('SELECT data FROM licenses WHERE key = ?', (key,)).fetchone()
+            return json.loads(row[0]) if row else None
+
+    def put(self, entry):
+        self.put_many([entry])
+        return True
+
+    def put_many(self, entries):
+        """Upsert several entries in one transaction"""
+        conn = self._conn()
+        old = {}
+        if self.listeners:
+            old = {entry['key']: self.get(entry['key']) for entry in entries}
+        with phase('db_save'), conn:
+            # Upsert (rather than INSERT OR REPLACE) keeps the rowid, and with it the insertion order
+            conn.executemany(self.UPSERT, [self._row(entry) for entry in entries])
+        for entry in entries:
+            self._notify(entry['key'], old.get(entry['key']), entry)
+        return True
+
+    def delete(self, key):
+        conn = self._conn()
+        old = self.get(key) if self.listeners else None
+        with conn:
+            cur = conn.execute('DELETE FROM licenses WHERE key = ?', (key,))
+        if cur.rowcount > 0:
+            self._notify(key, old, None)
+            return True
+        return False
+
+    def find_by_email(self, email):
+        rows = self._conn().execute(
+            'SELECT data FROM licenses WHERE email = ? ORDER BY rowid', (normalize_email(email),)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def find_by_transaction(self, transaction_id):
+        if not transaction_id:
+            return None
+        row = self._conn().execute(
+            'SELECT data FROM licenses WHERE transaction_id = ? ORDER BY rowid LIMIT 1', (transaction_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def items(self):
+        cur = self._conn().execute('SELECT key, data FROM licenses ORDER BY rowid')
+        for key, data in cur:
+            yield key, json.loads(data)
+
+    def count(self):
+        return self._conn().execute('SELECT COUNT(*) FROM licenses').fetchone()[0]
+
+    def replace_all(self, db):
+        entries = []
+        for key, entry in db.items():
+            entry = dict(entry)
+            entry.setdefault('key', key)
+            entries.append(entry)
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM licenses')
+            conn.executemany(self.UPSERT, [self._row(entry) for entry in entries])
+        return True
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+
+def migrate_json_to_sqlite(json_path, sqlite_path):
+    """One-shot copy of a JSON license DB into SQLite. Returns the number of licenses copied."""
+    with open(json_path, 'r') as f:
+        db = json.load(f)
+
+    entries = []
+    for key, entry in db.items():
+        entry = dict(entry)
+        entry.setdefault('key', key)
+        entries.append(entry)
+
+    store = SQLiteLicenseStore(sqlite_path)
+    try:
+        store.put_many(entries)
+    finally:
+        store.close()
+    return len(entries)
+
+
+def open_store(data_dir, backend='json', cache_check_interval=0.0):
+    """Open the configured storage backend inside the data directory"""
+    json_path = os.path.join(data_dir, 'license_db.json')
+
+    if backend == 'json':
+        return JSONLicenseStore(json_path, check_interval=cache_check_interval)
+
+    if backend == 'sqlite':
+        sqlite_path = os.path.join(data_dir, 'license_db.sqlite3')
+        if not os.path.exists(sqlite_path) and os.path.exists(json_path):
+            # First start on SQLite: carry the existing licenses over
+            count = migrate_json_to_sqlite(json_path, sqlite_path)
+            print(f"Migrated {count} licenses from {json_path} to {sqlite_path}")
+        return SQLiteLicenseStore(sqlite_path)
+
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def main():
+    data_dir = os.getenv('ES_DATA_DIR', './data')
+    parser = argparse.ArgumentParser(description='ExamShield license storage tools')
+    sub = parser.add_subparsers(dest='command')
+    migrate = sub.add_parser('migrate', help='Copy the JSON license DB into SQLite')
+    migrate.add_argument('--json', default=os.path.join(data_dir, 'license_db.json'))
+    migrate.add_argument('--sqlite', default=os.path.join(data_dir, 'license_db.sqlite3'))
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        if not os.path.exists(args.json):
+            print(f"JSON license DB not found: {args.json}")
+            return 1
+        count = migrate_json_to_sqlite(args.json, args.sqlite)
+        print(f"Migrated {count} licenses to {args.sqlite}")
+        print("Set ES_STORAGE_BACKEND=sqlite to serve from it.")
+        return 0
+
+    parser.print_help()
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+ExamShield Offline License Tokens
+Ed25519-signed tokens that let the client validate a license without calling
+/verify every time it starts.
+
+A token is "<payload>.<signature>", both base64url without padding. The payload
+is compact JSON with the license key, the device fingerprint it was issued to,
+the device limit, the license expiry and the token's own expiry (exp, Unix
+seconds). Tokens are short-lived (ES_TOKEN_TTL) so revocations still reach
+clients; the client refreshes its token online when it nears exp.
+
+Usage:
+    python tokens.py genkey [--public-key ../client/license_public_key.pem]
+    python tokens.py inspect TOKEN
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+from datetime import datetime
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+except ImportError:  # Tokens are optional; /verify works without them
+    Ed25519PrivateKey = None
+
+TOKEN_VERSION = 1
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class TokenSigner:
+    """Issues license tokens with one Ed25519 private key"""
+
+    def __init__(self, private_key, ttl=7 * 86400):
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+        self.ttl = ttl
+
+    @classmethod
+    def from_hex(cls, seed_hex, ttl=7 * 86400):
+        return cls(Ed25519PrivateKey.from_private_bytes(bytes.fromhex(seed_hex)), ttl)
+
+    def public_key_pem(self):
+        return self.public_key.public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode('ascii')
+
+    def issue(self, entry, device_fingerprint, now=None):
+        """Sign a token for one device of an active license. Returns (token, exp)."""
+        now = int(now if now is not None else time.time())
+        exp = now + self.ttl
+        license_expires = entry.get('expires')
+        if license_expires:
+            try:
+                # Never outlive the license itself
+                exp = min(exp, int(datetime.fromisoformat(license_expires).timestamp()))
+            except ValueError:
+                pass
+        claims = {
+            'v': TOKEN_VERSION,
+            'key': entry['key'],
+            'fp': device_fingerprint,
+            'limit': entry.get('device_limit', 2),
+            'lic_exp': license_expires,
+            'iat': now,
+            'exp': exp,
+        }
+        payload = json.dumps(claims, separators=(',', ':'), sort_keys=True).encode()
+        signature = self.private_key.sign(payload)
+        return f"{_b64encode(payload)}.{_b64encode(signature)}", exp
+
+
+def decode(token, public_key):
+    """Return a token's claims if its signature is valid (expiry is not checked), else None"""
+    try:
+        payload, signature = token.split('.')
+        payload = _b64decode(payload)
+        public_key.verify(_b64decode(signature), payload)
+        return json.loads(payload)
+    except (AttributeError, ValueError, InvalidSignature):
+        return None
+
+
+def from_env():
+    """Build the server's TokenSigner from ES_TOKEN_* settings, or None if tokens are disabled"""
+    seed = os.getenv('ES_TOKEN_SIGNING_KEY', '').strip()
+    if not seed:
+        return None
+    if Ed25519PrivateKey is None:
+        print("ES_TOKEN_SIGNING_KEY is set but the 'cryptography' package is not installed; offline tokens disabled")
+        return None
+    return TokenSigner.from_hex(seed, ttl=int(os.getenv('ES_TOKEN_TTL', str(7 * 86400))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ExamShield offline license tokens')
+    sub = parser.add_subparsers(dest='command')
+    genkey = sub.add_parser('genkey', help='Generate a signing key pair')
+    genkey.add_argument('--public-key', default=os.path.join('..', 'client', 'license_public_key.pem'),
+                        help='Where to write the public key bundled with the client')
+    inspect = sub.add_parser('inspect', help='Verify and print a token with the configured key')
+    inspect.add_argument('token')
+    args = parser.parse_args()
+
+    if Ed25519PrivateKey is None:
+        print("The 'cryptography' package is required: pip install cryptography")
+        return 1
+
+    if args.command == 'genkey':
+        private_key = Ed25519PrivateKey.generate()
+        seed = private_key.private_bytes(
+            serialization.Encoding.Raw, serialization.PrivateFormat.Raw, serialization.NoEncryption()
+        )
+        with open(args.public_key, 'w') as f:
+            f.write(TokenSigner(private_key).public_key_pem())
+        print(f"Public key written to {args.public_key} (ship it with the client)")
+        print("Add this to the server environment and keep it secret:")
+        print(f"ES_TOKEN_SIGNING_KEY={seed.hex()}")
+    elif args.command == 'inspect':
+        from dotenv import load_dotenv
+        load_dotenv('config.env')
+        signer = from_env()
+        if signer is None:
+            print("ES_TOKEN_SIGNING_KEY is not set")
+            return 1
+        claims = decode(args.token, signer.public_key)
+        if claims is None:
+            print("Invalid token signature")
+            return 1
+        print(json.dumps(claims, indent=2))
+        print(f"Expires: {datetime.fromtimestamp(claims['exp']).isoformat()}")
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+ExamShield Webhook Ingestion
+Durable queue of received payment webhook events, processed by a pool of
+background workers, plus the idempotency store that answers provider retries.
+
+/webhook/payment only checks the signature, spools the event as one JSON file
+under <ES_DATA_DIR>/webhooks/inbox (see spool.py) and acknowledges it. Workers then activate
+licenses in the order events arrived for each customer email: events are split
+over the workers by email, and while an event is waiting for a retry later
+events for the same email wait behind it. Failed events are retried with
+exponential backoff and moved to webhooks/dead after ES_WEBHOOK_MAX_ATTEMPTS.
+
+The response sent for each event is remembered, so provider retries of an
+event that was already received get that same response back without being
+queued again.
+
+Events are identified by the provider's event id when it sends one, otherwise
+by status + transaction id (so e.g. payment.authorized and payment.captured for
+one payment are still separate events). Each handled event is one small JSON
+file under <ES_DATA_DIR>/webhooks/seen, named by a hash of its id, so a lookup
+is a single file open shared by every server process. Entries expire after
+ES_WEBHOOK_SEEN_TTL seconds; expired files are swept at most once per hour by
+the webhook dispatcher thread, never on the request path.
+
+Usage:
+    python webhooks.py status
+    python webhooks.py requeue   # move dead events back to the inbox
+    python webhooks.py purge     # delete expired idempotency entries now
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from locks import KeyLocks
+from spool import SpoolQueue
+
+EVENT_ID_HEADERS = ('X-Webhook-Id', 'X-Razorpay-Event-Id', 'Stripe-Event-Id')
+
+
+def event_id(data, headers=None):
+    """The idempotency key for a webhook delivery, or None if it has no id"""
+    for header in EVENT_ID_HEADERS:
+        if headers and headers.get(header):
+            return f"event:{headers.get(header)}"
+    if data.get('event_id'):
+        return f"event:{data['event_id']}"
+    transaction_id = data.get('id') or data.get('transaction_id') or data.get('payment_id')
+    if not transaction_id:
+        return None
+    status = data.get('status') or data.get('payment_status') or data.get('event')
+    return f"txn:{status}:{transaction_id}"
+
+
+class SeenEvents:
+    """TTL'd set of handled webhook events and the responses sent for them"""
+
+    def __init__(self, seen_dir, ttl=7 * 86400, sweep_interval=3600):
+        self.seen_dir = seen_dir
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.locks = KeyLocks(os.path.join(os.path.dirname(seen_dir), 'locks'), 'event', stripes=16)
+        self._last_sweep = 0.0
+        os.makedirs(seen_dir, exist_ok=True)
+
+    def _path(self, event):
+        return os.path.join(self.seen_dir, hashlib.sha256(event.encode()).hexdigest() + '.json')
+
+    def lock(self, event):
+        """Serializes deliveries of one event, across threads and processes"""
+        return self.locks(event)
+
+    def get(self, event):
+        """The recorded (status, body) for an event, or None if unseen or expired"""
+        try:
+            with open(self._path(event), 'r') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record['expires'] < time.time():
+            return None
+        return record['status'], record['body']
+
+    def put(self, event, status, body):
+        """Record the response sent for an event"""
+        path = self._path(event)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'event': event, 'status': status, 'body': body,
+                       'seen': time.time(), 'expires': time.time() + self.ttl}, f)
+        os.replace(tmp_path, path)
+
+    def sweep(self):
+        """Purge if sweep_interval has passed since the last purge. Returns how many were removed."""
+        if time.time() - self._last_sweep < self.sweep_interval:
+            return 0
+        return self.purge()
+
+    def purge(self):
+        """Delete expired entries. Returns how many were removed."""
+        self._last_sweep = time.time()
+        removed = 0
+        for name in os.listdir(self.seen_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.seen_dir, name)
+            try:
+                with open(path, 'r') as f:
+                    expired = json.load(f)['expires'] < time.time()
+            except (OSError, ValueError, KeyError):
+                expired = True
+            if expired:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def count(self):
+        return sum(1 for name in os.listdir(self.seen_dir) if name.endswith('.json'))
+
+
+class EventQueue(SpoolQueue):
+    """Spool directory of received webhook events plus the workers that process them.
+
+    handler(data) processes one event's payload and returns (result, status);
+    a 5xx status or an exception means "try again later", anything else is
+    final (4xx results are kept in the dead directory for inspection).
+    Expired entries of the seen-event store, if given, are swept between drains.
+    """
+
+    thread_name = 'webhook-dispatcher'
+
+    def __init__(self, webhook_dir, handler, workers=4, max_attempts=8,
+                 retry_base=5, retry_max=600, poll_interval=2, seen=None):
+        # The drain lock also keeps per-email order: only one process works the inbox
+        super().__init__(webhook_dir, 'inbox', 'worker.lock', max_attempts=max_attempts,
+                         retry_base=retry_base, retry_max=retry_max, poll_interval=poll_interval)
+        self.handler = handler
+        self.workers = workers
+        self.seen = seen
+
+    def enqueue(self, event, data):
+        """Durably queue an event's payload and wake the workers. Returns the queue id."""
+        email = data.get('email') or data.get('customer_email') or (data.get('customer') or {}).get('email')
+        return self._spool({'event': event, 'email': (email or '').strip().lower(), 'data': data},
+                           created_field='received')
+
+    def describe(self, message):
+        return f"webhook event {message['event']}"
+
+    def maintain(self):
+        if self.seen is not None:
+            self.seen.sweep()
+
+    def drain(self):
+        """Process every due event in the inbox. Returns the number processed."""
+        processed = 0
+        with self._drain_lock:
+            while True:
+                events = self._queued_events()
+                if not events:
+                    break
+                # Events for one email always land in the same partition, in arrival order
+                partitions = [[] for _ in range(self.workers)]
+                for path, message in events:
+                    partitions[zlib.crc32(message['email'].encode()) % self.workers].append((path, message))
+                with ThreadPoolExecutor(self.workers, thread_name_prefix='webhook-worker') as pool:
+                    done = sum(pool.map(self._process_partition, [p for p in partitions if p]))
+                processed += done
+                if not done:
+                    break  # Everything left is waiting for a retry
+        return processed
+
+    def _queued_events(self):
+        # Not only the due ones: a waiting event must still hold back later ones for its email
+        return self._messages()
+
+    def _process_partition(self, events):
+        now = time.time()
+        waiting = set()  # Emails with an earlier event still pending a retry
+        processed = 0
+        for path, message in events:
+            if message['email'] in waiting:
+                continue
+            if message.get('next_attempt', 0) > now:
+                waiting.add(message['email'])
+                continue
+            try:
+                result, status = self.handler(message['data'])
+            except Exception as e:
+                result, status = {'error': str(e)}, 500
+            if status >= 500:
+                self._retry_later(path, message, result.get('error', status))
+                if os.path.exists(path):
+                    waiting.add(message['email'])
+                continue
+            if status >= 400:
+                print(f"Webhook event {message['event']} rejected: {result}")
+                message['last_error'] = result.get('error', str(status))
+                self._bury(path, message)
+            else:
+                os.remove(path)
+            processed += 1
+        return processed
+
+    def status(self):
+        """Queue depth: queued and dead events, and the age (seconds) of the oldest queued one"""
+        queued = sorted(n for n in os.listdir(self.queue_dir) if n.endswith('.json'))
+        oldest = round(time.time() - float(queued[0].split('-', 1)[0]), 3) if queued else 0
+        return dict(super().status(), oldest_age=oldest, workers=self.workers)
+
+
+def from_env(data_dir):
+    """Build the seen-event store for a data directory using ES_WEBHOOK_* settings"""
+    return SeenEvents(
+        os.path.join(data_dir, 'webhooks', 'seen'),
+        ttl=int(os.getenv('ES_WEBHOOK_SEEN_TTL', str(7 * 86400))),
+    )
+
+
+def queue_from_env(data_dir, handler, seen=None):
+    """Build the event queue for a data directory using ES_WEBHOOK_* settings"""
+    return EventQueue(
+        os.path.join(data_dir, 'webhooks'),
+        handler,
+        workers=int(os.getenv('ES_WEBHOOK_WORKERS', '4')),
+        max_attempts=int(os.getenv('ES_WEBHOOK_MAX_ATTEMPTS', '8')),
+        retry_base=int(os.getenv('ES_WEBHOOK_RETRY_BASE', '5')),
+        poll_interval=int(os.getenv('ES_WEBHOOK_POLL_INTERVAL', '2')),
+        seen=seen,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ExamShield webhook ingestion queue')
+    parser.add_argument('command', choices=['status', 'requeue', 'purge'])
+    args = parser.parse_args()
+
+    data_dir = os.getenv('ES_DATA_DIR', './data')
+    seen = from_env(data_dir)
+    queue = queue_from_env(data_dir, handler=None)  # Not started; only inspected here
+    if args.command == 'status':
+        status = queue.status()
+        print(f"Queued: {status['queued']}  Dead: {status['dead']}  Oldest: {status['oldest_age']}s")
+        print(f"{seen.count()} webhook events remembered (TTL {seen.ttl}s)")
+    elif args.command == 'requeue':
+        print(f"Requeued {queue.requeue_dead()} events (processed by the running server)")
+    else:
+        print(f"Removed {seen.purge()} expired webhook events")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
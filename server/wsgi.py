@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+"""
+ExamShield License Server - WSGI entry point
+Production (multi-worker):  gunicorn -c gunicorn.conf.py wsgi:app
+Development (single process): python license_server.py
+"""
+
+from license_server import app
+
+__all__ = ['app']
@@ -0,0 +1,68 @@
+"""
+Shared fixtures for the ExamShield test suite.
+Server modules live in server/ and are imported as top-level modules, the same
+way license_server.py imports them when started from that directory.
+"""
+
+import os
+import sys
+import tempfile
+import importlib.util
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'server'))
+
+# Keep the import-time data directory out of the working tree
+os.environ.setdefault('ES_DATA_DIR', tempfile.mkdtemp(prefix='examshield-test-'))
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def store(request, tmp_path):
+    """A fresh license store for each backend"""
+    from storage import open_store
+    s = open_store(str(tmp_path), request.param)
+    yield s
+    s.close()
+
+
+@pytest.fixture
+def client(store, tmp_path, monkeypatch):
+    """Flask test client serving from a fresh store"""
+    import license_server
+    import stats
+    import analytics
+    import webhooks
+    monkeypatch.setattr(license_server, 'store', store)
+    monkeypatch.setattr(license_server, 'license_stats', stats.LicenseStats(str(tmp_path / 'stats.json'), reconcile_interval=0).attach(store))
+    monkeypatch.setattr(license_server, 'license_analytics', analytics.Analytics(str(tmp_path / 'analytics.json')).attach(store))
+    monkeypatch.setattr(license_server, 'seen_webhooks', webhooks.SeenEvents(str(tmp_path / 'webhooks' / 'seen')))
+    webhook_queue = webhooks.EventQueue(str(tmp_path / 'webhooks'), license_server.process_payment_event, workers=2)
+    webhook_queue.start = lambda: None  # Tests process events with drain()
+    monkeypatch.setattr(license_server, 'webhook_queue', webhook_queue)
+    license_server.app.config['TESTING'] = True
+    with license_server.app.test_client() as c:
+        yield c
+
+
+@pytest.fixture
+def client_module(tmp_path, monkeypatch):
+    """A fresh copy of client/license.py keeping its files in tmp_path"""
+    spec = importlib.util.spec_from_file_location('client_license', os.path.join(ROOT, 'client', 'license.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, 'LICENSE_FILE', str(tmp_path / 'license.json'))
+    monkeypatch.setattr(module, 'TRIAL_FILE', str(tmp_path / 'trial.json'))
+    monkeypatch.setattr(module, 'DEVICE_FILE', str(tmp_path / 'device.json'))
+    monkeypatch.setattr(module, 'get_device_fingerprint', lambda: 'fp-1')
+    return module
+
+
+@pytest.fixture
+def events_module():
+    """examshield_events.py, which the daemon keeps free of pyudev/telegram imports"""
+    spec = importlib.util.spec_from_file_location('examshield_events', os.path.join(ROOT, 'examshield_events.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
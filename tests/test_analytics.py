@@ -0,0 +1,102 @@
+"""
+Tests for the day/week/month activity rollups.
+"""
+
+from datetime import date
+
+import pytest
+
+from analytics import Analytics, bucket_key, bucket_range, entry_events
+
+SECRET = 'admin-secret-change-me'
+
+
+@pytest.fixture
+def analytics(store, tmp_path):
+    return Analytics(str(tmp_path / 'analytics.json')).attach(store)
+
+
+def test_bucket_keys_and_ranges():
+    day = date(2026, 1, 1)
+    assert bucket_key('day', day) == '2026-01-01'
+    assert bucket_key('week', day) == '2026-W01'
+    assert bucket_key('month', day) == '2026-01'
+    assert bucket_key('week', date(2027, 1, 1)) == '2026-W53'
+
+    assert bucket_range('day', date(2026, 1, 30), date(2026, 2, 2)) == [
+        '2026-01-30', '2026-01-31', '2026-02-01', '2026-02-02']
+    assert bucket_range('week', date(2026, 1, 1), date(2026, 1, 19)) == ['2026-W01', '2026-W02', '2026-W03', '2026-W04']
+    assert bucket_range('month', date(2025, 11, 30), date(2026, 2, 1)) == ['2025-11', '2025-12', '2026-01', '2026-02']
+
+
+def test_entry_events():
+    created = {'key': 'ES-1', 'created': '2026-01-01T10:00:00'}
+    assert entry_events(None, created) == [('registrations', '2026-01-01T10:00:00', 1)]
+
+    activated = dict(created, activated='2026-01-05T09:00:00', payment_amount=49.5)
+    assert entry_events(created, activated) == [
+        ('activations', '2026-01-05T09:00:00', 1), ('revenue', '2026-01-05T09:00:00', 49.5)]
+    # Saving the entry again without changes is not a new event
+    assert entry_events(activated, dict(activated)) == []
+
+    revoked = dict(activated, revoked='2026-02-01T00:00:00')
+    assert entry_events(activated, revoked) == [('revocations', '2026-02-01T00:00:00', 1)]
+    assert entry_events(revoked, None) == []
+
+
+def test_series_counts_changes_and_zero_fills(store, analytics):
+    store.put({'key': 'ES-1', 'created': '2026-01-01T10:00:00'})
+    store.put({'key': 'ES-2', 'created': '2026-01-03T10:00:00', 'trial_started': '2026-01-03T10:00:00'})
+    store.put({'key': 'ES-1', 'created': '2026-01-01T10:00:00', 'activated': '2026-01-03T12:00:00',
+               'payment_amount': 99.99})
+
+    result = analytics.series('day', date(2026, 1, 1), date(2026, 1, 3))
+    assert result['period'] == 'day'
+    assert result['backfilled'] is False
+    assert result['series'] == [
+        {'bucket': '2026-01-01', 'registrations': 1, 'activations': 0, 'trials': 0, 'revocations': 0, 'revenue': 0},
+        {'bucket': '2026-01-02', 'registrations': 0, 'activations': 0, 'trials': 0, 'revocations': 0, 'revenue': 0},
+        {'bucket': '2026-01-03', 'registrations': 1, 'activations': 1, 'trials': 1, 'revocations': 0, 'revenue': 99.99},
+    ]
+    month = analytics.series('month', date(2026, 1, 1), date(2026, 1, 31))['series']
+    assert month == [{'bucket': '2026-01', 'registrations': 2, 'activations': 1, 'trials': 1,
+                      'revocations': 0, 'revenue': 99.99}]
+
+    assert len(analytics.series('day')['series']) == 30
+    assert len(analytics.series('week')['series']) == 12
+    assert len(analytics.series('month')['series']) == 12
+    with pytest.raises(ValueError):
+        analytics.series('year')
+    with pytest.raises(ValueError):
+        analytics.series('day', date(2026, 2, 1), date(2026, 1, 1))
+
+
+def test_backfill_runs_once(store, tmp_path):
+    store.put({'key': 'ES-1', 'created': '2026-01-01T10:00:00', 'activated': '2026-01-02T10:00:00',
+               'payment_amount': 10})
+    store.put({'key': 'ES-2', 'created': '2026-01-01T11:00:00'})
+    analytics = Analytics(str(tmp_path / 'analytics.json'))
+
+    assert analytics.backfill(store.items()) == 2
+    assert analytics.backfill(store.items()) is None
+    result = analytics.series('month', date(2026, 1, 1), date(2026, 1, 1))
+    assert result['backfilled'] is True
+    assert result['series'][0]['registrations'] == 2
+    assert result['series'][0]['revenue'] == 10
+
+    # A forced rebuild starts from scratch rather than adding on top
+    assert analytics.backfill(store.items(), force=True) == 2
+    assert analytics.series('month', date(2026, 1, 1), date(2026, 1, 1))['series'][0]['registrations'] == 2
+
+
+def test_analytics_endpoint(client):
+    client.post('/register', json={'email': 'a@example.com', 'name': 'A'})
+
+    assert client.get('/admin/analytics?secret=wrong').status_code == 401
+    assert client.get(f'/admin/analytics?secret={SECRET}&period=year').status_code == 400
+    assert client.get(f'/admin/analytics?secret={SECRET}&from=yesterday').status_code == 400
+
+    today = date.today().isoformat()
+    response = client.get(f'/admin/analytics?secret={SECRET}&from={today}&to={today}')
+    assert response.status_code == 200
+    assert response.get_json()['series'][0]['registrations'] == 1
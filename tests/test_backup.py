@@ -0,0 +1,62 @@
+"""
+Tests for the change journal, snapshots, retention and restore.
+"""
+
+import os
+from datetime import datetime, timedelta
+
+from backup import BackupManager
+
+
+def entry(key, **extra):
+    e = {'key': key, 'email': f'{key.lower()}@example.com', 'active': False, 'devices': []}
+    e.update(extra)
+    return e
+
+
+def test_journal_and_restore(store, tmp_path):
+    backups = BackupManager(str(tmp_path / 'backups')).attach(store)
+    store.put(entry('ES-1'))  # first change triggers the baseline snapshot
+    store.put(entry('ES-2'))
+    store.put(entry('ES-1', active=True))
+    store.delete('ES-2')
+
+    assert len(backups.list_snapshots()) == 1
+    restored = backups.restore()
+    assert restored == dict(store.items())
+    assert restored['ES-1']['active'] is True
+
+
+def test_snapshots_are_deduplicated(store, tmp_path):
+    backups = BackupManager(str(tmp_path / 'backups'), snapshot_interval=0).attach(store)
+    store.put(entry('ES-1'))
+    assert backups.snapshot() is None  # nothing changed since the automatic snapshot
+    store.put(entry('ES-1'))  # same content again
+    assert len(backups.list_snapshots()) == 1
+
+
+def test_restore_until(store, tmp_path):
+    backups = BackupManager(str(tmp_path / 'backups')).attach(store)
+    store.put(entry('ES-1'))
+    store.put(entry('ES-2'))
+    cutoff = datetime.now()
+    store.put(entry('ES-3'))
+
+    # Journal timestamps are taken on write, so replay up to the cutoff excludes ES-3
+    restored = backups.restore(until=cutoff)
+    assert set(restored) == {'ES-1', 'ES-2'}
+
+
+def test_retention_keeps_hourly_daily_weekly(tmp_path):
+    backups = BackupManager(str(tmp_path / 'backups'), keep_hourly=2, keep_daily=2, keep_weekly=2)
+    start = datetime(2026, 1, 1, 12, 0, 0)
+    for i in range(60):
+        created = start + timedelta(hours=6 * i)
+        name = f"snapshot_{created.strftime('%Y%m%d_%H%M%S')}_{i}_{i:016x}.json"
+        with open(os.path.join(backups.snapshot_dir, name), 'w') as f:
+            f.write('{"seq": %d, "licenses": {}}' % i)
+
+    backups.prune()
+    kept = [s['seq'] for s in backups.list_snapshots()]
+    # hourly: Jan 16 06:00, 00:00; daily: Jan 16, Jan 15 18:00; weekly: ISO weeks 3 and 2 (Jan 11 18:00)
+    assert kept == [59, 58, 57, 41]
@@ -0,0 +1,88 @@
+"""
+Tests for the client's pooled license server API (retries, circuit breaker).
+"""
+
+import pytest
+import requests
+
+from test_client_cache import FakeResponse
+
+
+class FlakyServer:
+    """Answers with each of `outcomes` in turn, repeating the last one"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.urls = []
+
+    def post(self, url, json=None, timeout=None):
+        self.urls.append(url)
+        outcome = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def make_api(client_module, server, **kwargs):
+    api = client_module.LicenseAPI('https://license.example.com/', backoff_base=0, **kwargs)
+    api.session = server
+    return api
+
+
+def test_endpoints_share_one_base_url(client_module):
+    api = client_module.LicenseAPI('https://license.example.com/')
+    assert api.url('verify') == 'https://license.example.com/verify'
+    assert api.url('/check-trial-eligibility') == 'https://license.example.com/check-trial-eligibility'
+    assert client_module.api.url('verify') == client_module.VERIFY_URL
+
+
+def test_transient_failures_are_retried(client_module):
+    ok = FakeResponse(200, {'valid': True})
+    server = FlakyServer(requests.exceptions.ConnectionError(), FakeResponse(503, {}), ok)
+    api = make_api(client_module, server, retries=2)
+    assert api.post('verify', {'key': 'ES-1'}) is ok
+    assert len(server.urls) == 3
+
+    # Answers from the server itself are not retried
+    server = FlakyServer(FakeResponse(403, {'valid': False}))
+    api = make_api(client_module, server, retries=2)
+    assert api.post('verify', {'key': 'ES-1'}).status_code == 403
+    assert len(server.urls) == 1
+
+
+def test_backoff_is_jittered_and_capped(client_module):
+    api = client_module.LicenseAPI('http://x', backoff_base=1, backoff_max=4)
+    delays = [api.backoff(attempt) for attempt in range(10) for _ in range(20)]
+    assert all(0 <= delay <= 4 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_circuit_opens_after_repeated_failures(client_module, monkeypatch):
+    server = FlakyServer(requests.exceptions.ConnectionError())
+    api = make_api(client_module, server, retries=1, failure_threshold=2, reset_after=30)
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            api.post('verify', {})
+    assert api.circuit_open and len(server.urls) == 4
+
+    with pytest.raises(client_module.CircuitOpenError):
+        api.post('verify', {})
+    assert len(server.urls) == 4
+
+    # After the reset period one trial call goes through and closes it again
+    now = client_module.time.monotonic()
+    monkeypatch.setattr(client_module.time, 'monotonic', lambda: now + 31)
+    server.outcomes = [FakeResponse(200, {'valid': True})]
+    assert api.post('verify', {}).status_code == 200
+    assert not api.circuit_open
+
+
+def test_open_circuit_reads_as_unreachable(client_module, monkeypatch):
+    server = FlakyServer(requests.exceptions.ConnectionError())
+    api = make_api(client_module, server, retries=0, failure_threshold=1)
+    monkeypatch.setattr(client_module, 'api', api)
+    client_module.verify_key_online('ES-1')
+    success, message, _ = client_module.verify_key_online('ES-1')
+    assert not success and 'Cannot connect' in message
+    assert len(server.urls) == 1
+    assert client_module.check_trial_eligibility('a@example.com') is True
@@ -0,0 +1,110 @@
+"""
+Tests for the client-side verification cache (TTL, stale-while-revalidate, grace).
+"""
+
+import json
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+
+
+class FakeResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self._data = data
+        self.content = json.dumps(data).encode()
+
+    def json(self):
+        return self._data
+
+
+class FakeServer:
+    """Stands in for the client's HTTP session against /verify"""
+
+    def __init__(self):
+        self.calls = 0
+        self.response = FakeResponse(200, {'valid': True, 'cache_ttl': 600, 'device_limit': 2})
+
+    def post(self, url, json=None, timeout=None):
+        self.calls += 1
+        if isinstance(self.response, Exception):
+            raise self.response
+        return self.response
+
+
+@pytest.fixture
+def server(client_module, monkeypatch):
+    fake = FakeServer()
+    monkeypatch.setattr(client_module.api, 'session', fake)
+    monkeypatch.setattr(client_module.api, 'backoff_base', 0)
+    return fake
+
+
+def verified(client_module, ago, ttl=600):
+    """license.json as left by a successful verification `ago` seconds back"""
+    at = datetime.now() - timedelta(seconds=ago)
+    client_module.save_license({
+        'key': 'ES-1', 'active': True, 'verified': at.isoformat(),
+        'fresh_until': (at + timedelta(seconds=ttl)).isoformat(), 'devices_registered': 1,
+    })
+
+
+def test_online_verification_honors_server_ttl(client_module, server):
+    client_module.save_license({'key': 'ES-1', 'verified': True})  # as written by the installer
+    assert client_module.status()['status'] == 'active'
+    data = client_module.load_license()
+    ttl = (datetime.fromisoformat(data['fresh_until']) - datetime.fromisoformat(data['verified'])).total_seconds()
+    assert 480 <= ttl <= 600  # jittered down by at most 20%
+    assert client_module.status()['status'] == 'active'
+    assert server.calls == 1
+
+
+def test_stale_result_is_served_and_refreshed_in_background(client_module, server):
+    verified(client_module, ago=3600)
+    assert client_module.cache_state(client_module.load_license()) == 'stale'
+    assert client_module.status()['status'] == 'active'
+    client_module._refresh_thread.join()
+    assert server.calls == 1
+    assert client_module.cache_state(client_module.load_license()) == 'fresh'
+
+
+def test_background_rejection_is_remembered(client_module, server):
+    verified(client_module, ago=3600)
+    server.response = FakeResponse(403, {'valid': False, 'error': 'License expired'})
+    assert client_module.status()['status'] == 'active'
+    client_module._refresh_thread.join()
+    result = client_module.status()
+    assert result['status'] == 'invalid' and result['message'] == 'License expired'
+
+
+def test_unreachable_server_within_grace(client_module, server):
+    verified(client_module, ago=86400)
+    server.response = requests.exceptions.ConnectionError()
+    assert client_module.status()['status'] == 'active'
+    client_module._refresh_thread.join()
+    assert client_module.status()['status'] == 'active'
+
+
+def test_unreachable_server_after_grace(client_module, server):
+    verified(client_module, ago=client_module.VERIFY_GRACE + 60)
+    server.response = requests.exceptions.ConnectionError()
+    result = client_module.status()
+    assert result['status'] == 'invalid'
+    assert 'Cannot connect' in result['message']
+
+
+def test_future_verification_time_is_not_trusted(client_module):
+    at = datetime.now() + timedelta(days=30)
+    data = {'key': 'ES-1', 'active': True, 'verified': at.isoformat(), 'fresh_until': (at + timedelta(days=1)).isoformat()}
+    assert client_module.cache_state(data) is None
+
+
+def test_verify_sends_cache_ttl(client):
+    import license_server
+    key = client.post('/register', json={'email': 'c@example.com', 'name': 'C'}).get_json()['license_key']
+    entry = license_server.store.get(key)
+    entry.update(active=True, expires=(datetime.now() + timedelta(days=30)).isoformat())
+    license_server.store.put(entry)
+    data = client.post('/verify', json={'key': key, 'device_fingerprint': 'fp-1'}).get_json()
+    assert data['cache_ttl'] == license_server.VERIFY_CACHE_TTL
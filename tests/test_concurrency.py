@@ -0,0 +1,125 @@
+"""
+Concurrency tests: concurrent device registrations must never lose a write,
+whether they come from threads or from separate worker processes.
+"""
+
+import json
+import multiprocessing
+import os
+import threading
+
+import pytest
+
+from storage import open_store
+
+
+def make_org_license(store):
+    store.put({
+        'key': 'ES-ORG',
+        'email': 'org@example.com',
+        'active': True,
+        'expires': None,
+        'device_limit': 999999,
+        'devices': [],
+    })
+
+
+def test_threaded_verifies_keep_every_device(client, store):
+    make_org_license(store)
+    errors = []
+
+    def worker(n):
+        for i in range(10):
+            r = client.application.test_client().post(
+                '/verify', json={'key': 'ES-ORG', 'device_fingerprint': f'fp-{n}-{i}'})
+            if r.status_code != 200:
+                errors.append(r.status_code)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert len(store.get('ES-ORG')['devices']) == 80
+
+
+def _add_devices(data_dir, backend, worker, count):
+    store = open_store(data_dir, backend)
+    for i in range(count):
+        with store.lock('ES-ORG'):
+            entry = store.get('ES-ORG')
+            entry['devices'].append(f'fp-{worker}-{i}')
+            store.put(entry)
+    store.close()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_worker_processes_share_data_dir(tmp_path, backend):
+    data_dir = str(tmp_path)
+    store = open_store(data_dir, backend)
+    make_org_license(store)
+    store.close()
+
+    ctx = multiprocessing.get_context('fork')
+    procs = [ctx.Process(target=_add_devices, args=(data_dir, backend, w, 15)) for w in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+        assert p.exitcode == 0
+
+    store = open_store(data_dir, backend)
+    assert len(store.get('ES-ORG')['devices']) == 60
+    store.close()
+
+
+def test_json_writes_are_atomic(tmp_path):
+    store = open_store(str(tmp_path), 'json')
+    store.put({'key': 'ES-1', 'email': 'a@example.com'})
+    # No temp files left behind, and the file always parses
+    assert [n for n in os.listdir(tmp_path) if n.endswith('.tmp')] == []
+    with open(tmp_path / 'license_db.json') as f:
+        assert 'ES-1' in json.load(f)
+
+
+def test_unparseable_db_is_not_overwritten(tmp_path):
+    store = open_store(str(tmp_path), 'json', cache_check_interval=0)
+    store.put({'key': 'ES-1', 'email': 'a@example.com'})
+    with open(tmp_path / 'license_db.json', 'w') as f:
+        f.write('{"ES-1": {"key": "ES-1", "ema')  # torn write by some other tool
+
+    assert store.put({'key': 'ES-2', 'email': 'b@example.com'}) is False
+    with open(tmp_path / 'license_db.json') as f:
+        assert f.read().endswith('"ema')
+
+
+def _use_inherited_store(store, worker, count):
+    for i in range(count):
+        with store.lock('ES-ORG'):
+            entry = store.get('ES-ORG')
+            entry['devices'].append(f'fp-{worker}-{i}')
+            store.put(entry)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_store_opened_before_fork(tmp_path, backend):
+    # Like gunicorn with preload_app: the master opens the store, workers inherit it
+    store = open_store(str(tmp_path), backend)
+    make_org_license(store)
+    store.get('ES-ORG')
+
+    ctx = multiprocessing.get_context('fork')
+    procs = [ctx.Process(target=_use_inherited_store, args=(store, w, 10)) for w in range(3)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+        assert p.exitcode == 0
+
+    store.refresh()
+    assert len(store.get('ES-ORG')['devices']) == 30
+    store.close()
@@ -0,0 +1,85 @@
+"""
+Tests for the precompiled customer email templates.
+"""
+
+import hmac
+import json
+import hashlib
+
+import pytest
+
+import emails
+from emails import EmailTemplates, parse_accept_language
+
+ACTIVATION = dict(
+    name='Ada', license_key='ES-ABC', device_type='individual',
+    activation_date='January 02, 2026', expiry_date='January 02, 2027',
+    transaction_id='pay_1', amount=99.99, shop_url='https://example.com/shop',
+)
+
+
+def test_activation_parts():
+    subject, text, html = emails.render('activation', **ACTIVATION)
+    assert subject == 'Your ExamShield License is Activated - ES-ABC'
+    assert 'Device Limit: 2 devices\n' in text
+    assert 'Payment Amount: $99.99\n' in text
+    assert text.endswith('https://example.com/shop\n')
+    assert '<strong style="font-family: monospace;">ES-ABC</strong>' in html
+
+
+def test_missing_amount_and_organization():
+    _, text, _ = emails.render('activation', **dict(ACTIVATION, amount=None, device_type='organization'))
+    assert 'Payment Amount: $N/A' in text
+    assert 'License Type: Organization' in text
+    assert 'Device Limit: Unlimited devices' in text
+
+
+def test_html_is_escaped_but_text_is_not():
+    _, text, html = emails.render('activation', **dict(ACTIVATION, name='Bob & <Co>'))
+    assert 'Dear Bob & <Co>,' in text
+    assert 'Bob &amp; &lt;Co&gt;' in html
+
+
+def test_missing_variable_raises():
+    with pytest.raises(Exception):
+        emails.render('trial', name='Ada')
+
+
+def test_locale_fallback(tmp_path):
+    for locale, greeting in (('en', 'Dear'), ('de', 'Hallo')):
+        (tmp_path / locale).mkdir()
+        (tmp_path / locale / 'hello.subject').write_text('Hi {{ name }}\n')
+        (tmp_path / locale / 'hello.txt').write_text(greeting + ' {{ name }}\n')
+    catalog = EmailTemplates(str(tmp_path))
+    assert catalog.locales == ['de', 'en']
+    assert catalog.render('hello', 'de-AT', name='X') == ('Hi X', 'Hallo X\n', None)
+    assert catalog.render('hello', 'fr', name='X')[1] == 'Dear X\n'
+    with pytest.raises(KeyError):
+        catalog.render('missing')
+
+
+def test_parse_accept_language():
+    assert parse_accept_language('fr;q=0.8, de-DE, en;q=0.5') == 'de_DE'
+    assert parse_accept_language('') is None
+    assert parse_accept_language('*') is None
+
+
+def test_webhook_and_trial_send_rendered_emails(client, monkeypatch):
+    import license_server
+    sent = []
+    monkeypatch.setattr(license_server, 'send_email', lambda to, subject, body, html=None: sent.append((to, subject, body, html)) or True)
+
+    key = client.post('/register', json={'email': 'a@example.com', 'name': 'Ada'}).get_json()['license_key']
+    assert client.post('/activate-trial', json={'license_key': key}).status_code == 200
+    assert sent[-1][1] == 'Your ExamShield Free Trial Started'
+
+    payload = json.dumps({'status': 'paid', 'email': 'a@example.com', 'id': 'pay_9', 'amount': 99.99}).encode()
+    signature = hmac.new(license_server.WEBHOOK_SECRET.encode(), payload, hashlib.sha256).hexdigest()
+    resp = client.post('/webhook/payment', data=payload, content_type='application/json',
+                       headers={'X-Webhook-Signature': signature})
+    assert resp.status_code == 202
+    assert license_server.webhook_queue.drain() == 1
+    to, subject, body, html = sent[-1]
+    assert to == 'a@example.com'
+    assert subject == f'Your ExamShield License is Activated - {key}'
+    assert 'Transaction ID: pay_9' in body and html
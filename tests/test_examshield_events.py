@@ -0,0 +1,195 @@
+"""
+Tests for the daemon's USB event queue (coalescing, drops, storm summaries) and
+the Telegram alert dispatcher's rate limiting, driven with a fake clock.
+"""
+
+import pytest
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class Recorder:
+    """Stands in for the daemon's log/alert/block callables"""
+
+    def __init__(self):
+        self.logged = []
+        self.alerts = []
+        self.blocks = 0
+        self.in_exam = False
+
+    def log_event(self, text):
+        self.logged.append(text)
+
+    def send_alert(self, title, details):
+        self.alerts.append((title, details))
+
+    def block_usb(self):
+        self.blocks += 1
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def daemon():
+    return Recorder()
+
+
+@pytest.fixture
+def make_queue(events_module, clock, daemon):
+    def make(**kwargs):
+        return events_module.USBEventQueue(
+            daemon.log_event, daemon.send_alert, daemon.block_usb, lambda: daemon.in_exam,
+            clock=clock, **kwargs)
+    return make
+
+
+def drain(events):
+    while events.process_next(timeout=0):
+        pass
+
+
+# ---------------------------------------------------------------- USB events
+
+def test_repeats_within_window_are_coalesced(make_queue, clock, daemon):
+    events = make_queue()
+    for _ in range(5):
+        events.put('add', 'Kingston', 'DataTraveler', 'S1')
+        clock.now += 0.5
+    drain(events)
+
+    assert daemon.alerts == [('USB ADD', 'Kingston DataTraveler (S1) ×5')]
+    assert events.stats()['coalesced'] == 4
+    assert events.stats()['handled'] == 1
+
+
+def test_repeat_after_window_is_a_new_event(make_queue, clock, daemon):
+    events = make_queue(coalesce_window=5.0)
+    events.put('add', 'Kingston', 'DataTraveler', 'S1')
+    clock.now += 5.0
+    events.put('add', 'Kingston', 'DataTraveler', 'S1')
+    drain(events)
+
+    assert [details for _, details in daemon.alerts] == ['Kingston DataTraveler (S1)'] * 2
+
+
+def test_full_queue_drops_and_blocks_missed_add_in_exam(make_queue, daemon):
+    events = make_queue(maxsize=2)
+    daemon.in_exam = True
+    for serial in ('S1', 'S2', 'S3', 'S4'):
+        assert events.put('add', 'Kingston', 'DataTraveler', serial) == (serial in ('S1', 'S2'))
+    assert events.stats()['dropped'] == 2
+
+    events.process_next(timeout=0)
+    # The handled 'add' blocks, and so does the dropped one
+    assert daemon.blocks == 2
+    drain(events)
+    assert daemon.blocks == 3
+    assert events.stats()['handled'] == 2
+
+
+def test_dropped_add_outside_exam_does_not_block(make_queue, daemon):
+    events = make_queue(maxsize=1)
+    events.put('add', 'Kingston', 'DataTraveler', 'S1')
+    events.put('add', 'Kingston', 'DataTraveler', 'S2')
+    drain(events)
+    assert daemon.blocks == 0
+
+
+def test_storm_is_summarized_after_window(make_queue, clock, daemon):
+    events = make_queue(storm_alerts=3, coalesce_window=5.0)
+    for i in range(10):
+        events.put('add', 'Kingston', 'DataTraveler', f'S{i}')
+    drain(events)
+
+    assert len(daemon.alerts) == 3
+    assert len(daemon.logged) == 10
+
+    clock.now += 5.0
+    events.process_next(timeout=0)
+    assert daemon.alerts[-1] == ('USB Event Storm', '7 more USB events in 5s. Use /logs for details.')
+    events.process_next(timeout=0)
+    assert len(daemon.alerts) == 4
+
+
+# ---------------------------------------------------------------- alerts
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+        self.errors = []
+
+    def send_message(self, chat_id, text, parse_mode=None):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text))
+
+
+class RetryAfter(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Flood control exceeded. Retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+@pytest.fixture
+def bot():
+    return FakeBot()
+
+
+@pytest.fixture
+def dispatcher(events_module, clock, bot):
+    return events_module.AlertDispatcher(lambda pool_size: bot, chats=['A', 'B'],
+                                         chat_interval=1.0, global_interval=0.1,
+                                         clock=clock, sleep=clock.sleep)
+
+
+def test_messages_to_one_chat_are_spaced(dispatcher):
+    assert dispatcher._reserve('A') == 0.0
+    assert dispatcher._reserve('A') == 1.0
+    assert dispatcher._reserve('A') == 2.0
+
+
+def test_other_chats_only_wait_for_global_slot(dispatcher):
+    assert dispatcher._reserve('A') == 0.0
+    assert dispatcher._reserve('B') == pytest.approx(0.1)
+    assert dispatcher._reserve('C') == pytest.approx(0.2)
+
+
+def test_retry_after_only_delays_that_chat(dispatcher):
+    assert dispatcher._reserve('A', delay=30) == 30
+    assert dispatcher._reserve('B') == pytest.approx(0.1)
+    assert dispatcher._reserve('A') == 31
+
+
+def test_deliver_waits_out_flood_control(dispatcher, bot, clock):
+    bot.errors = [RetryAfter(10)]
+    assert dispatcher.deliver('A', 'hello')
+    assert bot.sent == [('A', 'hello')]
+    assert clock.now == 10
+
+
+def test_deliver_gives_up_after_repeated_flood_control(dispatcher, bot, caplog):
+    bot.errors = [RetryAfter(1), RetryAfter(1), RetryAfter(1)]
+    assert not dispatcher.deliver('A', 'hello')
+    assert bot.sent == []
+    assert 'Dropped alert to A' in caplog.text
+
+
+def test_broadcast_queues_for_every_chat_or_default(events_module, dispatcher):
+    assert dispatcher.broadcast('hello') == 2
+    assert [dispatcher.queue.get_nowait() for _ in range(2)] == [('A', 'hello'), ('B', 'hello')]
+
+    lonely = events_module.AlertDispatcher(lambda pool_size: None)
+    assert lonely.broadcast('hello') == 0
+    assert lonely.broadcast('hello', default_chat='D') == 1
@@ -0,0 +1,66 @@
+"""
+Tests for the client's cached, multi-signal device identity.
+"""
+
+import json
+
+import pytest
+
+SIGNALS = {'machine_id': 'm1', 'product_uuid': 'u1', 'mac': 'a1'}
+
+
+@pytest.fixture
+def machine(client_module, monkeypatch):
+    """The real get_device_fingerprint() over a machine whose signals a test can change"""
+    module = client_module
+    monkeypatch.setattr(module, 'get_device_fingerprint', lambda: module.get_device_identity()['fingerprint'])
+    signals = dict(SIGNALS)
+    monkeypatch.setattr(module, 'collect_signals', lambda: dict(signals))
+
+    def boot(**changes):
+        """Start a new process after changing some signals"""
+        signals.update(changes)
+        for name in [name for name, value in signals.items() if value is None]:
+            del signals[name]
+        module._device_identity = None
+        return module.get_device_fingerprint()
+
+    return boot
+
+
+def test_similarity(client_module):
+    assert client_module.similarity(SIGNALS, SIGNALS) == 1.0
+    assert client_module.similarity(SIGNALS, dict(SIGNALS, mac='a2')) == pytest.approx(0.8)
+    assert client_module.similarity(SIGNALS, {'mac': 'a1'}) == pytest.approx(0.2)
+    assert client_module.similarity({}, {}) == 0.0
+    # Missing signals count against the match
+    assert client_module.similarity({'machine_id': 'm1', 'mac': 'a1'}, {'machine_id': 'm1', 'mac': 'a2'}) == pytest.approx(0.4)
+
+
+def test_fingerprint_is_cached_and_survives_drift(client_module, machine):
+    fingerprint = machine()
+    assert client_module.get_device_fingerprint() == fingerprint
+    with open(client_module.DEVICE_FILE) as f:
+        assert json.load(f)['fingerprint'] == fingerprint
+
+    assert machine(mac='a2') == fingerprint
+    assert machine(product_uuid=None) == fingerprint
+    assert client_module.device_signals() == {'machine_id': 'm1', 'mac': 'a2'}
+
+
+def test_copied_identity_is_not_reused(client_module, machine):
+    fingerprint = machine()
+    # device.json carried over to another machine in a disk image
+    assert machine(machine_id='m2', product_uuid='u2') != fingerprint
+
+
+def test_cloned_image_without_product_uuid_is_not_reused(client_module, machine):
+    # Windows, or Linux without root: no product UUID. Clones share the machine-id
+    fingerprint = machine(product_uuid=None)
+    assert machine(mac='a2') != fingerprint
+
+
+def test_existing_install_keeps_its_fingerprint(client_module, machine):
+    legacy = client_module.legacy_fingerprint()
+    client_module.save_license({'key': 'ES-1', 'device_fingerprint': legacy})
+    assert machine() == legacy
@@ -68,7 +68,21 @@ def test_webhook(license_key, email):
     print(f"Status: {response.status_code}")
     data = response.json()
     print(f"Response: {json.dumps(data, indent=2)}")
-    return response.status_code == 200
+    # Accepted (202) and activated by the server's webhook workers shortly after
+    return response.status_code in (200, 202)
+
+def wait_for_activation(license_key, timeout=30):
+    """Poll /license-info until the webhook workers have activated the license"""
+    print(f"\n[TEST] Waiting for {license_key} to be activated...")
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = requests.get(f"{BASE_URL}/license-info", params={"key": license_key})
+        if response.status_code == 200 and response.json().get('active'):
+            print("Activated")
+            return True
+        time.sleep(0.5)
+    print(f"Not active after {timeout}s")
+    return False
 
 def test_device_limit(license_key, device_fps):
     """Test device limit enforcement"""
@@ -130,8 +144,8 @@ def main():
     test_verify(license_key, device_fp1)
     
     # Test 3: Webhook activation
-    test_webhook(license_key, "test@example.com")
-    time.sleep(1)  # Wait for DB update
+    if test_webhook(license_key, "test@example.com"):
+        wait_for_activation(license_key)
     
     # Test 4: Verify (should succeed now)
     print("\n[EXPECTED] Verification should succeed (license activated)")
@@ -0,0 +1,98 @@
+"""
+Tests for the persistent mail queue and the pooled SMTP session.
+"""
+
+import smtplib
+
+import pytest
+
+from mailer import MailQueue, SMTPSession
+
+
+class FakeSMTP:
+    """Records connections and sent messages; can be told to fail"""
+
+    connections = 0
+    sent = []
+    fail_next = 0
+
+    def __init__(self, host, port, timeout=None):
+        FakeSMTP.connections += 1
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def send_message(self, msg):
+        if FakeSMTP.fail_next:
+            FakeSMTP.fail_next -= 1
+            raise smtplib.SMTPException('temporary failure')
+        FakeSMTP.sent.append(msg)
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def queue(tmp_path):
+    FakeSMTP.connections = 0
+    FakeSMTP.sent = []
+    FakeSMTP.fail_next = 0
+    session = SMTPSession('smtp.test', 587, 'u', 'p', factory=FakeSMTP)
+    q = MailQueue(str(tmp_path / 'mail'), session, 'shop@example.com', batch_size=3, max_attempts=3, retry_base=0)
+    q.start = lambda: None  # drive the queue synchronously in tests
+    return q
+
+
+def test_batch_reuses_one_connection(queue):
+    for i in range(7):
+        queue.enqueue(f'user{i}@example.com', 'Subject', 'Body')
+    assert queue.status() == {'queued': 7, 'dead': 0}
+
+    assert queue.drain() == 7
+    assert FakeSMTP.connections == 1
+    assert [m['To'] for m in FakeSMTP.sent] == [f'user{i}@example.com' for i in range(7)]
+    assert queue.status() == {'queued': 0, 'dead': 0}
+
+
+def test_queue_survives_restart(queue, tmp_path):
+    queue.enqueue('a@example.com', 'Subject', 'Body')
+    restarted = MailQueue(str(tmp_path / 'mail'), queue.session, 'shop@example.com')
+    assert restarted.drain() == 1
+
+
+def test_retries_then_dead_letters(queue):
+    queue.enqueue('a@example.com', 'Subject', 'Body')
+    FakeSMTP.fail_next = 1
+    assert queue.drain() == 0  # first attempt fails, retried on the next drain
+    assert queue.drain() == 1
+
+    queue.enqueue('b@example.com', 'Subject', 'Body')
+    FakeSMTP.fail_next = 10
+    for _ in range(3):
+        queue.drain()
+    assert queue.status() == {'queued': 0, 'dead': 1}
+
+    FakeSMTP.fail_next = 0
+    assert queue.requeue_dead() == 1
+    assert queue.drain() == 1
+
+
+def test_backoff_delays_retry(tmp_path):
+    session = SMTPSession('smtp.test', 587, 'u', 'p', factory=FakeSMTP)
+    queue = MailQueue(str(tmp_path / 'mail'), session, 'shop@example.com', retry_base=60)
+    queue.start = lambda: None
+    FakeSMTP.fail_next = 1
+    queue.enqueue('a@example.com', 'Subject', 'Body')
+    queue.drain()
+    assert queue.drain() == 0  # not due for another minute
+    assert queue.status()['queued'] == 1
+
+
+def test_html_part(queue):
+    queue.enqueue('a@example.com', 'Subject', 'Plain', html='<p>Rich</p>')
+    queue.drain()
+    parts = [p.get_content_type() for p in FakeSMTP.sent[0].get_payload()]
+    assert parts == ['text/plain', 'text/html']
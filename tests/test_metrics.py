@@ -0,0 +1,76 @@
+"""
+Tests for request metrics and the Prometheus /metrics endpoint.
+"""
+
+import json
+import os
+
+from flask import Flask
+
+import metrics
+
+
+def test_histograms_are_cumulative():
+    registry = metrics.Registry()
+    for seconds in (0.0005, 0.003, 0.003, 20):
+        registry.observe(metrics.REQUEST_DURATION, ('/verify',), seconds)
+    text = registry.render()
+    assert 'es_http_request_duration_seconds_bucket{endpoint="/verify",le="0.001"} 1' in text
+    assert 'es_http_request_duration_seconds_bucket{endpoint="/verify",le="0.0025"} 1' in text
+    assert 'es_http_request_duration_seconds_bucket{endpoint="/verify",le="0.005"} 3' in text
+    assert 'es_http_request_duration_seconds_bucket{endpoint="/verify",le="10.0"} 3' in text
+    assert 'es_http_request_duration_seconds_bucket{endpoint="/verify",le="+Inf"} 4' in text
+    assert 'es_http_request_duration_seconds_count{endpoint="/verify"} 4' in text
+    assert '# TYPE es_http_request_duration_seconds histogram' in text
+
+
+def test_requests_and_phases_are_attributed_to_endpoints():
+    registry = metrics.Registry()
+    app = Flask(__name__)
+    registry.init_app(app)
+
+    @app.route('/items/<name>')
+    def item(name):
+        with registry.phase('db_load'):
+            pass
+        return ('', 404) if name == 'missing' else 'ok'
+
+    client = app.test_client()
+    client.get('/items/a')
+    client.get('/items/b')
+    client.get('/items/missing')
+    client.get('/nope')
+    with registry.phase('smtp'):
+        pass
+
+    text = registry.render()
+    assert 'es_http_requests_total{endpoint="/items/<name>",method="GET",status="200"} 2' in text
+    assert 'es_http_requests_total{endpoint="/items/<name>",method="GET",status="404"} 1' in text
+    assert 'es_http_requests_total{endpoint="unmatched",method="GET",status="404"} 1' in text
+    assert 'es_phase_duration_seconds_count{endpoint="/items/<name>",phase="db_load"} 3' in text
+    assert 'es_phase_duration_seconds_count{endpoint="background",phase="smtp"} 1' in text
+
+
+def test_processes_are_added_up(tmp_path):
+    registry = metrics.Registry(str(tmp_path))
+    registry.inc(metrics.REQUESTS, ('/verify', 'POST', '200'), 2)
+
+    # Another live worker's last flush, and a dead one's leftover file
+    other = metrics.Registry()
+    other.inc(metrics.REQUESTS, ('/verify', 'POST', '200'), 3)
+    (tmp_path / f'{os.getppid()}.json').write_text(json.dumps(other.snapshot()))
+    (tmp_path / '999999999.json').write_text(json.dumps(other.snapshot()))
+
+    assert 'es_http_requests_total{endpoint="/verify",method="POST",status="200"} 5' in registry.render()
+    assert not (tmp_path / '999999999.json').exists()
+    assert (tmp_path / f'{os.getpid()}.json').exists()
+
+
+def test_metrics_endpoint(client):
+    client.post('/verify', json={'key': 'ES-NOPE', 'device_fingerprint': 'fp'})
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/plain')
+    text = response.get_data(as_text=True)
+    assert 'es_http_requests_total{endpoint="/verify",method="POST",status="404"}' in text
+    assert 'es_http_request_duration_seconds_count{endpoint="/verify"}' in text
@@ -0,0 +1,85 @@
+"""
+Tests for the in-memory HTML page cache.
+"""
+
+import gzip
+
+import pytest
+from flask import Flask
+
+import pages
+
+
+@pytest.fixture
+def page_dir(tmp_path):
+    (tmp_path / 'index.html').write_text('<h1>Hello</h1>' * 200)
+    return tmp_path
+
+
+def serve(cache, headers=None):
+    app = Flask(__name__)
+    app.add_url_rule('/', 'index', lambda: cache.serve('index.html', 'missing'))
+    app.add_url_rule('/gone', 'gone', lambda: cache.serve('gone.html', 'missing'))
+    return app.test_client()
+
+
+def test_serves_compressed_with_validators(page_dir):
+    client = serve(pages.PageCache(str(page_dir)))
+    response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == (page_dir / 'index.html').read_bytes()
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.headers['Cache-Control'] == 'public, max-age=300'
+    assert response.headers['Last-Modified']
+    etag = response.headers['ETag']
+    assert not etag.startswith('W/')
+
+    plain = client.get('/', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.data == (page_dir / 'index.html').read_bytes()
+    assert plain.headers['ETag'] != etag
+
+    if pages.brotli is not None:
+        br = client.get('/', headers={'Accept-Encoding': 'gzip, br'})
+        assert br.headers['Content-Encoding'] == 'br'
+        assert pages.brotli.decompress(br.data) == plain.data
+
+
+def test_conditional_requests(page_dir):
+    client = serve(pages.PageCache(str(page_dir)))
+    first = client.get('/', headers={'Accept-Encoding': 'gzip'})
+
+    again = client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.data == b''
+
+    since = client.get('/', headers={'Accept-Encoding': 'gzip', 'If-Modified-Since': first.headers['Last-Modified']})
+    assert since.status_code == 304
+
+    other = client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': '"something-else"'})
+    assert other.status_code == 200
+
+
+def test_cached_until_restart_unless_dev_mode(page_dir):
+    cached = serve(pages.PageCache(str(page_dir)).preload('index.html'))
+    dev = serve(pages.PageCache(str(page_dir), dev_mode=True))
+    (page_dir / 'index.html').write_text('<h1>Changed</h1>')
+
+    assert cached.get('/', headers={'Accept-Encoding': 'identity'}).data != b'<h1>Changed</h1>'
+    response = dev.get('/')
+    assert response.data == b'<h1>Changed</h1>'
+    assert response.headers['Cache-Control'] == 'no-store'
+    assert 'ETag' not in response.headers
+
+
+def test_missing_page(page_dir):
+    assert serve(pages.PageCache(str(page_dir))).get('/gone').status_code == 404
+    assert serve(pages.PageCache(str(page_dir), dev_mode=True)).get('/gone').status_code == 404
+
+
+def test_server_pages(client):
+    response = client.get('/register-page', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/html')
+    assert client.get('/register-page', headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']}).status_code == 304
@@ -0,0 +1,77 @@
+"""
+Tests for the shared Razorpay client and order cache, run against the local
+Razorpay stub.
+"""
+
+import threading
+
+import pytest
+import requests
+from werkzeug.serving import make_server
+
+import license_server
+import payments
+import razorpay_stub
+
+pytest.importorskip('razorpay')
+
+KEY_ID, KEY_SECRET = 'rzp_test_stub', 'stub-secret'
+
+
+@pytest.fixture(scope='module')
+def stub_url():
+    server = make_server('127.0.0.1', 0, razorpay_stub.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+@pytest.fixture
+def gateway(stub_url, tmp_path):
+    return payments.RazorpayGateway(KEY_ID, KEY_SECRET, str(tmp_path / 'razorpay_orders.json'), api_url=stub_url)
+
+
+def test_orders_are_reused_until_paid(gateway):
+    entry = {'key': 'ES-1'}
+    order = gateway.order_for(entry, 9999)
+    assert gateway.order_for(entry, 9999)['id'] == order['id']
+    assert gateway.client() is gateway.client()
+
+    # A different price or license is a different order
+    assert gateway.order_for(entry, 29999)['id'] != order['id']
+    assert gateway.order_for({'key': 'ES-2'}, 9999)['id'] != order['id']
+
+    # Once the license is activated, a new payment needs a new order
+    paid = gateway.order_for(entry, 9999)
+    entry['activated'] = '2999-01-01T00:00:00'
+    assert gateway.order_for(entry, 9999)['id'] != paid['id']
+
+
+def test_orders_expire(gateway):
+    gateway.order_ttl = 0
+    entry = {'key': 'ES-1'}
+    assert gateway.order_for(entry, 9999)['id'] != gateway.order_for(entry, 9999)['id']
+
+
+def test_checkout_flow_against_stub(client, store, gateway, stub_url, monkeypatch):
+    monkeypatch.setattr(license_server, 'razorpay_gateway', gateway)
+    key = client.post('/register', json={'email': 'rzp@example.com', 'name': 'R'}).get_json()['license_key']
+
+    first = client.post('/create-razorpay-order', json={'license_key': key})
+    assert first.status_code == 200
+    assert first.get_json()['razorpay_key'] == KEY_ID
+    order_id = first.get_json()['order_id']
+    assert client.post('/create-razorpay-order', json={'license_key': key}).get_json()['order_id'] == order_id
+
+    payment_response = requests.post(f"{stub_url}/v1/stub/orders/{order_id}/pay", auth=(KEY_ID, KEY_SECRET)).json()
+    forged = dict(payment_response, razorpay_signature='0' * 64)
+    assert client.post('/verify-payment', json={'provider': 'razorpay', 'license_key': key,
+                                                'payment_response': forged}).status_code == 400
+    assert store.get(key)['active'] is False
+
+    verified = client.post('/verify-payment', json={'provider': 'razorpay', 'license_key': key,
+                                                    'payment_response': payment_response})
+    assert verified.status_code == 200
+    assert store.get(key)['active'] is True
+    assert store.get(key)['transaction_id'] == payment_response['razorpay_payment_id']
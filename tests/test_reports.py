@@ -0,0 +1,140 @@
+"""
+Tests for the paginated admin reports API and streaming exports.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import license_server
+import reports
+from reports import ReportQuery, ReportQueryError
+
+SECRET = 'admin-secret-change-me'
+
+
+def make_entries(n=25):
+    base = datetime(2026, 1, 1)
+    entries = []
+    for i in range(n):
+        entry = {
+            'key': f'ES-{i:03d}',
+            'email': f'user{i % 7}@example.com',
+            'name': f'User {i}',
+            'device_type': 'organization' if i % 5 == 0 else 'individual',
+            'created': (base + timedelta(days=i)).isoformat(),
+            'active': i % 3 == 0,
+            'payment_status': 'completed' if i % 3 == 0 else 'pending',
+            'payment_amount': float(i % 4) * 10 or None,
+            'expires': (base + timedelta(days=400 if i % 2 else -1)).isoformat() if i % 3 == 0 else None,
+        }
+        entries.append(entry)
+    return entries
+
+
+@pytest.fixture
+def items():
+    return [(e['key'], e) for e in make_entries()]
+
+
+@pytest.mark.parametrize('sort', ['created', '-created', 'email', '-payment_amount', 'expires'])
+def test_cursor_pages_cover_every_row_once(items, sort):
+    seen, cursor = [], None
+    while True:
+        result = reports.page(ReportQuery(sort=sort, limit=4, cursor=cursor), items)
+        seen += [row['key'] for row in result['reports']]
+        cursor = result['next_cursor']
+        if cursor is None:
+            break
+    query = ReportQuery(sort=sort)
+    expected = sorted(items, key=lambda item: query.sort_key(item[1]), reverse=sort.startswith('-'))
+    assert seen == [key for key, _ in expected]
+
+
+def test_filters(items):
+    now = datetime(2026, 6, 1)
+    active = reports.page(ReportQuery(statuses=['active'], limit=100), items, now=now)
+    assert {r['status'] for r in active['reports']} == {'active'}
+    expired = reports.page(ReportQuery(statuses=['expired'], limit=100), items, now=now)
+    assert active['matched'] + expired['matched'] == 9
+
+    orgs = reports.page(ReportQuery(device_type='organization'), items)
+    assert [r['key'] for r in orgs['reports']] == ['ES-000', 'ES-005', 'ES-010', 'ES-015', 'ES-020']
+
+    query = ReportQuery.from_args({'from': '2026-01-05', 'to': '2026-01-07'})
+    assert [r['key'] for r in reports.page(query, items)['reports']] == ['ES-004', 'ES-005', 'ES-006']
+
+    assert reports.page(ReportQuery(search='USER 1'), items)['matched'] == 11  # User 1, User 10-19
+
+
+def test_bad_queries():
+    for args in ({'status': 'bogus'}, {'sort': 'password'}, {'from': 'yesterday'}, {'limit': 'x'}, {'cursor': '!!'}):
+        with pytest.raises(ReportQueryError):
+            ReportQuery.from_args(args)
+    cursor = reports.page(ReportQuery(sort='email', limit=1), [('ES-1', {'key': 'ES-1'}), ('ES-2', {'key': 'ES-2'})])['next_cursor']
+    with pytest.raises(ReportQueryError):
+        ReportQuery.from_args({'sort': 'created', 'cursor': cursor})
+
+
+@pytest.mark.parametrize('values', [
+    ['payment_amount', 'abc', 'ES-1'],
+    ['payment_amount', True, 'ES-1'],
+    ['payment_amount', 10.0, None],
+    ['created', None, 'ES-1'],
+    ['created', 5, 'ES-1'],
+    ['created', '2026-01-01', ['ES-1']],
+])
+def test_tampered_cursor_is_rejected(values):
+    with pytest.raises(ReportQueryError):
+        ReportQuery(sort=values[0], cursor=reports.encode_cursor(values))
+
+
+def test_tampered_cursor_is_a_bad_request(client):
+    license_server.store.put(make_entries(1)[0])
+    cursor = reports.encode_cursor(['payment_amount', 'abc', 'ES-000'])
+    assert client.get(f'/admin/reports?secret={SECRET}&sort=payment_amount&cursor={cursor}').status_code == 400
+
+
+def test_reports_endpoint(client):
+    for entry in make_entries(5):
+        license_server.store.put(entry)
+    assert client.get('/admin/reports?secret=wrong').status_code == 401
+    assert client.get(f'/admin/reports?secret={SECRET}&status=nope').status_code == 400
+
+    first = client.get(f'/admin/reports?secret={SECRET}&limit=3&sort=-created').get_json()
+    assert [r['key'] for r in first['reports']] == ['ES-004', 'ES-003', 'ES-002']
+    assert first['stats']['total'] == 5 and first['matched'] == 5
+    second = client.get(f"/admin/reports?secret={SECRET}&limit=3&sort=-created&cursor={first['next_cursor']}").get_json()
+    assert [r['key'] for r in second['reports']] == ['ES-001', 'ES-000']
+    assert second['next_cursor'] is None
+
+
+def test_export_streams_rows(client):
+    for entry in make_entries(6):
+        license_server.store.put(entry)
+    resp = client.get(f'/admin/reports/export?secret={SECRET}&format=ndjson&device_type=individual')
+    assert resp.is_streamed and resp.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert [r['key'] for r in rows] == ['ES-001', 'ES-002', 'ES-003', 'ES-004']
+
+    resp = client.get(f'/admin/reports/export?secret={SECRET}&format=csv')
+    assert 'attachment' in resp.headers['Content-Disposition']
+    rows = list(csv.DictReader(io.StringIO(resp.get_data(as_text=True))))
+    assert len(rows) == 6 and rows[0]['key'] == 'ES-000'
+    assert client.get(f'/admin/reports/export?secret={SECRET}&format=xml').status_code == 400
+
+
+def test_export_is_lazy():
+    pulled = []
+
+    def items():
+        for key, entry in [(e['key'], e) for e in make_entries(10)]:
+            pulled.append(key)
+            yield key, entry
+
+    stream = reports.export_ndjson(ReportQuery().rows(items()))
+    next(stream)
+    assert pulled == ['ES-000']
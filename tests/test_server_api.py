@@ -0,0 +1,138 @@
+"""
+Endpoint tests for the license server, run against every storage backend
+through Flask's test client.
+"""
+
+import hashlib
+import hmac
+import json
+
+import license_server
+
+
+def register(client, email='user@example.com', device_type='individual'):
+    return client.post('/register', json={'email': email, 'name': 'Test User', 'device_type': device_type})
+
+
+def pay(client, email, transaction_id='txn_1', amount=99.99):
+    """Deliver a payment webhook and let the webhook workers process it"""
+    body = json.dumps({'status': 'paid', 'email': email, 'id': transaction_id, 'amount': amount}).encode()
+    signature = hmac.new(license_server.WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    response = client.post('/webhook/payment', data=body, content_type='application/json',
+                           headers={'X-Webhook-Signature': signature})
+    license_server.webhook_queue.drain()
+    return response
+
+
+def test_register_rejects_duplicate_email(client):
+    first = register(client)
+    assert first.status_code == 200
+    key = first.get_json()['license_key']
+
+    dup = register(client, email='USER@example.com')
+    assert dup.status_code == 409
+    assert dup.get_json()['existing_key'] == key
+
+    eligibility = client.post('/check-trial-eligibility', json={'email': 'user@example.com'})
+    assert eligibility.get_json()['eligible'] is False
+
+
+def test_activation_and_device_limit(client):
+    key = register(client).get_json()['license_key']
+
+    pending = client.post('/verify', json={'key': key, 'device_fingerprint': 'fp-1'})
+    assert pending.status_code == 403
+
+    activated = pay(client, 'user@example.com')
+    assert activated.status_code == 202
+    assert activated.get_json()['accepted'] is True
+
+    for fp in ('fp-1', 'fp-2', 'fp-1'):
+        assert client.post('/verify', json={'key': key, 'device_fingerprint': fp}).status_code == 200
+    over = client.post('/verify', json={'key': key, 'device_fingerprint': 'fp-3'})
+    assert over.status_code == 403
+    assert over.get_json()['registered_devices'] == 2
+
+
+def test_payment_activates_one_license_only(client):
+    key = register(client).get_json()['license_key']
+    pay(client, 'user@example.com', transaction_id='txn_1')
+    # A second pending license for the customer, e.g. renewal started before the redelivery
+    second = dict(license_server.store.get(key), key='ES-SECOND', active=False, transaction_id=None)
+    license_server.store.put(second)
+
+    result, status = license_server.process_payment_event({'status': 'paid', 'email': 'user@example.com', 'id': 'txn_1'})
+    assert status == 200 and result['message'] == 'Payment already processed'
+    assert result['license_key'] == key
+    assert license_server.store.get('ES-SECOND')['active'] is False
+
+
+def test_drifted_device_keeps_its_slot(client):
+    key = register(client).get_json()['license_key']
+    pay(client, 'user@example.com')
+    lab_pc = {'machine_id': 'm1', 'product_uuid': 'u1', 'mac': 'a1'}
+    assert client.post('/verify', json={'key': key, 'device_fingerprint': 'fp-1', 'device_signals': lab_pc}).status_code == 200
+    assert client.post('/verify', json={'key': key, 'device_fingerprint': 'fp-2'}).status_code == 200
+
+    # Reinstalled with a new network card: new fingerprint, same machine
+    again = client.post('/verify', json={'key': key, 'device_fingerprint': 'fp-1b',
+                                         'device_signals': dict(lab_pc, mac='a2')})
+    assert again.status_code == 200 and again.get_json()['message'] == 'Device re-identified'
+    entry = license_server.store.get(key)
+    assert entry['devices'] == ['fp-1b', 'fp-2']
+    assert set(entry['device_signals']) == {'fp-1b'}
+
+    # Only the MAC in common is a different machine
+    other = {'machine_id': 'm9', 'product_uuid': 'u9', 'mac': 'a2'}
+    assert client.post('/verify', json={'key': key, 'device_fingerprint': 'fp-3', 'device_signals': other}).status_code == 403
+
+
+def test_disk_image_clones_need_their_own_slots(client):
+    key = register(client).get_json()['license_key']
+    pay(client, 'user@example.com')
+    image = {'machine_id': 'm1', 'mac': 'a1'}  # No product UUID (Windows / not root)
+    assert client.post('/verify', json={'key': key, 'device_fingerprint': 'fp-1', 'device_signals': image}).status_code == 200
+    assert client.post('/verify', json={'key': key, 'device_fingerprint': 'fp-2', 'device_signals': dict(image, mac='a2')}).status_code == 200
+    over = client.post('/verify', json={'key': key, 'device_fingerprint': 'fp-3', 'device_signals': dict(image, mac='a3')})
+    assert over.status_code == 403
+    assert license_server.store.get(key)['devices'] == ['fp-1', 'fp-2']
+
+
+def test_unknown_key(client):
+    assert client.post('/verify', json={'key': 'ES-NOPE', 'device_fingerprint': 'fp'}).status_code == 404
+    assert client.get('/license-info?key=ES-NOPE').status_code == 404
+
+
+def test_verify_batch(client, monkeypatch):
+    lab_key = register(client, 'lab@example.com', 'organization').get_json()['license_key']
+    pay(client, 'lab@example.com', 'txn_lab')
+    small_key = register(client, 'small@example.com').get_json()['license_key']
+    pay(client, 'small@example.com', 'txn_small')
+    pending_key = register(client, 'pending@example.com').get_json()['license_key']
+
+    writes = []
+    put_many = license_server.store.put_many
+    monkeypatch.setattr(license_server.store, 'put_many', lambda entries: writes.append(len(entries)) or put_many(entries))
+
+    items = [{'key': lab_key, 'device_fingerprint': f'pc-{i}'} for i in range(30)]
+    items += [{'key': small_key, 'device_fingerprint': fp} for fp in ('a', 'b', 'c', 'a')]
+    items += [{'key': pending_key, 'device_fingerprint': 'x'}, {'key': 'ES-NOPE', 'device_fingerprint': 'x'}, {'key': lab_key}]
+    data = client.post('/verify/batch', json={'items': items}).get_json()
+
+    statuses = [r['status'] for r in data['results']]
+    assert statuses == [200] * 30 + [200, 200, 403, 200, 403, 404, 400]
+    assert data['results'][33]['message'] == 'Device verified'
+    assert data['registered'] == 32
+    assert writes == [2]  # both licenses committed in one write
+    assert len(license_server.store.get(lab_key)['devices']) == 30
+
+    # Already registered: answered without writing
+    again = client.post('/verify/batch', json={'items': items[:30]}).get_json()
+    assert again['registered'] == 0 and writes == [2]
+
+
+def test_verify_batch_limits(client, monkeypatch):
+    assert client.post('/verify/batch', json={'items': []}).status_code == 400
+    monkeypatch.setattr(license_server, 'VERIFY_BATCH_MAX', 2)
+    items = [{'key': 'ES-1', 'device_fingerprint': 'fp'}] * 3
+    assert client.post('/verify/batch', json={'items': items}).status_code == 413
@@ -0,0 +1,92 @@
+"""
+Tests for the incrementally maintained license counters.
+"""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from stats import LicenseStats
+
+
+def entry(key, active=False, expires=None, amount=None, status='pending'):
+    return {'key': key, 'email': f'{key}@example.com', 'active': active, 'expires': expires,
+            'payment_amount': amount, 'payment_status': status}
+
+
+@pytest.fixture
+def stats(store, tmp_path):
+    return LicenseStats(str(tmp_path / 'stats.json'), reconcile_interval=0).attach(store)
+
+
+def test_counters_follow_mutations(store, stats):
+    next_year = (datetime.now() + timedelta(days=365)).isoformat()
+    store.put(entry('ES-1'))
+    store.put(entry('ES-2'))
+    assert stats.read() == {'total': 2, 'active': 0, 'expired': 0, 'pending': 2, 'revenue': 0.0}
+
+    # Activation
+    store.put(entry('ES-1', active=True, expires=next_year, amount=99.99, status='completed'))
+    assert stats.read() == {'total': 2, 'active': 1, 'expired': 0, 'pending': 1, 'revenue': 99.99}
+
+    # Extend: still one active license, counted under its new expiry day
+    later = (datetime.now() + timedelta(days=730)).isoformat()
+    store.put(entry('ES-1', active=True, expires=later, amount=99.99, status='completed'))
+    assert stats.read()['active'] == 1
+    assert stats._load()['expiring'] == {later[:10]: 1}
+
+    # Revoke and delete
+    store.put(dict(entry('ES-1', expires=later, amount=99.99, status='completed'), revoked=datetime.now().isoformat()))
+    store.delete('ES-2')
+    assert stats.read() == {'total': 1, 'active': 0, 'expired': 0, 'pending': 0, 'revenue': 99.99}
+    assert stats.reconcile() == {}
+
+
+def test_expiry_rollover(store, stats):
+    tomorrow = date.today() + timedelta(days=1)
+    store.put(entry('ES-1', active=True, expires=f'{tomorrow.isoformat()}T12:00:00', status='completed'))
+    store.put(entry('ES-2', active=True, expires=(datetime.now() - timedelta(days=3)).isoformat(), status='completed'))
+    assert stats.read()['active'] == 1 and stats.read()['expired'] == 1
+
+    counters = stats._load()
+    assert stats._roll_over(counters, (tomorrow + timedelta(days=1)).isoformat())
+    assert (counters['active'], counters['expired'], counters['expiring']) == (0, 2, {})
+    # Removing a license that already rolled over takes it out of 'expired'
+    stats._apply(counters, entry('ES-1', active=True, expires=f'{tomorrow.isoformat()}T12:00:00'), -1)
+    assert counters['expired'] == 1
+
+
+def test_reconcile_repairs_drift(store, stats):
+    store.put(entry('ES-1'))
+    store.replace_all({'ES-1': entry('ES-1'), 'ES-9': entry('ES-9', amount=5)})  # restores don't notify
+    assert stats.read()['total'] == 1
+    drift = stats.reconcile()
+    assert drift['total'] == {'stored': 1, 'actual': 2}
+    assert stats.read() == {'total': 2, 'active': 0, 'expired': 0, 'pending': 2, 'revenue': 5.0}
+    assert stats.reconcile() == {}
+
+
+def test_counters_shared_between_instances(store, tmp_path, stats):
+    other = LicenseStats(str(tmp_path / 'stats.json'))
+    store.put(entry('ES-1'))
+    assert other.read()['total'] == 1
+
+
+def test_periodic_reconcile_runs_in_background(store, stats):
+    stats.reconcile_interval = 3600
+    stats.read()
+    stats._reconcile_thread.join()
+    assert stats._load()['reconciled_at'] is not None
+    stats.read()
+    assert not stats._reconcile_thread.is_alive()  # not due again yet
+
+
+def test_public_and_admin_reports_use_counters(client, monkeypatch):
+    import license_server
+    monkeypatch.setenv('PUBLIC_REPORTS_ENABLED', 'true')
+    client.post('/register', json={'email': 'p@example.com', 'name': 'P'})
+    assert client.get('/public/reports').get_json()['total_licenses'] == 1
+    data = client.get('/admin/reports?secret=admin-secret-change-me').get_json()
+    assert data['stats']['pending'] == 1
+    monkeypatch.setattr(license_server.store, 'items', lambda: iter(()))
+    assert client.get('/public/reports').get_json()['total_licenses'] == 1
@@ -0,0 +1,186 @@
+"""
+Tests for the license storage backends and the JSON -> SQLite migrator.
+"""
+
+import json
+import os
+
+from storage import SQLiteLicenseStore, migrate_json_to_sqlite
+
+
+def make_entry(key, email, **extra):
+    entry = {
+        'key': key,
+        'email': email,
+        'name': 'Test',
+        'active': False,
+        'devices': [],
+        'payment_status': 'pending',
+    }
+    entry.update(extra)
+    return entry
+
+
+def test_put_get_delete(store):
+    store.put(make_entry('ES-1', 'a@example.com'))
+    assert store.get('ES-1')['email'] == 'a@example.com'
+    assert store.get('ES-missing') is None
+    assert store.count() == 1
+    assert store.delete('ES-1')
+    assert not store.delete('ES-1')
+    assert store.count() == 0
+
+
+def test_find_by_email_is_case_insensitive_and_ordered(store):
+    store.put(make_entry('ES-1', 'a@example.com'))
+    store.put(make_entry('ES-2', 'b@example.com'))
+    store.put(make_entry('ES-3', 'A@Example.com '))
+    # Updating an entry must not move it behind newer ones
+    store.put(make_entry('ES-1', 'a@example.com', active=True))
+    keys = [e['key'] for e in store.find_by_email('A@EXAMPLE.COM')]
+    assert keys == ['ES-1', 'ES-3']
+    assert store.find_by_email('nobody@example.com') == []
+
+
+def test_find_by_transaction(store):
+    store.put(make_entry('ES-1', 'a@example.com', transaction_id='pay_1'))
+    assert store.find_by_transaction('pay_1')['key'] == 'ES-1'
+    assert store.find_by_transaction('pay_2') is None
+    assert store.find_by_transaction(None) is None
+
+
+def test_items_preserve_insertion_order(store):
+    for i in range(5):
+        store.put(make_entry(f'ES-{i}', f'{i}@example.com'))
+    assert [key for key, entry in store.items()] == [f'ES-{i}' for i in range(5)]
+
+
+def test_migrate_json_to_sqlite(tmp_path):
+    json_path = tmp_path / 'license_db.json'
+    sqlite_path = tmp_path / 'license_db.sqlite3'
+    db = {
+        'ES-1': make_entry('ES-1', 'a@example.com', active=True, transaction_id='pay_1'),
+        'ES-2': {'email': 'b@example.com', 'active': False},  # legacy entry without a key field
+    }
+    json_path.write_text(json.dumps(db))
+
+    assert migrate_json_to_sqlite(str(json_path), str(sqlite_path)) == 2
+
+    store = SQLiteLicenseStore(str(sqlite_path))
+    try:
+        assert store.get('ES-2')['key'] == 'ES-2'
+        assert store.find_by_transaction('pay_1')['key'] == 'ES-1'
+        assert store._conn().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    finally:
+        store.close()
+
+
+def test_open_store_migrates_existing_json(tmp_path):
+    from storage import open_store
+    (tmp_path / 'license_db.json').write_text(json.dumps({'ES-1': make_entry('ES-1', 'a@example.com')}))
+    store = open_store(str(tmp_path), 'sqlite')
+    try:
+        assert os.path.exists(tmp_path / 'license_db.sqlite3')
+        assert store.get('ES-1')['email'] == 'a@example.com'
+    finally:
+        store.close()
+
+
+def test_indexes_follow_email_and_transaction_changes(store):
+    store.put(make_entry('ES-1', 'old@example.com'))
+    store.put(make_entry('ES-1', 'new@example.com', transaction_id='pay_1'))
+    assert store.find_by_email('old@example.com') == []
+    assert store.find_by_email('new@example.com')[0]['key'] == 'ES-1'
+
+    store.put(make_entry('ES-1', 'new@example.com', transaction_id='pay_2'))
+    assert store.find_by_transaction('pay_1') is None
+    assert store.find_by_transaction('pay_2')['key'] == 'ES-1'
+
+
+def test_indexes_rebuilt_on_open(tmp_path):
+    from storage import open_store
+    for backend in ('json', 'sqlite'):
+        data_dir = tmp_path / backend
+        store = open_store(str(data_dir), backend)
+        store.put(make_entry('ES-1', 'a@example.com', devices=['fp-1'], transaction_id='pay_1'))
+        store.close()
+
+        reopened = open_store(str(data_dir), backend)
+        try:
+            assert reopened.find_by_email('a@example.com')[0]['key'] == 'ES-1'
+            assert reopened.find_by_transaction('pay_1')['key'] == 'ES-1'
+        finally:
+            reopened.close()
+
+
+def test_json_cache_hits_and_external_changes(tmp_path):
+    from storage import JSONLicenseStore
+    path = str(tmp_path / 'license_db.json')
+    store = JSONLicenseStore(path, check_interval=0)
+    store.put(make_entry('ES-1', 'a@example.com'))
+    misses = store.cache_misses
+
+    for _ in range(10):
+        store.get('ES-1')
+    assert store.cache_misses == misses  # our own write updated the cache in place
+    assert store.cache_hits >= 10
+
+    # Another process rewrites the file
+    with open(path, 'w') as f:
+        json.dump({'ES-2': make_entry('ES-2', 'b@example.com')}, f)
+    assert store.get('ES-1') is None
+    assert store.find_by_email('b@example.com')[0]['key'] == 'ES-2'
+    assert store.cache_misses == misses + 1
+
+
+def test_json_stores_see_each_others_writes_at_once(tmp_path):
+    from storage import JSONLicenseStore
+    path = str(tmp_path / 'license_db.json')
+    # Two server workers on one data directory, with default settings
+    worker_a, worker_b = JSONLicenseStore(path), JSONLicenseStore(path)
+    assert worker_b.get('ES-1') is None  # Cached before the other worker writes
+
+    worker_a.put(make_entry('ES-1', 'a@example.com'))
+    assert worker_b.get('ES-1')['email'] == 'a@example.com'
+    assert worker_b.find_by_email('a@example.com')[0]['key'] == 'ES-1'
+    worker_b.put(make_entry('ES-2', 'b@example.com'))
+    assert worker_a.find_by_email('b@example.com')[0]['key'] == 'ES-2'
+
+
+def test_json_cache_hands_out_copies(tmp_path):
+    from storage import JSONLicenseStore
+    store = JSONLicenseStore(str(tmp_path / 'license_db.json'))
+    store.put(make_entry('ES-1', 'a@example.com'))
+    entry = store.get('ES-1')
+    entry['devices'].append('fp-1')
+    assert store.get('ES-1')['devices'] == []
+
+
+def test_json_index_is_swapped_not_mutated(tmp_path):
+    from storage import JSONLicenseStore
+    path = str(tmp_path / 'license_db.json')
+    store = JSONLicenseStore(path, check_interval=0)
+    store.put(make_entry('ES-1', 'a@example.com'))
+    index = store.index
+    emails = dict(index.by_email)
+
+    # Our own write and a re-read after another process's write both publish a new
+    # index; one a concurrent lookup already holds stays complete
+    store.put(make_entry('ES-2', 'a@example.com'))
+    with open(path, 'w') as f:
+        json.dump({'ES-3': make_entry('ES-3', 'c@example.com')}, f)
+    assert store.find_by_email('c@example.com')[0]['key'] == 'ES-3'
+    assert store.index is not index
+    assert index.by_email == emails and list(index.by_email['a@example.com']) == ['ES-1']
+
+
+def test_put_many_is_one_write(store):
+    store.put(make_entry('ES-1', 'a@example.com'))
+    changes = []
+    store.add_listener(lambda key, old, new: changes.append((key, old and old['devices'], new['devices'])))
+    assert store.put_many([
+        make_entry('ES-1', 'a@example.com', devices=['fp-1']),
+        make_entry('ES-2', 'b@example.com', devices=['fp-2']),
+    ])
+    assert changes == [('ES-1', [], ['fp-1']), ('ES-2', None, ['fp-2'])]
+    assert [key for key, _ in store.items()] == ['ES-1', 'ES-2']
@@ -0,0 +1,98 @@
+"""
+Tests for signed offline license tokens, server and client side.
+"""
+
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('cryptography')
+
+import tokens
+from tokens import TokenSigner
+
+SEED = '11' * 32
+
+
+@pytest.fixture
+def signer():
+    return TokenSigner.from_hex(SEED, ttl=3600)
+
+
+@pytest.fixture
+def client_license(client_module, signer, tmp_path, monkeypatch):
+    """The client license module, trusting the test signer's public key"""
+    key_file = tmp_path / 'license_public_key.pem'
+    key_file.write_text(signer.public_key_pem())
+    monkeypatch.setattr(client_module, 'TOKEN_PUBLIC_KEY_FILE', str(key_file))
+    return client_module
+
+
+def active_entry(days=365):
+    return {'key': 'ES-1', 'device_limit': 2, 'expires': (datetime.now() + timedelta(days=days)).isoformat()}
+
+
+def test_issue_and_decode(signer):
+    token, exp = signer.issue(active_entry(), 'fp-1')
+    claims = tokens.decode(token, signer.public_key)
+    assert claims['key'] == 'ES-1' and claims['fp'] == 'fp-1' and claims['limit'] == 2
+    assert claims['exp'] == exp and exp - time.time() == pytest.approx(3600, abs=5)
+
+
+def test_token_never_outlives_license(signer):
+    _, exp = signer.issue(active_entry(days=0), 'fp-1')
+    assert exp <= time.time() + 1
+
+
+def test_tampered_token_is_rejected(signer):
+    token, _ = signer.issue(active_entry(), 'fp-1')
+    other = TokenSigner.from_hex('22' * 32)
+    assert tokens.decode(token, other.public_key) is None
+    payload, signature = token.split('.')
+    assert tokens.decode(payload[:-2] + 'AA.' + signature, signer.public_key) is None
+
+
+def test_client_verifies_token(client_license, signer):
+    token, _ = signer.issue(active_entry(), 'fp-1')
+    assert client_license.verify_token(token, 'ES-1', 'fp-1')['limit'] == 2
+    assert client_license.verify_token(token, 'ES-1', 'fp-2') is None
+    assert client_license.verify_token(token, 'ES-2', 'fp-1') is None
+    expired, _ = signer.issue(active_entry(), 'fp-1', now=time.time() - 7200)
+    assert client_license.verify_token(expired, 'ES-1', 'fp-1') is None
+
+
+def test_status_is_offline_while_token_is_fresh(client_license, signer, monkeypatch):
+    signer.ttl = 10 * 86400
+    token, _ = signer.issue(active_entry(), 'fp-1')
+    client_license.save_license({'key': 'ES-1', 'token': token, 'devices_registered': 1})
+    calls = []
+    monkeypatch.setattr(client_license, 'verify_key_online', lambda key: calls.append(key) or (False, 'offline', None))
+    assert client_license.status()['status'] == 'active'
+    assert calls == []
+
+
+def test_status_refreshes_token_near_expiry(client_license, signer, monkeypatch):
+    token, _ = signer.issue(active_entry(), 'fp-1')  # 1 hour left, inside the refresh window
+    client_license.save_license({'key': 'ES-1', 'token': token})
+    calls = []
+    monkeypatch.setattr(client_license, 'verify_key_online', lambda key: calls.append(key) or (False, 'Connection timeout', None))
+    # Answered from the token while it is refreshed in the background
+    assert client_license.status()['status'] == 'active'
+    client_license._refresh_thread.join()
+    assert calls == ['ES-1']
+
+
+def test_verify_returns_token(client, signer, monkeypatch):
+    import license_server
+    monkeypatch.setattr(license_server, 'token_signer', signer)
+    key = client.post('/register', json={'email': 't@example.com', 'name': 'T'}).get_json()['license_key']
+    entry = license_server.store.get(key)
+    entry.update(active=True, expires=(datetime.now() + timedelta(days=30)).isoformat())
+    license_server.store.put(entry)
+
+    for _ in range(2):  # new device, then already-registered device
+        data = client.post('/verify', json={'key': key, 'device_fingerprint': 'fp-9'}).get_json()
+        claims = tokens.decode(data['token'], signer.public_key)
+        assert claims['key'] == key and claims['fp'] == 'fp-9'
+        assert claims['exp'] == data['token_expires']
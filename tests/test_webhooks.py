@@ -0,0 +1,132 @@
+"""
+Tests for payment webhook idempotency.
+"""
+
+import license_server
+from test_server_api import pay, register
+from webhooks import EventQueue, SeenEvents, event_id
+
+
+def test_event_id():
+    assert event_id({'event_id': 'evt_1', 'id': 'pay_1'}) == 'event:evt_1'
+    assert event_id({'id': 'pay_1'}, {'X-Razorpay-Event-Id': 'evt_2'}) == 'event:evt_2'
+    assert event_id({'status': 'paid', 'id': 'pay_1'}) == 'txn:paid:pay_1'
+    assert event_id({'event': 'payment.captured', 'payment_id': 'pay_1'}) != \
+        event_id({'event': 'payment.authorized', 'payment_id': 'pay_1'})
+    assert event_id({'status': 'paid', 'email': 'a@example.com'}) is None
+
+
+def test_seen_events_expire(tmp_path):
+    seen = SeenEvents(str(tmp_path / 'seen'), ttl=60)
+    assert seen.get('event:1') is None
+    seen.put('event:1', 200, '{"ok": true}')
+    assert seen.get('event:1') == (200, '{"ok": true}')
+    assert seen.purge() == 0
+
+    seen.ttl = -1
+    seen.put('event:2', 200, '{}')
+    assert seen.get('event:2') is None
+    assert seen.purge() == 1
+    assert seen.count() == 1
+
+
+def test_expired_events_are_swept_by_the_dispatcher_not_on_put(tmp_path):
+    seen = SeenEvents(str(tmp_path / 'webhooks' / 'seen'), ttl=-1, sweep_interval=3600)
+    seen.put('event:1', 200, '{}')
+    seen.put('event:2', 200, '{}')
+    assert seen.count() == 2
+
+    queue = EventQueue(str(tmp_path / 'webhooks'), lambda data: ({}, 200), seen=seen)
+    queue.maintain()
+    assert seen.count() == 0
+    # At most once per sweep_interval
+    seen.put('event:3', 200, '{}')
+    queue.maintain()
+    assert seen.count() == 1
+
+
+def test_duplicate_delivery_replays_original_response(client, store, monkeypatch):
+    first_key = register(client, 'dup@example.com').get_json()['license_key']
+    first = pay(client, 'dup@example.com', 'txn_dup')
+    assert first.status_code == 202
+    assert store.get(first_key)['active'] is True
+
+    # A second pending license for the same email must not be activated by the retry
+    entry = store.get(first_key)
+    store.put({**entry, 'key': 'ES-SECOND', 'active': False, 'activated': None, 'payment_status': 'pending'})
+
+    def no_store_access(*args, **kwargs):
+        raise AssertionError('duplicate webhook reached the license store')
+    monkeypatch.setattr(store, 'find_by_email', no_store_access)
+    monkeypatch.setattr(store, 'lock_email', no_store_access)
+
+    again = pay(client, 'dup@example.com', 'txn_dup')
+    assert again.status_code == first.status_code
+    assert again.data == first.data
+    assert again.headers['X-Webhook-Replayed'] == 'true'
+    assert store.get('ES-SECOND')['active'] is False
+    assert license_server.webhook_queue.status()['queued'] == 0
+
+
+def test_new_transaction_is_processed(client, store):
+    key = register(client, 'new@example.com').get_json()['license_key']
+    pay(client, 'new@example.com', 'txn_a')
+    other = pay(client, 'new@example.com', 'txn_b')
+    assert 'X-Webhook-Replayed' not in other.headers
+    assert store.get(key)['transaction_id'] == 'txn_a'
+    assert license_server.seen_webhooks.count() == 2
+    assert license_server.webhook_queue.status() == {'queued': 0, 'dead': 0, 'oldest_age': 0, 'workers': 2}
+
+
+def test_webhook_acknowledges_before_processing(client, monkeypatch):
+    register(client, 'later@example.com')
+    response = client.post('/webhook/payment', json={'status': 'paid', 'email': 'later@example.com'},
+                           headers={'X-Webhook-Signature': 'bad'})
+    assert response.status_code == 401
+    assert license_server.webhook_queue.status()['queued'] == 0
+
+    monkeypatch.setattr(license_server, 'WEBHOOK_SECRET', '')
+    response = client.post('/webhook/payment', json={'status': 'paid', 'email': 'later@example.com'})
+    assert response.status_code == 202
+    assert license_server.webhook_queue.status()['queued'] == 1
+    assert license_server.webhook_queue.drain() == 1
+    assert client.get('/admin/webhooks?secret=admin-secret-change-me').get_json()['queued'] == 0
+
+
+def test_queue_keeps_per_email_order_across_retries(tmp_path):
+    calls = []
+    failures = {'a-2': 1}
+
+    def handler(data):
+        calls.append(data['id'])
+        if failures.get(data['id']):
+            failures[data['id']] -= 1
+            return {'error': 'store unavailable'}, 503
+        if data['id'] == 'b-bad':
+            return {'error': 'Customer email not found in webhook'}, 400
+        return {'message': 'ok'}, 200
+
+    queue = EventQueue(str(tmp_path / 'webhooks'), handler, workers=3, retry_base=60)
+    queue.start = lambda: None
+    for event_id_, email in [('a-1', 'a@x'), ('a-2', 'a@x'), ('b-bad', 'b@x'), ('a-3', 'a@x'), ('b-2', 'b@x')]:
+        queue.enqueue(event_id_, {'id': event_id_, 'email': email})
+    assert queue.status()['queued'] == 5
+
+    assert queue.drain() == 3
+    # a-3 waits behind a-2's retry; b-bad is kept as a dead event without blocking b-2
+    assert [c for c in calls if c.startswith('a')] == ['a-1', 'a-2']
+    assert [c for c in calls if c.startswith('b')] == ['b-bad', 'b-2']
+    assert queue.status()['queued'] == 2
+    assert queue.status()['dead'] == 1
+
+    queue.retry_base = 0
+    for path, message in queue._queued_events():
+        message['next_attempt'] = 0
+        queue._write(path, message)
+    assert queue.drain() == 2
+    assert [c for c in calls if c.startswith('a')] == ['a-1', 'a-2', 'a-2', 'a-3']
+    assert queue.status()['queued'] == 0
+
+    assert queue.requeue_dead() == 1
+    assert queue.status()['queued'] == 1
+    assert queue.status()['dead'] == 0